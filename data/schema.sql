@@ -41,20 +41,132 @@ CREATE TABLE IF NOT EXISTS tbl_Users (
     accountType TEXT NOT NULL CHECK(accountType IN ('ADMIN', 'MEMBER'))
 );
 
+-- tbl_Sessions
+-- stores login sessions, the token itself is never stored, only its sha256 hash
+CREATE TABLE IF NOT EXISTS tbl_Sessions (
+    sessionId INTEGER PRIMARY KEY AUTOINCREMENT,
+    tokenHash CHAR(64) UNIQUE NOT NULL,
+    userId INTEGER NOT NULL,
+    username VARCHAR(50) NOT NULL,
+    accessLevel TEXT NOT NULL CHECK(accessLevel IN ('ADMIN', 'MEMBER')),
+    dateCreated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expiresAt REAL NOT NULL, -- unix timestamp, moved forward whenever the session is used
+    revoked BOOLEAN NOT NULL DEFAULT FALSE,
+    FOREIGN KEY (userId) REFERENCES tbl_Users(userId) ON DELETE CASCADE
+);
+
+-- tbl_AuditEventTypes
+-- the different kinds of network audit log, each with the message template used to display it
+-- {subject} and {target} are replaced with names from tbl_AuditNames when the log is read
+CREATE TABLE IF NOT EXISTS tbl_AuditEventTypes (
+    eventType INTEGER PRIMARY KEY,
+    eventName VARCHAR(50) UNIQUE NOT NULL,
+    template TEXT NOT NULL
+);
+
+-- tbl_AuditNames
+-- every hostname/ssid mentioned in an audit log is stored once here, and the logs just store its nameId
+-- names are never changed once added, so old logs keep showing the name the device had at the time
+CREATE TABLE IF NOT EXISTS tbl_AuditNames (
+    nameId INTEGER PRIMARY KEY,
+    name TEXT UNIQUE NOT NULL
+);
+
 -- tbl_AuditLogs
--- stores log messages for different events in the app
+-- stores the events that happen in the app as an event type plus the ids/names involved
+-- rather than a full sentence, the message is only put together when it is read (vw_AuditLogs)
 CREATE TABLE IF NOT EXISTS tbl_AuditLogs (
     auditLogId INTEGER PRIMARY KEY AUTOINCREMENT,
+    eventType INTEGER NOT NULL,
     accessPointId CHAR(36),
     clientId CHAR(36),
+    broadcastId CHAR(36),
+    subjectNameId INTEGER, -- the device/ssid the event is about
+    targetNameId INTEGER, -- the second device involved, eg the AP a client roamed to
     dateCreated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- https://stackoverflow.com/questions/10720486/date-timestamp-to-record-when-a-record-was-added-to-the-table
-    logMessage TEXT NOT NULL,
+    FOREIGN KEY (eventType) REFERENCES tbl_AuditEventTypes(eventType),
     FOREIGN KEY (accessPointId) REFERENCES tbl_APdevices(accessPointId) ON DELETE SET NULL,
-    FOREIGN KEY (clientId) REFERENCES tbl_Clients(clientId) ON DELETE SET NULL
+    FOREIGN KEY (clientId) REFERENCES tbl_Clients(clientId) ON DELETE SET NULL,
+    FOREIGN KEY (broadcastId) REFERENCES tbl_WifiBroadcasts(broadcastId) ON DELETE SET NULL,
+    FOREIGN KEY (subjectNameId) REFERENCES tbl_AuditNames(nameId),
+    FOREIGN KEY (targetNameId) REFERENCES tbl_AuditNames(nameId)
 );
 
+-- vw_AuditLogs
+-- the audit logs with their message filled in from the template, this is what the dashboard reads
+-- https://www.sqlite.org/lang_createview.html
+CREATE VIEW IF NOT EXISTS vw_AuditLogs AS
+SELECT
+    a.auditLogId,
+    a.eventType,
+    t.eventName,
+    a.accessPointId,
+    a.clientId,
+    a.broadcastId,
+    a.dateCreated,
+    replace(replace(t.template, '{subject}', coalesce(s.name, '')), '{target}', coalesce(tg.name, '')) AS logMessage
+FROM tbl_AuditLogs a
+JOIN tbl_AuditEventTypes t ON t.eventType = a.eventType
+LEFT JOIN tbl_AuditNames s ON s.nameId = a.subjectNameId
+LEFT JOIN tbl_AuditNames tg ON tg.nameId = a.targetNameId;
+
+-- tbl_AuditLogsSearch
+-- full text search index over the audit log messages, https://www.sqlite.org/fts5.html
+-- it is an external content table reading from vw_AuditLogs, so the messages are not stored anywhere, only the index
+CREATE VIRTUAL TABLE IF NOT EXISTS tbl_AuditLogsSearch USING fts5(
+    logMessage,
+    content='vw_AuditLogs',
+    content_rowid='auditLogId'
+);
+
+-- triggers keep the search index in sync with tbl_AuditLogs, including deletes from the data retention service
+-- removing a row from the index needs the exact text that was indexed, so the delete trigger runs BEFORE the row is gone
+-- and renders it again from the view (names and templates never change, so it is always the same text)
+CREATE TRIGGER IF NOT EXISTS trg_AuditLogs_insert AFTER INSERT ON tbl_AuditLogs BEGIN
+    INSERT INTO tbl_AuditLogsSearch (rowid, logMessage)
+    SELECT auditLogId, logMessage FROM vw_AuditLogs WHERE auditLogId = new.auditLogId;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_AuditLogs_delete BEFORE DELETE ON tbl_AuditLogs BEGIN
+    INSERT INTO tbl_AuditLogsSearch (tbl_AuditLogsSearch, rowid, logMessage)
+    SELECT 'delete', auditLogId, logMessage FROM vw_AuditLogs WHERE auditLogId = old.auditLogId;
+END;
+
+-- tbl_RoamEvents
+-- one row every time a client moves from one access point to another, written in bulk by pushConnectionData
+CREATE TABLE IF NOT EXISTS tbl_RoamEvents (
+    roamId INTEGER PRIMARY KEY,
+    clientId CHAR(36) NOT NULL,
+    fromAccessPointId CHAR(36) NOT NULL,
+    toAccessPointId CHAR(36) NOT NULL,
+    dateCreated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- tbl_ClientRoamsHourly and tbl_APRoamsHourly
+-- running totals of roams per client and per access point for each hour, updated as the roams are written
+-- so the roaming reports only have to add up a few rows instead of going through every roam
+-- hour is the start of the hour, eg '2025-01-01 13:00:00'
+-- https://www.sqlite.org/withoutrowid.html, the primary key is all that is ever looked up
+CREATE TABLE IF NOT EXISTS tbl_ClientRoamsHourly (
+    clientId CHAR(36) NOT NULL,
+    hour DATETIME NOT NULL,
+    roams INT NOT NULL DEFAULT 0,
+    pingPongs INT NOT NULL DEFAULT 0, -- roams straight back to the AP the client had just left
+    PRIMARY KEY (clientId, hour)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS tbl_APRoamsHourly (
+    accessPointId CHAR(36) NOT NULL,
+    hour DATETIME NOT NULL,
+    roamsIn INT NOT NULL DEFAULT 0,
+    roamsOut INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (accessPointId, hour)
+) WITHOUT ROWID;
+
 -- tbl_TrafficSamples
 -- stores real-time samples for each access point fetched periodically
+-- a row can also be a run of unchanged samples, sampleCount of them evenly spaced from dateCreated to endDate
+-- (see src/backend/services/sampleRuns.py), a single sample has no endDate
 CREATE TABLE IF NOT EXISTS tbl_TrafficSamples (
     sampleId INTEGER PRIMARY KEY AUTOINCREMENT,
     accessPointId CHAR(36) NOT NULL,
@@ -63,9 +175,35 @@ CREATE TABLE IF NOT EXISTS tbl_TrafficSamples (
     txRateBps INT NOT NULL,
     rxRateBps INT NOT NULL,
     dateCreated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP, -- https://www.sqlitetutorial.net/sqlite-date-functions/sqlite-current_timestamp/
+    endDate DATETIME,
+    sampleCount INT NOT NULL DEFAULT 1,
     FOREIGN KEY (accessPointId) REFERENCES tbl_APdevices(accessPointId) ON DELETE CASCADE
 );
 
+-- tbl_SpoolReplays
+-- the write spool's segment files (src/backend/services/writeSpool.py) that have been written into the database
+-- each one is added in the same transaction as the segment's rows, so a segment is never written twice even if the
+-- app stops before the segment file is deleted
+CREATE TABLE IF NOT EXISTS tbl_SpoolReplays (
+    segment TEXT PRIMARY KEY,
+    dateCreated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- tbl_CollectionRuns
+-- one row for every collection run that had a deadline (src/backend/services/deadline.py), saying whether it got
+-- everything or ran out of time part way. incomplete lists the parts that are only partial, comma separated
+-- (accessPoints, trafficSamples, clients, connections, inactiveClients, wifiBroadcasts), NULL for a complete run
+CREATE TABLE IF NOT EXISTS tbl_CollectionRuns (
+    runId INTEGER PRIMARY KEY AUTOINCREMENT,
+    job TEXT NOT NULL, -- samples, topology, broadcasts or cycle
+    budgetSec FLOAT,
+    elapsedSec FLOAT NOT NULL,
+    complete BOOLEAN NOT NULL,
+    incomplete TEXT,
+    successful BOOLEAN NOT NULL,
+    dateCreated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
 -- tbl_WifiBroadcasts
 -- stores a list of the different wifi broadcasts
 -- useful for when disabling/enabling ssid broadcasting in admin dashboard
@@ -86,7 +224,183 @@ CREATE TABLE IF NOT EXISTS tbl_Settings (
 );
 
 -- index lists for when searching through the data ADD LATER
+CREATE INDEX IF NOT EXISTS idx_Sessions_userId ON tbl_Sessions(userId);
+-- the primary key of tbl_Connections starts with clientId, so looking up an AP's clients needs its own index
+CREATE INDEX IF NOT EXISTS idx_Connections_accessPointId ON tbl_Connections(accessPointId);
+-- the latest sample of each AP, for continuing its run
+CREATE INDEX IF NOT EXISTS idx_TrafficSamples_accessPointId ON tbl_TrafficSamples(accessPointId);
+-- when each sample row ends, so the latest sample time (for tbl_DashboardSummary) is a single lookup
+-- https://www.sqlite.org/expridx.html, queries have to use the exact same expression for it to be used
+CREATE INDEX IF NOT EXISTS idx_TrafficSamples_endDate ON tbl_TrafficSamples(coalesce(endDate, dateCreated));
+-- a client's roams in order (the roamId is stored in the index too), and the hourly totals by time for the reports
+CREATE INDEX IF NOT EXISTS idx_RoamEvents_clientId ON tbl_RoamEvents(clientId);
+CREATE INDEX IF NOT EXISTS idx_RoamEvents_dateCreated ON tbl_RoamEvents(dateCreated);
+CREATE INDEX IF NOT EXISTS idx_ClientRoamsHourly_hour ON tbl_ClientRoamsHourly(hour);
+CREATE INDEX IF NOT EXISTS idx_APRoamsHourly_hour ON tbl_APRoamsHourly(hour);
+-- audit logs are read newest first with keyset pagination on (dateCreated, auditLogId)
+-- auditLogId is the rowid, which sqlite already stores at the end of every index, so these indexes also cover the tie-breaker
+CREATE INDEX IF NOT EXISTS idx_AuditLogs_dateCreated ON tbl_AuditLogs(dateCreated);
+CREATE INDEX IF NOT EXISTS idx_AuditLogs_accessPointId ON tbl_AuditLogs(accessPointId, dateCreated);
+CREATE INDEX IF NOT EXISTS idx_AuditLogs_clientId ON tbl_AuditLogs(clientId, dateCreated);
+-- for counting events of one type over time, eg roams per AP per day
+CREATE INDEX IF NOT EXISTS idx_AuditLogs_eventType ON tbl_AuditLogs(eventType, dateCreated);
+
+-- tbl_DashboardSummary
+-- the counts shown on the overview page, kept up to date by the triggers below as the tables change
+-- so the overview is a single row read instead of counting every table on each refresh
+-- vw_DashboardSummary works the same counts out from scratch, it fills the row in the first time and is what
+-- services/dashboardSummary.py checks the row against
+CREATE TABLE IF NOT EXISTS tbl_DashboardSummary (
+    summaryId INTEGER PRIMARY KEY CHECK(summaryId = 1), -- there is only ever the one row
+    accessPoints INT NOT NULL DEFAULT 0,
+    apsOnline INT NOT NULL DEFAULT 0, -- one column for each apState
+    apsOffline INT NOT NULL DEFAULT 0,
+    apsUpdating INT NOT NULL DEFAULT 0,
+    apsGettingReady INT NOT NULL DEFAULT 0,
+    apsConnectionInterrupted INT NOT NULL DEFAULT 0,
+    clients INT NOT NULL DEFAULT 0,
+    activeClients INT NOT NULL DEFAULT 0,
+    connections INT NOT NULL DEFAULT 0, -- rows in tbl_Connections, for the clients per AP
+    broadcasts INT NOT NULL DEFAULT 0,
+    broadcastsEnabled INT NOT NULL DEFAULT 0,
+    broadcastsHidden INT NOT NULL DEFAULT 0,
+    lastSample DATETIME -- the time of the latest traffic sample, the end of a run
+);
+
+CREATE VIEW IF NOT EXISTS vw_DashboardSummary AS
+SELECT
+    (SELECT COUNT(*) FROM tbl_APdevices) AS accessPoints,
+    (SELECT COUNT(*) FROM tbl_APdevices WHERE apState = 'ONLINE') AS apsOnline,
+    (SELECT COUNT(*) FROM tbl_APdevices WHERE apState = 'OFFLINE') AS apsOffline,
+    (SELECT COUNT(*) FROM tbl_APdevices WHERE apState = 'UPDATING') AS apsUpdating,
+    (SELECT COUNT(*) FROM tbl_APdevices WHERE apState = 'GETTING_READY') AS apsGettingReady,
+    (SELECT COUNT(*) FROM tbl_APdevices WHERE apState = 'CONNECTION_INTERRUPTED') AS apsConnectionInterrupted,
+    (SELECT COUNT(*) FROM tbl_Clients) AS clients,
+    (SELECT COUNT(*) FROM tbl_Clients WHERE active = 1) AS activeClients,
+    (SELECT COUNT(*) FROM tbl_Connections) AS connections,
+    (SELECT COUNT(*) FROM tbl_WifiBroadcasts) AS broadcasts,
+    (SELECT COUNT(*) FROM tbl_WifiBroadcasts WHERE active = 1) AS broadcastsEnabled,
+    (SELECT COUNT(*) FROM tbl_WifiBroadcasts WHERE hideName = 1) AS broadcastsHidden,
+    (SELECT MAX(coalesce(endDate, dateCreated)) FROM tbl_TrafficSamples) AS lastSample;
+
+-- the row is only added once, for a new database or the first time this runs on an existing one
+INSERT OR IGNORE INTO tbl_DashboardSummary (summaryId, accessPoints, apsOnline, apsOffline, apsUpdating, apsGettingReady,
+    apsConnectionInterrupted, clients, activeClients, connections, broadcasts, broadcastsEnabled, broadcastsHidden, lastSample)
+SELECT 1, * FROM vw_DashboardSummary;
+
+-- the triggers add each row that is inserted and take away each row that is deleted, and an update is both
+-- x IS 'y' is 1 or 0 (never NULL like x = 'y' can be), so it can be added straight onto a count
+-- upserts (INSERT ... ON CONFLICT DO UPDATE) fire the update triggers when the row was already there
+CREATE TRIGGER IF NOT EXISTS trg_APdevices_summaryInsert AFTER INSERT ON tbl_APdevices BEGIN
+    UPDATE tbl_DashboardSummary SET
+        accessPoints = accessPoints + 1,
+        apsOnline = apsOnline + (new.apState IS 'ONLINE'),
+        apsOffline = apsOffline + (new.apState IS 'OFFLINE'),
+        apsUpdating = apsUpdating + (new.apState IS 'UPDATING'),
+        apsGettingReady = apsGettingReady + (new.apState IS 'GETTING_READY'),
+        apsConnectionInterrupted = apsConnectionInterrupted + (new.apState IS 'CONNECTION_INTERRUPTED')
+    WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_APdevices_summaryDelete AFTER DELETE ON tbl_APdevices BEGIN
+    UPDATE tbl_DashboardSummary SET
+        accessPoints = accessPoints - 1,
+        apsOnline = apsOnline - (old.apState IS 'ONLINE'),
+        apsOffline = apsOffline - (old.apState IS 'OFFLINE'),
+        apsUpdating = apsUpdating - (old.apState IS 'UPDATING'),
+        apsGettingReady = apsGettingReady - (old.apState IS 'GETTING_READY'),
+        apsConnectionInterrupted = apsConnectionInterrupted - (old.apState IS 'CONNECTION_INTERRUPTED')
+    WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_APdevices_summaryUpdate AFTER UPDATE OF apState ON tbl_APdevices
+WHEN old.apState IS NOT new.apState BEGIN
+    UPDATE tbl_DashboardSummary SET
+        apsOnline = apsOnline + (new.apState IS 'ONLINE') - (old.apState IS 'ONLINE'),
+        apsOffline = apsOffline + (new.apState IS 'OFFLINE') - (old.apState IS 'OFFLINE'),
+        apsUpdating = apsUpdating + (new.apState IS 'UPDATING') - (old.apState IS 'UPDATING'),
+        apsGettingReady = apsGettingReady + (new.apState IS 'GETTING_READY') - (old.apState IS 'GETTING_READY'),
+        apsConnectionInterrupted = apsConnectionInterrupted + (new.apState IS 'CONNECTION_INTERRUPTED') - (old.apState IS 'CONNECTION_INTERRUPTED')
+    WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Clients_summaryInsert AFTER INSERT ON tbl_Clients BEGIN
+    UPDATE tbl_DashboardSummary SET clients = clients + 1, activeClients = activeClients + (new.active IS 1) WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Clients_summaryDelete AFTER DELETE ON tbl_Clients BEGIN
+    UPDATE tbl_DashboardSummary SET clients = clients - 1, activeClients = activeClients - (old.active IS 1) WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Clients_summaryUpdate AFTER UPDATE OF active ON tbl_Clients
+WHEN old.active IS NOT new.active BEGIN
+    UPDATE tbl_DashboardSummary SET activeClients = activeClients + (new.active IS 1) - (old.active IS 1) WHERE summaryId = 1;
+END;
+
+-- updates only ever move a client to another AP, which doesn't change the count
+CREATE TRIGGER IF NOT EXISTS trg_Connections_summaryInsert AFTER INSERT ON tbl_Connections BEGIN
+    UPDATE tbl_DashboardSummary SET connections = connections + 1 WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_Connections_summaryDelete AFTER DELETE ON tbl_Connections BEGIN
+    UPDATE tbl_DashboardSummary SET connections = connections - 1 WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_WifiBroadcasts_summaryInsert AFTER INSERT ON tbl_WifiBroadcasts BEGIN
+    UPDATE tbl_DashboardSummary SET
+        broadcasts = broadcasts + 1,
+        broadcastsEnabled = broadcastsEnabled + (new.active IS 1),
+        broadcastsHidden = broadcastsHidden + (new.hideName IS 1)
+    WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_WifiBroadcasts_summaryDelete AFTER DELETE ON tbl_WifiBroadcasts BEGIN
+    UPDATE tbl_DashboardSummary SET
+        broadcasts = broadcasts - 1,
+        broadcastsEnabled = broadcastsEnabled - (old.active IS 1),
+        broadcastsHidden = broadcastsHidden - (old.hideName IS 1)
+    WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_WifiBroadcasts_summaryUpdate AFTER UPDATE OF active, hideName ON tbl_WifiBroadcasts
+WHEN old.active IS NOT new.active OR old.hideName IS NOT new.hideName BEGIN
+    UPDATE tbl_DashboardSummary SET
+        broadcastsEnabled = broadcastsEnabled + (new.active IS 1) - (old.active IS 1),
+        broadcastsHidden = broadcastsHidden + (new.hideName IS 1) - (old.hideName IS 1)
+    WHERE summaryId = 1;
+END;
+
+-- a new sample only matters if it is later than the latest one. when the latest sample is deleted (a run being written
+-- again as it grows, or everything older than the retention period) the next latest is found with idx_TrafficSamples_endDate
+CREATE TRIGGER IF NOT EXISTS trg_TrafficSamples_summaryInsert AFTER INSERT ON tbl_TrafficSamples
+WHEN coalesce(new.endDate, new.dateCreated) > coalesce((SELECT lastSample FROM tbl_DashboardSummary WHERE summaryId = 1), '') BEGIN
+    UPDATE tbl_DashboardSummary SET lastSample = coalesce(new.endDate, new.dateCreated) WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_TrafficSamples_summaryDelete AFTER DELETE ON tbl_TrafficSamples
+WHEN coalesce(old.endDate, old.dateCreated) >= (SELECT lastSample FROM tbl_DashboardSummary WHERE summaryId = 1) BEGIN
+    UPDATE tbl_DashboardSummary SET lastSample = (SELECT MAX(coalesce(endDate, dateCreated)) FROM tbl_TrafficSamples) WHERE summaryId = 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_TrafficSamples_summaryUpdate AFTER UPDATE OF endDate, dateCreated ON tbl_TrafficSamples BEGIN
+    UPDATE tbl_DashboardSummary SET lastSample = (SELECT MAX(coalesce(endDate, dateCreated)) FROM tbl_TrafficSamples) WHERE summaryId = 1;
+END;
 
 -- default settings
 INSERT OR IGNORE INTO tbl_Settings (settingId, retentionPeriod) 
-VALUES (1, 30);
\ No newline at end of file
+VALUES (1, 30);
+
+-- audit log event types, the codes match auditEventType in src/backend/models/models.py
+INSERT OR IGNORE INTO tbl_AuditEventTypes (eventType, eventName, template) VALUES
+    (0, 'MESSAGE', '{subject}'), -- free text, used for logs moved over from the old format
+    (1, 'AP_ADDED', 'Access point {subject} was added to the network.'),
+    (2, 'AP_UPDATED', 'Access point {subject} was updated.'),
+    (3, 'BROADCAST_ADDED', 'Wifi broadcast {subject} was added to the network.'),
+    (4, 'BROADCAST_UPDATED', 'Wifi broadcast {subject} was updated.'),
+    (5, 'CLIENT_ROAMED', 'Client {subject} roamed to AP {target}.'),
+    (6, 'CLIENT_NEW', 'New client {subject} connected to the network.'),
+    (7, 'CLIENT_RECONNECTED', 'Client {subject} connected to the network again.'),
+    (8, 'CLIENT_DISCONNECTED', 'Client {subject} disconnected from the network.'),
+    (9, 'AP_RESTARTED', 'Access point {subject} was restarted.'),
+    (10, 'SSID_HIDDEN', 'SSID broadcasting for {subject} has been disabled.'),
+    (11, 'SSID_SHOWN', 'SSID broadcasting for {subject} has been enabled.');
\ No newline at end of file
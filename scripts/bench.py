@@ -0,0 +1,69 @@
+# runs the benchmark suite, every benchmark lives in scripts/benchmarks and shares the helpers in benchmarks/common.py
+# results are saved as JSON (data/benchmarks/<benchmark>-<time>.json by default) so runs can be compared with --compare
+# exits with 1 if one of a benchmark's checks fails
+#
+# usage:
+#   python scripts/bench.py --list
+#   python scripts/bench.py database --scale small
+#   python scripts/bench.py database --scale large --output data/benchmarks/large.json
+#   python scripts/bench.py database --aps 200 --clients 20000 --samples 5000000 --audit-logs 1000000
+#   python scripts/bench.py database --scale small --compare data/benchmarks/previous.json
+#   python scripts/bench.py audit-events --rows 1000000
+#   python scripts/bench.py startup --budget 50 --runs 5
+#   python scripts/bench.py models --records 50000 --runs 5
+#   python scripts/bench.py dashboard-summary --aps 100 --clients 20000 --samples 1000000 --cycles 20
+#   python scripts/bench.py client-search --clients 100000 --queries 200
+
+import argparse
+import sys
+from pathlib import Path
+
+projectRoot = Path(__file__).parent.parent
+sys.path.insert(0, str(projectRoot))
+
+from benchmarks import audit_events, client_search, dashboard_summary, database, models, startup
+from benchmarks.common import checkFailed, printResults, saveResults, compare
+
+benchmarks = {
+    'database': database,
+    'audit-events': audit_events,
+    'startup': startup,
+    'models': models,
+    'dashboard-summary': dashboard_summary,
+    'client-search': client_search
+}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--list', action='store_true', help='list the benchmarks and exit')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    for name, benchmark in benchmarks.items():
+        subparser = subparsers.add_parser(name, help=benchmark.description)
+        benchmark.addArguments(subparser)
+        # options every benchmark takes
+        subparser.add_argument('--seed', type=int, default=1)
+        subparser.add_argument('--output', help='where to save the results, data/benchmarks/<benchmark>-<time>.json by default')
+        subparser.add_argument('--no-save', action='store_true', dest='noSave', help="don't save the results")
+        subparser.add_argument('--compare', help='a previous results file of the same benchmark to compare against')
+    args = parser.parse_args()
+
+    if args.list or not args.benchmark:
+        for name, benchmark in benchmarks.items():
+            print(f"  {name:20} {benchmark.description}")
+        return
+
+    try:
+        results = benchmarks[args.benchmark].run(args)
+    except checkFailed as error:
+        print(f"FAIL: {error}")
+        sys.exit(1)
+    print(f"\n{args.benchmark}:")
+    printResults(results)
+    if not args.noSave:
+        options = {key: value for key, value in vars(args).items() if key not in ('output', 'noSave', 'compare', 'list')}
+        saveResults(args.benchmark, options, results, args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# compares the old audit log layout (a full sentence per row) with the structured layout (event type + interned names)
+# builds both in scratch databases with the same synthetic events, then measures the size of each and how long a
+# "roams per AP per day" query takes on each
+# the new layout has one more index (eventType, dateCreated) for the aggregate queries, which is included in its file size
+
+import random
+import sqlite3
+import time
+
+from .common import projectRoot, scratchFolder, timeCall, summarise
+from .generators import newId
+
+description = "old vs structured audit log layout: table/file size and a roams per AP per day query"
+
+schemaPath = projectRoot / 'data' / 'schema.sql'
+
+oldLayout = '''
+CREATE TABLE tbl_AuditLogs (
+    auditLogId INTEGER PRIMARY KEY AUTOINCREMENT,
+    accessPointId CHAR(36),
+    clientId CHAR(36),
+    dateCreated DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    logMessage TEXT NOT NULL
+);
+CREATE INDEX idx_AuditLogs_dateCreated ON tbl_AuditLogs(dateCreated);
+CREATE INDEX idx_AuditLogs_accessPointId ON tbl_AuditLogs(accessPointId, dateCreated);
+CREATE INDEX idx_AuditLogs_clientId ON tbl_AuditLogs(clientId, dateCreated);
+'''
+
+# only the audit log parts of the real schema, so the sizes compare like for like (no search index in either)
+def newLayout():
+    schema = schemaPath.read_text()
+    parts = []
+    for name in ['tbl_AuditEventTypes', 'tbl_AuditNames', 'tbl_AuditLogs (']:
+        start = schema.index(f'CREATE TABLE IF NOT EXISTS {name}')
+        parts.append(schema[start:schema.index(');', start) + 2])
+    for line in schema.splitlines():
+        if line.startswith('CREATE INDEX IF NOT EXISTS idx_AuditLogs_'):
+            parts.append(line)
+    start = schema.index('INSERT OR IGNORE INTO tbl_AuditEventTypes')
+    parts.append(schema[start:schema.index(';', start) + 1])
+    return '\n'.join(parts)
+
+def makeEvents(rows, aps, clients, days, seed):
+    rng = random.Random(seed)
+    apList = [(newId(rng), f"Office-AP-{i:03d}") for i in range(aps)]
+    clientList = [(newId(rng), f"DESKTOP-{i:06X}") for i in range(clients)]
+    start = time.time() - days * 86400
+    events = []
+    for i in range(rows):
+        dateCreated = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i * days * 86400 / rows))
+        apId, apName = rng.choice(apList)
+        clientId, clientName = rng.choice(clientList)
+        kind = rng.random()
+        if kind < 0.6:
+            events.append((5, apId, clientId, clientName, apName, f"Client {clientName} roamed to AP {apName}.", dateCreated))
+        elif kind < 0.8:
+            events.append((8, None, clientId, clientName, None, f"Client {clientName} disconnected from the network.", dateCreated))
+        elif kind < 0.95:
+            events.append((7, None, clientId, clientName, None, f"Client {clientName} connected to the network again.", dateCreated))
+        else:
+            events.append((2, apId, None, apName, None, f"Access point {apName} was updated.", dateCreated))
+    return events
+
+def fileSize(con, path):
+    con.execute('VACUUM')
+    return path.stat().st_size
+
+# bytes used by the tables themselves (not their indexes), using the dbstat table https://www.sqlite.org/dbstat.html
+def tableSize(con, tables):
+    placeholders = ', '.join('?' for _ in tables)
+    return con.execute('''SELECT SUM(pgsize) FROM dbstat WHERE name IN (%s)''' % placeholders, tables).fetchone()[0]
+
+def addArguments(parser):
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--aps', type=int, default=500)
+    parser.add_argument('--clients', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--repeats', type=int, default=3, help='times each query is run')
+
+def run(args):
+    events = makeEvents(args.rows, args.aps, args.clients, args.days, args.seed)
+    with scratchFolder() as folder:
+        oldPath = folder / 'old.db'
+        old = sqlite3.connect(oldPath)
+        old.executescript(oldLayout)
+        old.executemany(
+            '''INSERT INTO tbl_AuditLogs (accessPointId, clientId, logMessage, dateCreated) VALUES (?, ?, ?, ?)''',
+            [(e[1], e[2], e[5], e[6]) for e in events]
+        )
+        old.commit()
+
+        newPath = folder / 'new.db'
+        new = sqlite3.connect(newPath)
+        new.executescript(newLayout())
+        new.executemany('''INSERT OR IGNORE INTO tbl_AuditNames (name) VALUES (?)''', [(name,) for e in events for name in e[3:5] if name])
+        nameIds = dict(new.execute('''SELECT name, nameId FROM tbl_AuditNames''').fetchall())
+        new.executemany(
+            '''INSERT INTO tbl_AuditLogs (eventType, accessPointId, clientId, subjectNameId, targetNameId, dateCreated) VALUES (?, ?, ?, ?, ?, ?)''',
+            [(e[0], e[1], e[2], nameIds.get(e[3]), nameIds.get(e[4]), e[6]) for e in events]
+        )
+        new.commit()
+
+        results = {
+            'old.tableMB': round(tableSize(old, ['tbl_AuditLogs']) / 1e6, 1),
+            'new.tableMB': round(tableSize(new, ['tbl_AuditLogs', 'tbl_AuditNames']) / 1e6, 1),
+            'old.fileMB': round(fileSize(old, oldPath) / 1e6, 1),
+            'new.fileMB': round(fileSize(new, newPath) / 1e6, 1),
+            'old.roamsPerAPPerDay': summarise(timeCall(lambda: old.execute('''SELECT accessPointId, date(dateCreated) AS day, COUNT(*) FROM tbl_AuditLogs
+                WHERE logMessage LIKE 'Client % roamed to AP %' GROUP BY accessPointId, day''').fetchall(), args.repeats)),
+            'new.roamsPerAPPerDay': summarise(timeCall(lambda: new.execute('''SELECT accessPointId, date(dateCreated) AS day, COUNT(*) FROM tbl_AuditLogs
+                WHERE eventType = 5 GROUP BY accessPointId, day''').fetchall(), args.repeats))
+        }
+        old.close()
+        new.close()
+
+    print(f"{args.rows} audit logs, {args.aps} APs, {args.clients} clients")
+    print(f"table size:           {100 * (1 - results['new.tableMB'] / results['old.tableMB']):.0f}% smaller")
+    print(f"file size (+indexes): {100 * (1 - results['new.fileMB'] / results['old.fileMB']):.0f}% smaller")
+    print(f"roams per AP per day: {results['old.roamsPerAPPerDay']['minMs'] / results['new.roamsPerAPPerDay']['minMs']:.1f}x faster")
+    return results
@@ -0,0 +1,172 @@
+# checks and times the client search index (src/backend/services/clientSearch.py) against LIKE scans of tbl_Clients
+# makes --clients synthetic clients with MACs and IPs in the mixed formats consoles send (aa:bb:.., AA-BB-.., aabb.ccdd..,
+# leading zeros, IPv6, "Unknown"), then for a few hundred type-ahead queries (each one typed a character at a time):
+#   check    with no limit the index finds exactly what going through every client finds, before and after the update
+#   time     each keystroke's search through the index vs the LIKE query the dashboard would otherwise run
+#   update   applying a batch of changed clients like databaseService does after a client push
+
+import random
+import sqlite3
+import time
+
+from src.backend.services.clientSearch import (
+    clientSearch, _normaliseMac, _normaliseIp, _normaliseIpPrefix, _normaliseNetwork, _hostnameSeparators, _macSeparators
+)
+from .common import scratchFolder, scratchDatabase, summarise, check, checkFailed
+
+description = "client search index per keystroke vs LIKE scans, checked against a full scan"
+
+def addArguments(parser):
+    parser.add_argument('--clients', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--changes', type=int, default=1000, help='clients changed in the update batch')
+
+words = ['johns', 'iphone', 'desktop', 'laptop', 'printer', 'office', 'galaxy', 'pixel', 'ipad', 'tv', 'camera', 'thermostat', 'kitchen', 'echo']
+
+def macText(rng, number):
+    digits = f'{number:012x}'
+    style = rng.randrange(4)
+    if style == 0:
+        return ':'.join(digits[i:i + 2] for i in range(0, 12, 2))
+    if style == 1:
+        return '-'.join(digits[i:i + 2] for i in range(0, 12, 2)).upper()
+    if style == 2:
+        return '.'.join(digits[i:i + 4] for i in range(0, 12, 4))
+    return digits.upper()
+
+def ipText(rng, i):
+    kind = rng.random()
+    if kind < 0.03:
+        return "Unknown"
+    if kind < 0.08:
+        return f'2001:db8::{i:x}'
+    octets = [10, 64 + i // 65536, i // 256 % 256, i % 256]
+    if kind < 0.2:
+        return '.'.join(f'{octet:03d}' for octet in octets) # leading zeros
+    return '.'.join(map(str, octets))
+
+def makeClients(count, seed):
+    rng = random.Random(seed)
+    clients = []
+    for i in range(count):
+        hostname = f'{rng.choice(words)}-{rng.choice(words)}-{i:x}'
+        if rng.random() < 0.3:
+            hostname = hostname.upper() + '.local'
+        clients.append((f'client-{i:07d}', hostname, ipText(rng, i), macText(rng, rng.getrandbits(48)), rng.random() < 0.7))
+    return clients
+
+# what the index should find, worked out the slow way by going through every client
+def bruteForce(clients, query):
+    text = query.strip().lower()
+    found = set()
+    if '/' in text:
+        network = _normaliseNetwork(text)
+        for clientId, hostname, ipAddress, macAddress, active in clients:
+            ip = _normaliseIp(ipAddress)
+            if ip and ip[0] == network.version and int(network.network_address) <= ip[1] <= int(network.broadcast_address):
+                found.add(clientId)
+        return found
+    mac = _macSeparators.sub('', text)
+    ipPrefix = _normaliseIpPrefix(text)
+    for clientId, hostname, ipAddress, macAddress, active in clients:
+        hostname = hostname.lower()
+        if any(word.startswith(text) for word in [hostname] + _hostnameSeparators.split(hostname) if word):
+            found.add(clientId)
+        elif mac and (_normaliseMac(macAddress) or '').startswith(mac) and len(mac) <= 12 and all(c in '0123456789abcdef' for c in mac):
+            found.add(clientId)
+        elif ipPrefix and (_normaliseIp(ipAddress) or (0, 0, ''))[2].startswith(ipPrefix):
+            found.add(clientId)
+    return found
+
+# the queries a person might type, each as the list of what has been typed after every keystroke
+# addresses are typed in a different format to how they are stored
+def makeQueries(clients, count, seed):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        clientId, hostname, ipAddress, macAddress, active = rng.choice(clients)
+        kind = rng.randrange(4)
+        if kind == 0:
+            full = rng.choice(_hostnameSeparators.split(hostname.lower()))
+        elif kind == 1:
+            digits = _normaliseMac(macAddress)
+            full = ':'.join(digits[i:i + 2] for i in range(0, 12, 2)).upper() if rng.random() < 0.5 else digits
+        elif kind == 2:
+            ip = _normaliseIp(ipAddress)
+            full = ip[2] if ip else 'unknown'
+        else:
+            ip = _normaliseIp(ipAddress)
+            if not ip or ip[0] != 4:
+                continue
+            queries.append([f"{ip[2].rsplit('.', 1)[0]}.0/24", f"{ip[2].rsplit('.', 2)[0]}.0.0/16"])
+            continue
+        queries.append([full[:length] for length in range(1, len(full) + 1)])
+    return queries
+
+# with no limit the index finds exactly what the brute force finds, for the last two keystrokes of each query
+def checkMatches(index, clients, queries, when):
+    for keystrokes in queries:
+        for query in keystrokes[-2:]:
+            found = set(row['clientId'] for row in index.search(query, limit=10**9)['data'])
+            expected = bruteForce(clients, query)
+            if found != expected:
+                raise checkFailed(f"{query!r} {when}: the index found {len(found)}, a full scan {len(expected)}")
+    check(True, f"the index matched a full scan for {len(queries)} queries {when}")
+
+def run(args):
+    clients = makeClients(args.clients, args.seed)
+    queries = makeQueries(clients, args.queries, args.seed)
+    with scratchFolder() as folder:
+        dbPath = scratchDatabase(folder)
+        con = sqlite3.connect(dbPath)
+        con.executemany('''INSERT INTO tbl_Clients (clientId, hostname, ipAddress, macAddress, active) VALUES (?, ?, ?, ?, ?)''', clients)
+        con.commit()
+
+        index = clientSearch(dbPath=dbPath)
+        start = time.perf_counter()
+        index.load()
+        loadMs = (time.perf_counter() - start) * 1000
+
+        checkMatches(index, clients, queries[:50], 'before the update')
+
+        indexMs = []
+        likeMs = []
+        for keystrokes in queries:
+            for query in keystrokes:
+                start = time.perf_counter()
+                result = index.search(query, limit=args.limit)
+                indexMs.append((time.perf_counter() - start) * 1000)
+                if not result['successful']:
+                    raise RuntimeError(f"search failed: {result['errors']}")
+            # the LIKE scan is only timed for the last keystroke, it takes about as long whatever was typed
+            pattern = f'%{keystrokes[-1]}%'
+            start = time.perf_counter()
+            con.execute(
+                '''SELECT clientId, hostname, ipAddress, macAddress, active FROM tbl_Clients
+                WHERE hostname LIKE ? OR macAddress LIKE ? OR ipAddress LIKE ? LIMIT ?''',
+                (pattern, pattern, pattern, args.limit)
+            ).fetchall()
+            likeMs.append((time.perf_counter() - start) * 1000)
+        con.close()
+
+        # update: a batch of clients changing hostname and IP, applied one at a time as it is under the rebuild ratio
+        rng = random.Random(args.seed + 1)
+        changed = [(clientId, f'renamed-{i}', f'192.168.{i // 256 % 256}.{i % 256}', macAddress, True)
+                   for i, (clientId, hostname, ipAddress, macAddress, active) in enumerate(rng.sample(clients, args.changes))]
+        start = time.perf_counter()
+        index.update(changed)
+        updateMs = (time.perf_counter() - start) * 1000
+        renamed = index.search(changed[0][1], limit=5)['data']
+        check(bool(renamed) and renamed[0]['clientId'] == changed[0][0] and renamed[0]['ipAddress'] == changed[0][2],
+              "a renamed client is found by its new hostname, with its new IP")
+        updated = dict((client[0], client) for client in clients)
+        updated.update((client[0], client) for client in changed)
+        checkMatches(index, list(updated.values()), queries[:50] + [[client[1], client[2]] for client in changed[:20]], 'after the update')
+
+    return {
+        'loadMs': round(loadMs, 1),
+        'search.index': summarise(indexMs),
+        'search.like': summarise(likeMs),
+        'update.usPerClient': round(updateMs / args.changes * 1000, 1)
+    }
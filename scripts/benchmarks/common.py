@@ -0,0 +1,101 @@
+# helpers shared by every benchmark in the suite, so each one only has to set up and time its own work
+# scripts/bench.py parses the shared options, runs the chosen benchmark and then saves/compares what it returns
+#
+# a benchmark returns a dictionary of results, each one either a timing (made by summarise()) or a plain number
+# such as a size, named with its unit (eg 'tableMB'). checks are made with check(), a failed one stops the run
+
+import json
+import platform
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+from init_db import init_db
+
+projectRoot = Path(__file__).parent.parent.parent
+resultsFolder = projectRoot / 'data' / 'benchmarks'
+
+# raised by check(), bench.py reports it and exits with 1 so the suite can be used as a check after a change
+class checkFailed(Exception):
+    pass
+
+def check(passed, description):
+    if not passed:
+        raise checkFailed(description)
+    print(f"check: {description}")
+
+# a temporary folder for scratch databases, removed afterwards
+@contextmanager
+def scratchFolder():
+    folder = Path(tempfile.mkdtemp())
+    try:
+        yield folder
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+# a new database with the app's schema, made by init_db like the real one
+def scratchDatabase(folder, name='bench.db'):
+    dbPath = Path(folder) / name
+    if dbPath.exists():
+        raise FileExistsError(f"{dbPath} already exists, the benchmark needs a new scratch database")
+    init_db(dbPath)
+    return dbPath
+
+# runs function repeats times and returns the timings in ms
+# a result dictionary that says it wasn't successful stops the benchmark, rather than timing a failure
+def timeCall(function, repeats=1, argument=None):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function() if argument is None else function(argument)
+        timings.append((time.perf_counter() - start) * 1000)
+        if isinstance(result, dict) and result.get('successful') is False:
+            raise RuntimeError(f"{getattr(function, '__name__', function)} failed: {result['errors']}")
+    return timings
+
+def summarise(timings):
+    timings = sorted(timings)
+    return {
+        'runs': len(timings),
+        'minMs': round(timings[0], 3),
+        'medianMs': round(statistics.median(timings), 3),
+        'p99Ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        'maxMs': round(timings[-1], 3)
+    }
+
+def printResults(results):
+    for name, result in results.items():
+        if isinstance(result, dict):
+            print(f"  {name:36} median {result['medianMs']:10.3f} ms  (min {result['minMs']:.3f}, max {result['maxMs']:.3f}, {result['runs']} runs)")
+        else:
+            print(f"  {name:36} {result:10.3f}")
+
+def saveResults(benchmark, options, results, outputPath=None):
+    output = {
+        'benchmark': benchmark,
+        'date': datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        'options': options,
+        'environment': {'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version, 'platform': platform.platform()},
+        'results': results
+    }
+    outputPath = Path(outputPath) if outputPath else resultsFolder / f"{benchmark}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    outputPath.parent.mkdir(parents=True, exist_ok=True)
+    outputPath.write_text(json.dumps(output, indent=2))
+    print(f"results saved to {outputPath}")
+
+# prints how each result changed since an earlier run of the same benchmark (lower is better for all of them)
+def compare(results, previousPath):
+    previous = json.loads(Path(previousPath).read_text())['results']
+    print(f"\ncompared with {previousPath}:")
+    for name, result in results.items():
+        if name not in previous:
+            continue
+        before = previous[name]['medianMs'] if isinstance(previous[name], dict) else previous[name]
+        after = result['medianMs'] if isinstance(result, dict) else result
+        ratio = after / before if before else float('inf')
+        print(f"  {name:36} {before:12.3f} -> {after:12.3f}  ({ratio:.2f}x)")
@@ -0,0 +1,155 @@
+# checks and times tbl_DashboardSummary, the overview counts kept up to date by triggers (src/backend/services/dashboardSummary.py)
+#
+# check: runs collection cycles through the real databaseService against a synthetic api whose APs change state, whose
+# broadcasts are turned on/off and hidden, and whose clients roam and come and go. between cycles it also deletes APs,
+# clients, connections and samples (including the latest one, and everything older than the retention period) the way
+# an admin or data retention would. after every step dashboardSummary.verify() compares the row with a full recompute
+# (vw_DashboardSummary), the first step where they differ fails the benchmark
+# testing/test-dashboard-summary.py checks the same triggers one kind of change at a time, without a synthetic network
+#
+# time: fills a scratch database with --samples of history, then compares
+#   overview     the full recompute the overview used to need vs reading the single row
+#   collection   a collection cycle with the summary triggers vs the same cycle with them dropped
+
+import random
+import shutil
+import sqlite3
+import time
+
+from src.backend.services.collectData import collectData
+from src.backend.services.dashboardSummary import dashboardSummary
+from src.backend.services.database import databaseService
+from .common import scratchFolder, scratchDatabase, timeCall, summarise, check, checkFailed
+from .generators import syntheticAPI, fillHistory
+
+description = "trigger-maintained overview counts: checked against a full recompute, and timed against it"
+
+states = ['ONLINE', 'OFFLINE', 'UPDATING', 'GETTING_READY', 'CONNECTION_INTERRUPTED']
+pushStages = ['pushAPData', 'pushTrafficSamples', 'pushClientData', 'pushConnectionData', 'detectInactiveClients']
+
+def addArguments(parser):
+    parser.add_argument('--aps', type=int, default=100)
+    parser.add_argument('--clients', type=int, default=20000)
+    parser.add_argument('--samples', type=int, default=1000000)
+    parser.add_argument('--cycles', type=int, default=20, help='collection cycles to check, and to time with and without the triggers')
+    parser.add_argument('--repeats', type=int, default=20, help='times each overview read is run')
+
+# the synthetic api, plus APs that change state and a few broadcasts that change
+class changingAPI(syntheticAPI):
+    def __init__(self, aps, clients, seed=1):
+        super().__init__(aps, clients, seed)
+        self._changes = random.Random(seed + 1)
+        self.broadcasts = [{'id': f'bench-broadcast-{i}', 'name': f'Bench {i}', 'enabled': True, 'hideName': False} for i in range(4)]
+
+    def nextCycle(self):
+        super().nextCycle()
+        for ap in self._changes.sample(self.aps, max(1, len(self.aps) // 10)):
+            ap['state'] = self._changes.choice(states)
+        broadcast = self._changes.choice(self.broadcasts)
+        broadcast['enabled'] = self._changes.random() < 0.5
+        broadcast['hideName'] = self._changes.random() < 0.5
+
+    def fetchWifiBroadcasts(self):
+        return [{'id': broadcast['id'], 'name': broadcast['name'], 'enabled': broadcast['enabled']} for broadcast in self.broadcasts]
+
+    def fetchBroadcastDetails(self, id):
+        return {'hideName': next(broadcast['hideName'] for broadcast in self.broadcasts if broadcast['id'] == id)}
+
+# the changes made straight to the database between cycles, each one a (name, sql, params)
+def directChanges(rng, dbPath):
+    con = sqlite3.connect(dbPath)
+    try:
+        apId = con.execute('''SELECT accessPointId FROM tbl_APdevices ORDER BY random() LIMIT 1''').fetchone()
+        clientId = con.execute('''SELECT clientId FROM tbl_Clients ORDER BY random() LIMIT 1''').fetchone()
+    finally:
+        con.close()
+    changes = [
+        ('delete the latest sample', '''DELETE FROM tbl_TrafficSamples WHERE sampleId = (SELECT MAX(sampleId) FROM tbl_TrafficSamples)''', ()),
+        ('delete old samples', '''DELETE FROM tbl_TrafficSamples WHERE coalesce(endDate, dateCreated) < datetime('now', '-30 days')''', ()),
+        ('move a sample later', '''UPDATE tbl_TrafficSamples SET endDate = datetime('now', '+1 minute'), sampleCount = 2 WHERE sampleId = (SELECT MIN(sampleId) FROM tbl_TrafficSamples)''', ()),
+        ('delete a broadcast', '''DELETE FROM tbl_WifiBroadcasts WHERE broadcastId = (SELECT MIN(broadcastId) FROM tbl_WifiBroadcasts)''', ()),
+    ]
+    if apId:
+        changes.append(('delete an AP', '''DELETE FROM tbl_APdevices WHERE accessPointId = ?''', apId))
+        changes.append(('set an AP state to NULL', '''UPDATE tbl_APdevices SET apState = NULL WHERE accessPointId = ?''', apId))
+    if clientId:
+        changes.append(('delete a client and its connection', '''DELETE FROM tbl_Clients WHERE clientId = ?''', clientId))
+        changes.append(('delete a connection', '''DELETE FROM tbl_Connections WHERE clientId = ?''', clientId))
+    rng.shuffle(changes)
+    return changes[:3]
+
+def run(args):
+    with scratchFolder() as folder:
+        checkCycles(args, folder)
+        return timeSummary(args, folder)
+
+def checkCycles(args, folder):
+    dbPath = scratchDatabase(folder, 'check.db')
+    rng = random.Random(args.seed)
+    api = changingAPI(args.aps, min(args.clients, 2000), seed=args.seed)
+    service = databaseService(collectData(api), dbPath=dbPath, sampleRuns=True)
+    summary = dashboardSummary(dbPath=dbPath)
+    steps = 0
+    for cycle in range(args.cycles):
+        result = service.runCycle()
+        if not result['successful']:
+            raise RuntimeError(f"cycle {cycle} failed: {result['errors']}")
+        result = summary.verify()
+        if not result['successful']:
+            raise checkFailed(f"the summary doesn't match a full recompute after cycle {cycle}: {result['errors']}")
+        steps += 1
+        for name, sql, params in directChanges(rng, dbPath):
+            con = sqlite3.connect(dbPath)
+            con.execute(sql, params)
+            con.commit()
+            con.close()
+            result = summary.verify()
+            if not result['successful']:
+                raise checkFailed(f"the summary doesn't match a full recompute after '{name}': {result['errors']}")
+            steps += 1
+        api.nextCycle()
+    check(True, f"the summary matched a full recompute after all {steps} steps ({args.cycles} cycles)")
+
+def dropSummaryTriggers(dbPath):
+    con = sqlite3.connect(dbPath)
+    names = [row[0] for row in con.execute('''SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%summary%' ''')]
+    for name in names:
+        con.execute(f'''DROP TRIGGER {name}''')
+    con.commit()
+    con.close()
+
+def timeSummary(args, folder):
+    dbPath = scratchDatabase(folder)
+    api = syntheticAPI(args.aps, args.clients, seed=args.seed)
+    print(f"filling {dbPath} with {args.samples} samples...")
+    fillHistory(dbPath, api, args.samples, 0, days=60, seed=args.seed)
+    copyPath = folder / 'bench-no-triggers.db'
+    shutil.copy(dbPath, copyPath)
+    dropSummaryTriggers(copyPath)
+
+    results = {}
+    con = sqlite3.connect(dbPath)
+    fields = ', '.join(dashboardSummary.fields)
+    results['overview.recompute'] = summarise(timeCall(lambda: con.execute(f'''SELECT {fields} FROM vw_DashboardSummary''').fetchone(), args.repeats))
+    results['overview.summaryRow'] = summarise(timeCall(lambda: con.execute(f'''SELECT {fields} FROM tbl_DashboardSummary WHERE summaryId = 1''').fetchone(), args.repeats))
+    con.close()
+    results['overview.getSummary'] = summarise(timeCall(dashboardSummary(dbPath=dbPath).getSummary, args.repeats))
+
+    # the push stages of a cycle, with the api data fetched before timing starts so only the database work is measured
+    for name, path in (('collection.triggers', dbPath), ('collection.noTriggers', copyPath)):
+        cycleApi = syntheticAPI(args.aps, args.clients, seed=args.seed)
+        service = databaseService(collectData(cycleApi), dbPath=path)
+        timings = []
+        for _ in range(args.cycles):
+            cycleApi.nextCycle()
+            service._apData = service._trafficSamples = service._clientData = service._topologyData = None
+            service._fetchAPData()
+            service._fetchClientData()
+            start = time.perf_counter()
+            for stage in pushStages:
+                getattr(service, stage)()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = summarise(timings)
+
+    check(dashboardSummary(dbPath=dbPath).verify()['successful'] is True, "the summary matches a full recompute after the timed cycles")
+    return results
@@ -0,0 +1,98 @@
+# the database side of the collector and the dashboard, no console needed
+# fills a scratch database with synthetic history at the chosen scale, then times the push stages (fed through the
+# real collectData by a synthetic api client), the queries the dashboard makes and the data retention run
+# the large preset (500 APs, 50k clients, 50M samples, 10M audit logs) needs several GB of disk and takes a while to fill
+
+import time
+
+from src.backend.api.dashboardApi import dashboardAPI
+from src.backend.models.models import auditEventType
+from src.backend.services.auditLogs import auditLogService
+from src.backend.services.collectData import collectData
+from src.backend.services.dataRetention import dataRetention
+from src.backend.services.database import databaseService
+from src.backend.services.roamAnalytics import roamAnalytics
+from .common import scratchFolder, scratchDatabase, timeCall, summarise
+from .generators import syntheticAPI, fillHistory
+
+description = "push stages, dashboard queries and data retention against synthetic history"
+
+scales = {
+    'tiny': {'aps': 10, 'clients': 500, 'samples': 20000, 'auditLogs': 10000},
+    'small': {'aps': 50, 'clients': 5000, 'samples': 1000000, 'auditLogs': 200000},
+    'medium': {'aps': 200, 'clients': 20000, 'samples': 10000000, 'auditLogs': 2000000},
+    'large': {'aps': 500, 'clients': 50000, 'samples': 50000000, 'auditLogs': 10000000}
+}
+
+def addArguments(parser):
+    parser.add_argument('--scale', choices=scales, default='small')
+    parser.add_argument('--aps', type=int)
+    parser.add_argument('--clients', type=int)
+    parser.add_argument('--samples', type=int)
+    parser.add_argument('--audit-logs', type=int, dest='auditLogs')
+    parser.add_argument('--days', type=int, default=60, help='how far back the history goes, the default retention period is 30 days')
+    parser.add_argument('--cycles', type=int, default=5, help='collection cycles to time the push stages over')
+    parser.add_argument('--repeats', type=int, default=5, help='times each query is run')
+
+def run(args):
+    # the preset fills in any size that wasn't given, the sizes used are then saved with the results
+    scale = dict(scales[args.scale])
+    for key in scale:
+        if getattr(args, key) is not None:
+            scale[key] = getattr(args, key)
+        setattr(args, key, scale[key])
+
+    with scratchFolder() as folder:
+        dbPath = scratchDatabase(folder)
+        api = syntheticAPI(scale['aps'], scale['clients'], seed=args.seed)
+        print(f"filling {dbPath} with {scale}...")
+        start = time.perf_counter()
+        fillHistory(dbPath, api, scale['samples'], scale['auditLogs'], args.days, seed=args.seed)
+        print(f"filled in {time.perf_counter() - start:.1f} s")
+        results = {'databaseMB': round(dbPath.stat().st_size / 1e6, 1)}
+        results.update(runBenchmarks(dbPath, api, args.cycles, args.repeats))
+    return results
+
+def runBenchmarks(dbPath, api, cycles, queryRepeats):
+    results = {}
+
+    # the push stages, each cycle the synthetic network changes and fresh data is fetched through the real collectData
+    service = databaseService(collectData(api), dbPath=dbPath)
+    pushStages = ['pushAPData', 'pushTrafficSamples', 'pushClientData', 'pushConnectionData', 'detectInactiveClients']
+    stageTimings = {stage: [] for stage in pushStages}
+    for _ in range(cycles):
+        api.nextCycle()
+        service._apData = service._trafficSamples = service._clientData = service._topologyData = None
+        # the api data is fetched before timing starts, so only the database work is measured
+        service._fetchAPData()
+        service._fetchClientData()
+        for stage in pushStages:
+            stageTimings[stage] += timeCall(getattr(service, stage))
+    for stage in pushStages:
+        results[stage] = summarise(stageTimings[stage])
+
+    # the queries behind the dashboard pages
+    auditLogs = auditLogService(dbPath=dbPath)
+    roams = roamAnalytics(dbPath=dbPath)
+    apId = api.aps[0]['id']
+    clientName = api.clients[0]['name']
+    queries = {
+        'getAuditLogs.firstPage': lambda: auditLogs.getAuditLogs(pageSize=50),
+        'getAuditLogs.accessPoint': lambda: auditLogs.getAuditLogs(accessPointId=apId, pageSize=50),
+        'searchLogs': lambda: auditLogs.searchLogs(clientName, pageSize=50),
+        'getEventCounts.roamsPerAP': lambda: auditLogs.getEventCounts(auditEventType.CLIENT_ROAMED),
+        'getPingPongClients': lambda: roams.getPingPongClients(),
+        'getRoamsPerAccessPoint': lambda: roams.getRoamsPerAccessPoint(),
+        'getStickyClients': lambda: roams.getStickyClients()
+    }
+    for name, query in queries.items():
+        results[name] = summarise(timeCall(query, queryRepeats))
+
+    # the dashboard api reading every table for its first snapshot, then checking for changes with nothing new
+    dashboard = dashboardAPI(dbPath=dbPath)
+    results['dashboard.firstRefresh'] = summarise(timeCall(dashboard._refresh))
+    results['dashboard.refresh'] = summarise(timeCall(dashboard._refresh, queryRepeats))
+
+    # retention runs last as it deletes the older half of the history
+    results['deleteOldData'] = summarise(timeCall(dataRetention(dbPath=dbPath).deleteOldData))
+    return results
@@ -0,0 +1,141 @@
+# synthetic data for the benchmarks, shaped like what the UniFi Network API returns and what the app stores
+# the same seed always gives the same network and history, so runs can be compared
+
+import random
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from src.backend.models.models import auditEventType
+from .common import projectRoot
+
+def newId(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128)))
+
+def dateString(date):
+    return date.strftime("%Y-%m-%d %H:%M:%S")
+
+# stands in for APIclient, returning the same shapes as the UniFi Network API
+# each fetch of the clients moves some of them to another AP (roams), disconnects some and brings some back,
+# so every push stage has real work to do on each cycle
+class syntheticAPI:
+    def __init__(self, aps, clients, seed=1, onlineFraction=0.7, roamFraction=0.05, churnFraction=0.02):
+        self._rng = random.Random(seed)
+        self.aps = [{'id': newId(self._rng), 'name': f'AP-{i:04d}', 'ipAddress': f'10.0.{i // 250}.{i % 250 + 1}',
+                     'macAddress': f'02:00:00:00:{i // 256:02x}:{i % 256:02x}', 'state': 'ONLINE'} for i in range(aps)]
+        self.clients = [{'id': newId(self._rng), 'name': f'DEVICE-{i:06X}', 'ipAddress': f'10.{64 + i // 65536}.{i // 256 % 256}.{i % 256}',
+                         'macAddress': f'06:00:00:{i // 65536:02x}:{i // 256 % 256:02x}:{i % 256:02x}'} for i in range(clients)]
+        self.clientAP = {client['id']: self._rng.choice(self.aps)['id'] for client in self.clients}
+        self._online = set(client['id'] for client in self._rng.sample(self.clients, int(len(self.clients) * onlineFraction)))
+        self._roamFraction = roamFraction
+        self._churnFraction = churnFraction
+
+    # moves the synthetic network on by one collection cycle
+    def nextCycle(self):
+        online = list(self._online)
+        for clientId in self._rng.sample(online, int(len(online) * self._roamFraction)):
+            self.clientAP[clientId] = self._rng.choice(self.aps)['id']
+        churn = int(len(online) * self._churnFraction)
+        self._online.difference_update(self._rng.sample(online, churn))
+        offline = [client['id'] for client in self.clients if client['id'] not in self._online]
+        self._online.update(self._rng.sample(offline, min(churn, len(offline))))
+
+    def fetchAccessPoints(self):
+        return self.aps
+
+    def fetchTrafficSample(self, deviceId):
+        return {'uptimeSec': 86400, 'interfaces': {'radios': [{'txRetriesPct': self._rng.random() * 10}]},
+                'uplink': {'txRateBps': self._rng.randrange(10**6, 10**9), 'rxRateBps': self._rng.randrange(10**6, 10**9)}}
+
+    def fetchClients(self):
+        return [client for client in self.clients if client['id'] in self._online]
+
+    def fetchTopology(self, clientId):
+        return {'id': clientId, 'uplinkDeviceId': self.clientAP[clientId]}
+
+    def fetchWifiBroadcasts(self):
+        return [{'id': 'bench-broadcast', 'name': 'Bench', 'enabled': True}]
+
+    def fetchBroadcastDetails(self, id):
+        return {'hideName': False}
+
+def inChunks(rows, size=100000):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+# fills the scratch database with history going back `days` days, further back than the retention period
+# so deleteOldData has something to delete
+def fillHistory(dbPath, api, samples, auditLogs, days, seed=1):
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    start = now - timedelta(days=days)
+    con = sqlite3.connect(dbPath)
+    # the scratch database is thrown away afterwards, so it doesn't need to survive a crash while filling
+    con.execute('PRAGMA journal_mode = OFF')
+    con.execute('PRAGMA synchronous = OFF')
+    cur = con.cursor()
+
+    cur.executemany(
+        '''INSERT INTO tbl_APdevices (accessPointId, hostname, ipAddress, macAddress, apState) VALUES (?, ?, ?, ?, ?)''',
+        [(ap['id'], ap['name'], ap['ipAddress'], ap['macAddress'], ap['state']) for ap in api.aps]
+    )
+    # every client has been seen before, the ones that aren't online now are stored as inactive
+    online = set(client['id'] for client in api.fetchClients())
+    cur.executemany(
+        '''INSERT INTO tbl_Clients (clientId, hostname, ipAddress, macAddress, active) VALUES (?, ?, ?, ?, ?)''',
+        [(client['id'], client['name'], client['ipAddress'], client['macAddress'], client['id'] in online) for client in api.clients]
+    )
+    cur.executemany(
+        '''INSERT INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''',
+        list(api.clientAP.items())
+    )
+
+    apIds = [ap['id'] for ap in api.aps]
+    step = days * 86400 / max(samples, 1)
+    sampleRows = ((apIds[i % len(apIds)], rng.randrange(86400), rng.random() * 10, rng.randrange(10**6, 10**9),
+                   rng.randrange(10**6, 10**9), dateString(start + timedelta(seconds=i * step))) for i in range(samples))
+    for chunk in inChunks(sampleRows):
+        cur.executemany(
+            '''INSERT INTO tbl_TrafficSamples (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated) VALUES (?, ?, ?, ?, ?, ?)''',
+            chunk
+        )
+
+    # the search index triggers are dropped while the audit logs are bulk inserted and the index is rebuilt once at the end,
+    # which is much quicker than updating it row by row. running the schema again puts the triggers back
+    cur.executescript('''DROP TRIGGER IF EXISTS trg_AuditLogs_insert; DROP TRIGGER IF EXISTS trg_AuditLogs_delete;''')
+    names = [ap['name'] for ap in api.aps] + [client['name'] for client in api.clients]
+    cur.executemany('''INSERT OR IGNORE INTO tbl_AuditNames (name) VALUES (?)''', [(name,) for name in names])
+    nameIds = dict(cur.execute('''SELECT name, nameId FROM tbl_AuditNames''').fetchall())
+    step = days * 86400 / max(auditLogs, 1)
+
+    def auditRows():
+        for i in range(auditLogs):
+            dateCreated = dateString(start + timedelta(seconds=i * step))
+            client = rng.choice(api.clients)
+            ap = rng.choice(api.aps)
+            kind = rng.random()
+            if kind < 0.6:
+                yield (auditEventType.CLIENT_ROAMED, ap['id'], client['id'], nameIds[client['name']], nameIds[ap['name']], dateCreated)
+            elif kind < 0.8:
+                yield (auditEventType.CLIENT_DISCONNECTED, None, client['id'], nameIds[client['name']], None, dateCreated)
+            elif kind < 0.95:
+                yield (auditEventType.CLIENT_RECONNECTED, None, client['id'], nameIds[client['name']], None, dateCreated)
+            else:
+                yield (auditEventType.AP_UPDATED, ap['id'], None, nameIds[ap['name']], None, dateCreated)
+
+    for chunk in inChunks(auditRows()):
+        cur.executemany(
+            '''INSERT INTO tbl_AuditLogs (eventType, accessPointId, clientId, subjectNameId, targetNameId, dateCreated) VALUES (?, ?, ?, ?, ?, ?)''',
+            chunk
+        )
+    cur.executescript((projectRoot / 'data' / 'schema.sql').read_text())
+    cur.execute('''INSERT INTO tbl_AuditLogsSearch (tbl_AuditLogsSearch) VALUES ('rebuild')''')
+    con.commit()
+    cur.execute('ANALYZE')
+    con.close()
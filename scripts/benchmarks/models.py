@@ -0,0 +1,144 @@
+# compares the collected data models before and after they became named tuple records (src/backend/models/models.py)
+# before: a model object per row, turned into a dictionary by toDictionary(), which database.py unpacked into a tuple
+# after: one record per row, built straight from the api json and passed to sqlite as the query parameters
+#
+# for each kind of row it measures, over --records rows:
+#   build    api json -> what collectData hands to databaseService (dictionaries before, records after)
+#   params   that -> the tuples given to executemany (nothing to do after)
+#   insert   executemany into an in-memory table, as database.py does it (the records go in through map(tuple, ...),
+#            as sqlite binds a tuple subclass slower than a plain tuple)
+#   memory   bytes held per row by what collectData hands over, measured with tracemalloc
+# every timing is the best of --runs runs
+
+import gc
+import random
+import sqlite3
+import time
+import tracemalloc
+
+from src.backend.models.models import client, trafficSample
+from .common import check
+
+description = "per-row model objects vs named tuple records: build, insert and memory per row"
+
+# the models as they were before, kept here only to compare against
+class _oldDevice():
+    def __init__(self, hostname, ip, mac):
+        self._hostname = hostname
+        self._ipAddress = ip
+        self._macAddress = mac
+
+class _oldClient(_oldDevice):
+    def __init__(self, id, hostname, ip, mac):
+        super().__init__(hostname, ip, mac)
+        self.clientId = id
+        self._active = True
+
+    def toDictionary(self):
+        return {'clientId': self.clientId, 'hostname': self._hostname, 'ipAddress': self._ipAddress, 'macAddress': self._macAddress, 'active': self._active}
+
+class _oldTrafficSample():
+    def __init__(self, id, uptimeSec, txRetriesPct, txRateBps, rxRateBps):
+        self._accessPointId = id
+        self._uptimeSec = uptimeSec
+        self._txRetriesPct = txRetriesPct
+        self._txRateBps = txRateBps
+        self._rxRateBps = rxRateBps
+
+    def toDictionary(self):
+        return {'accessPointId': self._accessPointId, 'uptimeSec': self._uptimeSec, 'txRetriesPct': self._txRetriesPct, 'txRateBps': self._txRateBps, 'rxRateBps': self._rxRateBps}
+
+def makeJSON(records, seed):
+    rng = random.Random(seed)
+    clients = [{'id': f'{i:08x}-0000-4000-8000-000000000000', 'name': f'device-{i}', 'ipAddress': f'10.{i // 65536}.{i // 256 % 256}.{i % 256}',
+                'macAddress': f'06:00:00:{i // 65536:02x}:{i // 256 % 256:02x}:{i % 256:02x}'} for i in range(records)]
+    samples = [(f'ap-{i}', {'uptimeSec': rng.randrange(86400), 'interfaces': {'radios': [{'txRetriesPct': rng.random() * 10}]},
+                            'uplink': {'txRateBps': rng.randrange(10**9), 'rxRateBps': rng.randrange(10**9)}}) for i in range(records)]
+    return clients, samples
+
+# the code paths being compared, each one as (build, params)
+def oldClients(clientsJSON):
+    return [_oldClient(id=device['id'], hostname=device['name'], ip=device.get('ipAddress') or "Unknown", mac=device['macAddress']).toDictionary() for device in clientsJSON]
+
+def oldClientParams(clientData):
+    return [(row['clientId'], row['hostname'], row['ipAddress'], row['macAddress'], row['active']) for row in clientData]
+
+def newClients(clientsJSON):
+    return [client.fromJSON(device) for device in clientsJSON]
+
+def oldSamples(samplesJSON):
+    return [_oldTrafficSample(id=apId, uptimeSec=s['uptimeSec'], txRetriesPct=s['interfaces']['radios'][0]['txRetriesPct'],
+                              txRateBps=s['uplink']['txRateBps'], rxRateBps=s['uplink']['rxRateBps']).toDictionary() for apId, s in samplesJSON]
+
+def oldSampleParams(trafficSamples):
+    return [(row['accessPointId'], row['uptimeSec'], row['txRetriesPct'], row['txRateBps'], row['rxRateBps']) for row in trafficSamples]
+
+def newSamples(samplesJSON):
+    return [trafficSample.fromJSON(apId, s) for apId, s in samplesJSON]
+
+def best(function, argument, runs):
+    times = []
+    for _ in range(runs):
+        gc.collect()
+        start = time.perf_counter()
+        result = function(argument)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def heldBytes(function, argument):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function(argument)
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return held
+
+# makeParams gives the parameters each run, as a map can only be iterated once
+def insertTime(sql, makeParams, runs):
+    times = []
+    for _ in range(runs):
+        con = sqlite3.connect(':memory:')
+        con.execute('CREATE TABLE t (a, b, c, d, e)')
+        start = time.perf_counter()
+        con.executemany(sql, makeParams())
+        con.commit()
+        times.append(time.perf_counter() - start)
+        con.close()
+    return min(times)
+
+def addArguments(parser):
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--runs', type=int, default=5, help='each timing is the best of this many runs')
+
+def run(args):
+    clientsJSON, samplesJSON = makeJSON(args.records, args.seed)
+    sql = 'INSERT INTO t VALUES (?, ?, ?, ?, ?)'
+    cases = [
+        ('clients', clientsJSON, oldClients, oldClientParams, newClients),
+        ('trafficSamples', samplesJSON, oldSamples, oldSampleParams, newSamples)
+    ]
+    results = {}
+    for name, data, oldBuild, oldParams, newBuild in cases:
+        oldBuildSec, oldRows = best(oldBuild, data, args.runs)
+        oldParamsSec, params = best(oldParams, oldRows, args.runs)
+        newBuildSec, newRows = best(newBuild, data, args.runs)
+        check(params == [tuple(row) for row in newRows], f"{name}: the models and the records give sqlite the same parameters")
+        oldInsertSec = insertTime(sql, lambda: params, args.runs)
+        newInsertSec = insertTime(sql, lambda: map(tuple, newRows), args.runs)
+        oldBytes = heldBytes(oldBuild, data)
+        newBytes = heldBytes(newBuild, data)
+        results.update({
+            f'{name}.old.buildMs': round((oldBuildSec + oldParamsSec) * 1000, 3),
+            f'{name}.new.buildMs': round(newBuildSec * 1000, 3),
+            f'{name}.old.insertMs': round(oldInsertSec * 1000, 3),
+            f'{name}.new.insertMs': round(newInsertSec * 1000, 3),
+            f'{name}.old.bytesPerRow': round(oldBytes / args.records),
+            f'{name}.new.bytesPerRow': round(newBytes / args.records)
+        })
+        oldTotal = oldBuildSec + oldParamsSec + oldInsertSec
+        newTotal = newBuildSec + newInsertSec
+        print(f"{name}: build + params {(oldBuildSec + oldParamsSec) / newBuildSec:.1f}x faster, end to end {oldTotal / newTotal:.2f}x faster, "
+              f"{oldBytes / newBytes:.1f}x less memory, 1 object per row instead of 3 (model, dictionary, tuple)")
+    return results
@@ -0,0 +1,85 @@
+# how long the app's startup path takes to import, using python's -X importtime
+# https://docs.python.org/3/using/cmdline.html#cmdoption-X
+# the startup path is everything needed before the pywebview window can be shown: the config and the dashboard API
+# httpx, argon2 and python-dotenv should not be imported by it, they are only loaded once they are actually used
+# (first api request, first login, first time the api key is read)
+#
+# fails if the startup imports take longer than the budget or pull in one of the deferred modules,
+# so it can be used as a check after changing imports
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from .common import projectRoot, check
+
+description = "startup import time, and that httpx, argon2 and python-dotenv stay deferred"
+
+# imports and builds what the window needs, then prints which of the deferred modules got imported anyway
+startupCode = '''
+import sys, json, time
+start = time.perf_counter()
+from src.backend.config import databaseFile
+from src.backend.api.dashboardApi import dashboardAPI
+api = dashboardAPI()
+elapsed = time.perf_counter() - start
+print(json.dumps({'elapsed': elapsed, 'loaded': [name for name in %r if name in sys.modules]}))
+'''
+
+deferredModules = ['httpx', 'argon2', 'dotenv']
+
+# runs python with -X importtime and returns (stdout, list of (module, selfMicroseconds, cumulativeMicroseconds, depth))
+def runImportTime(code):
+    env = dict(os.environ, PYTHONPATH=str(projectRoot))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=projectRoot, env=env, capture_output=True, text=True, check=True
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        # lines look like "import time:       339 |        689 |     lzma", the indent shows how deep the import is
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        selfTime, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(selfTime), int(cumulative), depth))
+    return result.stdout, imports
+
+# time spent in top level imports, each one's cumulative time already includes everything it imported
+def totalImportTime(imports):
+    return sum(cumulative for _, _, cumulative, depth in imports if depth == 0)
+
+def addArguments(parser):
+    parser.add_argument('--budget', type=float, default=50, help='max startup import time in ms')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help='how many of the slowest imports to list')
+
+def run(args):
+    startupTimes = []
+    elapsedTimes = []
+    loaded = set()
+    imports = []
+    for _ in range(args.runs):
+        # the interpreter's own startup imports (site, encodings...) are measured separately and taken off
+        _, baseline = runImportTime('pass')
+        output, imports = runImportTime(startupCode % deferredModules)
+        startupTimes.append((totalImportTime(imports) - totalImportTime(baseline)) / 1000)
+        result = json.loads(output)
+        elapsedTimes.append(result['elapsed'] * 1000)
+        loaded.update(result['loaded'])
+
+    print(f"slowest imports (self time, last run):")
+    baselineNames = {name for name, _, _, _ in runImportTime('pass')[1]}
+    slowest = sorted((i for i in imports if i[0] not in baselineNames), key=lambda i: i[1], reverse=True)[:args.top]
+    for name, selfTime, cumulative, _ in slowest:
+        print(f"  {selfTime / 1000:7.2f} ms  {name} ({cumulative / 1000:.2f} ms including its imports)")
+
+    startupTime = statistics.median(startupTimes)
+    check(not loaded, f"the startup path doesn't import {', '.join(deferredModules)}" + (f" (imported: {', '.join(sorted(loaded))})" if loaded else ""))
+    check(startupTime <= args.budget, f"the startup imports ({startupTime:.1f} ms) are within the {args.budget:.0f} ms budget")
+    return {
+        'startupImportsMs': round(startupTime, 3),
+        'importAndBuildDashboardMs': round(statistics.median(elapsedTimes), 3)
+    }
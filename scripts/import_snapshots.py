@@ -0,0 +1,33 @@
+# loads archived UniFi API snapshots into the database, see src/backend/services/snapshotImport.py for the formats
+# usage:
+#   python scripts/import_snapshots.py archive.jsonl.gz
+#   python scripts/import_snapshots.py snapshots/ --db data/sites/office.db --batch 500
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.backend.config import databaseFile, SAMPLE_RUNS
+from src.backend.services.snapshotImport import snapshotImporter, readSnapshotFolder, readSnapshotArchive
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='a folder of snapshot folders, or a .jsonl / .jsonl.gz archive')
+    parser.add_argument('--db', default=str(databaseFile), help='database to import into, it must already have the schema (scripts/init_db.py)')
+    parser.add_argument('--batch', type=int, default=200, help='snapshots written per transaction')
+    args = parser.parse_args()
+
+    snapshots = readSnapshotFolder(args.source) if os.path.isdir(args.source) else readSnapshotArchive(args.source)
+    result = snapshotImporter(dbPath=args.db, batchSnapshots=args.batch, sampleRuns=SAMPLE_RUNS).importSnapshots(snapshots)
+    print(result['message'])
+    if result['successful']:
+        print(f"{result['data']['rowsPerSecond']:.0f} rows per second")
+    for error in result['errors']:
+        print(f"  {error}")
+    sys.exit(0 if result['successful'] else 1)
+
+if __name__ == "__main__":
+    main()
@@ -5,9 +5,87 @@ import sqlite3
 # For managing file paths without hardcoding in paths specific to my computer, I will use the pathlib library.
 # I followed https://coderivers.org/blog/file-path-python/ to learn how to use it.
 from pathlib import Path
+import re
 
-def init_db():
-    dbPath = Path(__file__).parent.parent / 'data' / 'database.db'
+# audit logs used to be stored as full sentences, these patterns turn the old sentences back into event types and names
+# so an existing database can be moved over to the new tbl_AuditLogs layout (the names match tbl_AuditEventTypes)
+oldAuditLogPatterns = [
+    ('AP_ADDED', re.compile(r'^Access point (.*) was added to the network\.$')),
+    ('AP_UPDATED', re.compile(r'^Access point (.*) was updated\.$')),
+    ('AP_RESTARTED', re.compile(r'^Access point (.*) was restarted\.$')),
+    ('BROADCAST_ADDED', re.compile(r'^Wifi broadcast (.*) was added to the network\.$')),
+    ('BROADCAST_UPDATED', re.compile(r'^Wifi broadcast (.*) was updated\.$')),
+    ('CLIENT_ROAMED', re.compile(r'^Client (.*) roamed to AP (.*)\.$')),
+    ('CLIENT_NEW', re.compile(r'^New client (.*) connected to the network\.$')),
+    ('CLIENT_RECONNECTED', re.compile(r'^Client (.*) connected to the network again\.$')),
+    ('CLIENT_DISCONNECTED', re.compile(r'^Client (.*) disconnected from the network\.$')),
+    ('SSID_HIDDEN', re.compile(r'^SSID broadcasting for (.*) has been disabled\.$')),
+    ('SSID_SHOWN', re.compile(r'^SSID broadcasting for (.*) has been enabled\.$')),
+]
+
+# if tbl_AuditLogs still has the old logMessage column, it is renamed out of the way so the schema can create the new one
+# returns True if there are old logs to copy over with copyOldAuditLogs() after the schema has run
+def prepareAuditLogMigration(cursor):
+    columns = [row[1] for row in cursor.execute('''PRAGMA table_info(tbl_AuditLogs)''').fetchall()]
+    if 'logMessage' not in columns:
+        return False
+    # the old search index, triggers and indexes all belong to the old table, so they are removed and recreated by the schema
+    cursor.executescript('''
+        DROP TRIGGER IF EXISTS trg_AuditLogs_insert;
+        DROP TRIGGER IF EXISTS trg_AuditLogs_delete;
+        DROP TRIGGER IF EXISTS trg_AuditLogs_update;
+        DROP TABLE IF EXISTS tbl_AuditLogsSearch;
+        DROP INDEX IF EXISTS idx_AuditLogs_dateCreated;
+        DROP INDEX IF EXISTS idx_AuditLogs_accessPointId;
+        DROP INDEX IF EXISTS idx_AuditLogs_clientId;
+        ALTER TABLE tbl_AuditLogs RENAME TO tbl_AuditLogs_old;
+    ''')
+    return True
+
+def copyOldAuditLogs(cursor):
+    eventTypes = dict(cursor.execute('''SELECT eventName, eventType FROM tbl_AuditEventTypes''').fetchall())
+    lastId = 0
+    while True:
+        # copied 10000 at a time so a large table doesn't have to fit in memory
+        rows = cursor.execute(
+            '''SELECT auditLogId, accessPointId, clientId, dateCreated, logMessage FROM tbl_AuditLogs_old WHERE auditLogId > ? ORDER BY auditLogId LIMIT 10000''',
+            (lastId,)
+        ).fetchall()
+        if not rows:
+            break
+        newRows = []
+        for auditLogId, accessPointId, clientId, dateCreated, logMessage in rows:
+            eventType, names = eventTypes['MESSAGE'], (logMessage, None) # anything unrecognised is kept as free text
+            for eventName, pattern in oldAuditLogPatterns:
+                match = pattern.match(logMessage)
+                if match:
+                    eventType, names = eventTypes[eventName], (match.groups() + (None,))[:2]
+                    break
+            newRows.append((auditLogId, eventType, accessPointId, clientId, dateCreated, names[0], names[1]))
+
+        cursor.executemany(
+            '''INSERT OR IGNORE INTO tbl_AuditNames (name) VALUES (?)''',
+            [(name,) for row in newRows for name in row[5:] if name is not None]
+        )
+        cursor.executemany(
+            '''INSERT INTO tbl_AuditLogs (auditLogId, eventType, accessPointId, clientId, dateCreated, subjectNameId, targetNameId)
+            VALUES (?, ?, ?, ?, ?, (SELECT nameId FROM tbl_AuditNames WHERE name = ?), (SELECT nameId FROM tbl_AuditNames WHERE name = ?))''',
+            newRows
+        )
+        lastId = rows[-1][0]
+    cursor.execute('''DROP TABLE tbl_AuditLogs_old''')
+
+# tbl_TrafficSamples got the endDate and sampleCount columns for runs of samples, an existing table gets them added
+# every row already there is a single sample, which is what the defaults say
+def addSampleRunColumns(cursor):
+    columns = [row[1] for row in cursor.execute('''PRAGMA table_info(tbl_TrafficSamples)''').fetchall()]
+    if columns and 'sampleCount' not in columns:
+        cursor.execute('''ALTER TABLE tbl_TrafficSamples ADD COLUMN endDate DATETIME''')
+        cursor.execute('''ALTER TABLE tbl_TrafficSamples ADD COLUMN sampleCount INT NOT NULL DEFAULT 1''')
+
+# dbPath can be given to set up a different database file with the same schema, eg a scratch database for benchmarks
+def init_db(dbPath=None):
+    dbPath = dbPath or Path(__file__).parent.parent / 'data' / 'database.db'
     schemaPath = Path(__file__).parent.parent / 'data' / 'schema.sql'
 
     #reading the schema.sql file I used to define the structure of the database for the solution
@@ -19,7 +97,20 @@ def init_db():
     # I used exception handling here because there may be errors in the schema.sql file
     try:
         cursor = connection.cursor() #database cursor is used to execute SQL statements and fetch results from SQL queries.
+        # checking if the audit log search index exists before running the schema
+        searchIndexExists = cursor.execute(
+            '''SELECT COUNT(*) FROM sqlite_master WHERE name = 'tbl_AuditLogsSearch' '''
+        ).fetchone()[0]
+        migrateAuditLogs = prepareAuditLogMigration(cursor)
+        addSampleRunColumns(cursor)
         cursor.executescript(schema) # executing the sql code I wrote in schema.sql
+        if migrateAuditLogs:
+            # the search index triggers index the old logs as they are copied over
+            copyOldAuditLogs(cursor)
+        elif not searchIndexExists:
+            # the triggers only index new audit logs, so when the index is first added to an existing database
+            # I rebuild it once so the older logs can be searched too, https://www.sqlite.org/fts5.html#the_rebuild_command
+            cursor.execute('''INSERT INTO tbl_AuditLogsSearch (tbl_AuditLogsSearch) VALUES ('rebuild')''')
         connection.commit() # commits the actions executed to the database, so they are permanent now
 
         # for testing (refer to section 4):
@@ -0,0 +1,57 @@
+# runs the collection in the background until stopped with ctrl+c (or SIGTERM), see src/backend/services/collectionScheduler.py
+# usage:
+#   python scripts/run_collector.py
+#   python scripts/run_collector.py --samples 60 --topology 600 --broadcasts 3600 --overlap skip --budget 0.5
+
+import argparse
+import signal
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.backend.config import COLLECT_CADENCES, COLLECT_OVERLAP, COLLECT_BUDGET_FRACTION, CONSOLE_IP, API_KEY, SITE_ID, PIPELINE_BATCH_SIZE, SAMPLE_RUNS
+from src.backend.services.unifi_api import APIclient
+from src.backend.services.collectData import collectData
+from src.backend.services.samplingScheduler import samplingScheduler
+from src.backend.services.database import databaseService
+from src.backend.services.auditQueue import getAuditLogQueue
+from src.backend.services.writeSpool import writeSpool
+from src.backend.services.collectionScheduler import collectionScheduler
+
+def main():
+    parser = argparse.ArgumentParser()
+    for name, cadence in COLLECT_CADENCES.items():
+        parser.add_argument(f'--{name}', type=float, default=cadence, help=f'seconds between {name} runs (default {cadence})')
+    parser.add_argument('--overlap', choices=['coalesce', 'skip'], default=COLLECT_OVERLAP, help='what to do when a run overruns its next start')
+    parser.add_argument('--budget', type=float, default=COLLECT_BUDGET_FRACTION, help='fraction of its cadence each run has before it is cut short, 0 for no deadline')
+    args = parser.parse_args()
+
+    spool = writeSpool()
+    service = databaseService(collectData(APIclient(consoleIp=CONSOLE_IP, apiKey=API_KEY, siteId=SITE_ID), sampler=samplingScheduler()), auditQueue=getAuditLogQueue(), pipelineBatchSize=PIPELINE_BATCH_SIZE, spool=spool, sampleRuns=SAMPLE_RUNS)
+    def overrun(report):
+        print(f"  {report['job']} went {report['overrunSec']:.1f}s past its {report['budget']:.0f}s deadline"
+              + (f", stuck in {report['where'][0]}" if report['where'] else ""))
+
+    scheduler = collectionScheduler(service, cadences={name: getattr(args, name) for name in COLLECT_CADENCES}, overlap=args.overlap,
+                                    budgetFraction=args.budget or None, onOverrun=overrun)
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    scheduler.start()
+    print("Collecting, press ctrl+c to stop.")
+    while not stopped.wait(60):
+        for name, status in scheduler.getStatus().items():
+            print(f"  {name}: {status['runs']} runs, {status['overruns']} overruns, last lag {status['lastLag'] or 0:.2f}s, "
+                  f"last run {'ok' if status['lastSuccessful'] else 'failed'}"
+                  + (f", {', '.join(status['lastIncomplete'])} incomplete" if status['lastIncomplete'] else ""))
+
+    print("Stopping, waiting for the current job to finish...")
+    scheduler.stop()
+    spool.close()
+    getAuditLogQueue().close()
+
+if __name__ == "__main__":
+    main()
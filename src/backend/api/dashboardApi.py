@@ -0,0 +1,294 @@
+import sqlite3
+import threading
+import time
+from src.backend.config import databaseFile, CLIENT_SEARCH_LIMIT
+from ..services.user_service import UserService
+from ..services.session_service import SessionService
+from ..services.sampleRuns import expandSamples
+from ..services.dashboardSummary import dashboardSummary
+from ..services.clientSearch import clientSearch
+
+# the object given to pywebview as js_api, so the dashboard's javascript can call these methods
+# https://pywebview.flowrl.com/guide/interdomain.html (methods starting with _ are not exposed to javascript)
+#
+# sending every access point, client and sample to the webview on each refresh would mean serialising the whole site
+# every few seconds, so instead the frontend asks for a snapshot once, then only for what changed since the version it has:
+#   snapshot = api.getSnapshot(token)                       -> everything, plus its version number
+#   changes = api.getChanges(token, snapshot.data.version) -> only added/changed/removed rows since that version
+# tables are sent as columns ({'hostname': [...], 'ipAddress': [...]}) so each field name is only sent once
+# runs of unchanged samples (services/sampleRuns.py) are sent as the samples they stand for, sharing the run's sampleId
+class dashboardAPI:
+    # the fields sent for each table, in the same order as the SELECT queries in _readTables
+    apFields = ['accessPointId', 'hostname', 'apState', 'ipAddress', 'macAddress']
+    clientFields = ['clientId', 'hostname', 'ipAddress', 'macAddress', 'active', 'accessPointId']
+    sampleFields = ['sampleId', 'accessPointId', 'uptimeSec', 'txRetriesPct', 'txRateBps', 'rxRateBps', 'dateCreated']
+
+    # refreshInterval is how often the database is checked for changes at most, unless notifyDataUpdated() is called
+    # historyVersions is how many versions back getChanges() can go before the frontend has to take a new snapshot
+    def __init__(self, refreshInterval=2.0, sampleWindow=3600, historyVersions=100, dbPath=databaseFile):
+        self._dbPath = dbPath
+        self._users = UserService(dbPath=dbPath)
+        self._sessions = SessionService(dbPath=dbPath)
+        self._summary = dashboardSummary(dbPath=dbPath)
+        # kept up to date from the client rows each refresh finds have changed, so it never reads tbl_Clients itself
+        self._clientSearch = clientSearch(dbPath=dbPath)
+        self._refreshInterval = refreshInterval
+        self._sampleWindow = sampleWindow # seconds of traffic samples included in a snapshot
+        self._historyVersions = historyVersions
+        self._lock = threading.Lock() # pywebview can call these methods from more than one thread
+
+        self._version = 0
+        self._oldestVersion = 0 # getChanges() can't answer for versions older than this
+        self._lastRefresh = None
+        self._dirty = True
+        # id -> [addedVersion, changedVersion, row tuple]
+        self._rows = {'aps': {}, 'clients': {}}
+        # id -> version it was removed in, kept for historyVersions versions
+        self._removed = {'aps': {}, 'clients': {}}
+        # version -> highest sampleId at that version, samples are only ever added so this is all that is needed
+        # (a run that grows is written again with a new sampleId)
+        self._sampleMarks = {0: 0}
+        # accessPointId -> [(version, dateCreated, sampleCount), ...] the AP's latest sample row at each version it changed
+        # only the latest row of an AP can grow into a run, so this says how many of a run's samples a version already had
+        self._latestSamples = {}
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    # turns a list of row tuples into one list per field
+    def _toColumns(self, fields, rows):
+        columns = {field: [] for field in fields}
+        for row in rows:
+            for field, value in zip(fields, row):
+                columns[field].append(value)
+        return columns
+
+    def _readTables(self):
+        cur, con = self._dbConnection()
+        try:
+            aps = cur.execute(
+                '''SELECT accessPointId, hostname, apState, ipAddress, macAddress FROM tbl_APdevices'''
+            ).fetchall()
+            clients = cur.execute(
+                '''SELECT c.clientId, c.hostname, c.ipAddress, c.macAddress, c.active, con.accessPointId
+                FROM tbl_Clients c LEFT JOIN tbl_Connections con ON con.clientId = c.clientId'''
+            ).fetchall()
+            # samples are only ever added, so the newest sampleId is enough to know which ones a version includes
+            # (the samples themselves are read when they are sent, in getSnapshot and getChanges)
+            # the sample rows added since the last version are read for the AP's latest rows, the first time only the
+            # latest row of each AP is needed
+            lastMark = self._sampleMarks[self._version]
+            if lastMark:
+                newSamples = cur.execute(
+                    '''SELECT sampleId, accessPointId, dateCreated, sampleCount FROM tbl_TrafficSamples WHERE sampleId > ? ORDER BY sampleId''',
+                    (lastMark,)
+                ).fetchall()
+            else:
+                newSamples = cur.execute(
+                    '''SELECT sampleId, accessPointId, dateCreated, sampleCount FROM tbl_TrafficSamples
+                    WHERE sampleId IN (SELECT MAX(sampleId) FROM tbl_TrafficSamples GROUP BY accessPointId) ORDER BY sampleId'''
+                ).fetchall()
+            lastSampleId = newSamples[-1][0] if newSamples else lastMark
+            return aps, clients, lastSampleId, newSamples
+        finally:
+            con.close()
+
+    # compares the tables with the rows the frontend has been sent, and starts a new version if anything changed
+    def _refresh(self):
+        aps, clients, lastSampleId, newSamples = self._readTables()
+        newVersion = self._version + 1
+        changed = lastSampleId > self._sampleMarks[self._version]
+
+        changedClients = []
+        removedClients = []
+        for table, rows in (('aps', aps), ('clients', clients)):
+            current = self._rows[table]
+            seen = set()
+            for row in rows:
+                rowId = row[0]
+                seen.add(rowId)
+                entry = current.get(rowId)
+                if entry is None:
+                    current[rowId] = [newVersion, newVersion, row]
+                    self._removed[table].pop(rowId, None)
+                    changed = True
+                elif entry[2] != row:
+                    entry[1] = newVersion
+                    entry[2] = row
+                    changed = True
+                else:
+                    continue
+                if table == 'clients':
+                    changedClients.append(row)
+            for rowId in [rowId for rowId in current if rowId not in seen]:
+                del current[rowId]
+                self._removed[table][rowId] = newVersion
+                changed = True
+                if table == 'clients':
+                    removedClients.append(rowId)
+
+        # the client rows start with the same fields as the search index takes
+        if not self._clientSearch.isLoaded():
+            self._clientSearch.load(rows=clients)
+        else:
+            self._clientSearch.update(changedClients)
+            self._clientSearch.remove(removedClients)
+
+        if changed:
+            self._version = newVersion
+            self._sampleMarks[newVersion] = lastSampleId
+            for sampleId, accessPointId, dateCreated, sampleCount in newSamples:
+                self._latestSamples.setdefault(accessPointId, []).append((newVersion, dateCreated, sampleCount))
+            # forget versions that are too old to ask for changes from
+            self._oldestVersion = max(self._oldestVersion, newVersion - self._historyVersions)
+            for version in [version for version in self._sampleMarks if version < self._oldestVersion]:
+                del self._sampleMarks[version]
+            # an AP's latest row at the oldest version is kept, as it is what every version since then had
+            for history in self._latestSamples.values():
+                while len(history) > 1 and history[1][0] <= self._oldestVersion:
+                    del history[0]
+            for removed in self._removed.values():
+                for rowId in [rowId for rowId, version in removed.items() if version <= self._oldestVersion]:
+                    del removed[rowId]
+        self._lastRefresh = time.monotonic()
+        self._dirty = False
+
+    def _refreshIfNeeded(self):
+        if self._dirty or self._lastRefresh is None or time.monotonic() - self._lastRefresh >= self._refreshInterval:
+            self._refresh()
+
+    # how many of a sample row's samples the frontend already had at version, more than 0 only for a run that has grown
+    def _knownSamples(self, accessPointId, dateCreated, version):
+        for rowVersion, rowDate, sampleCount in reversed(self._latestSamples.get(accessPointId, [])):
+            if rowVersion <= version:
+                return sampleCount if rowDate == dateCreated else 0
+        return 0
+
+    def _checkSession(self, token):
+        return self._sessions.validateSession(token)
+
+    # called by the collector after it writes new data, so the next request refreshes straight away
+    def notifyDataUpdated(self):
+        self._dirty = True
+
+    def login(self, username, password):
+        return self._users.login(username, password)
+
+    def logout(self, token):
+        return self._users.logout(token)
+
+    # the counts for the overview page (APs by state, active clients, clients per AP, SSIDs, the latest sample time)
+    # a single row kept up to date by the database, so it can be asked for as often as the page likes
+    def getSummary(self, token):
+        session = self._checkSession(token)
+        if not session['successful']:
+            return session
+        return self._summary.getSummary()
+
+    # type-ahead search for a client by hostname, MAC or IP address (or a subnet), see services/clientSearch.py
+    def searchClients(self, token, query, limit=CLIENT_SEARCH_LIMIT, activeOnly=False):
+        session = self._checkSession(token)
+        if not session['successful']:
+            return session
+        with self._lock:
+            self._refreshIfNeeded()
+        return self._clientSearch.search(query, limit=limit, activeOnly=activeOnly)
+
+    # everything the dashboard needs, used when the page first loads or when getChanges() asks for a reset
+    def getSnapshot(self, token):
+        session = self._checkSession(token)
+        if not session['successful']:
+            return session
+        try:
+            with self._lock:
+                self._refreshIfNeeded()
+                cutoff = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(time.time() - self._sampleWindow))
+                cur, con = self._dbConnection()
+                try:
+                    rows = cur.execute(
+                        '''SELECT sampleId, accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount
+                        FROM tbl_TrafficSamples WHERE coalesce(endDate, dateCreated) >= ? AND sampleId <= ?''',
+                        (cutoff, self._sampleMarks[self._version])
+                    ).fetchall()
+                finally:
+                    con.close()
+                # a run can start before the cutoff, and runs that grew are later in sampleId order than when they started
+                samples = sorted((sample for sample in expandSamples(rows, since=cutoff) if sample[6] >= cutoff), key=lambda sample: (sample[6], sample[0]))
+                return {
+                    "successful": True,
+                    "message": "Snapshot loaded.",
+                    "errors": [],
+                    "data": {
+                        'version': self._version,
+                        'aps': self._toColumns(self.apFields, [entry[2] for entry in self._rows['aps'].values()]),
+                        'clients': self._toColumns(self.clientFields, [entry[2] for entry in self._rows['clients'].values()]),
+                        'samples': self._toColumns(self.sampleFields, samples)
+                    }
+                }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error loading the dashboard.",
+                "errors": [str(error)]
+            }
+
+    # only what changed after sinceVersion, if sinceVersion is too old the frontend is told to take a new snapshot
+    def getChanges(self, token, sinceVersion):
+        session = self._checkSession(token)
+        if not session['successful']:
+            return session
+        try:
+            with self._lock:
+                self._refreshIfNeeded()
+                if sinceVersion < self._oldestVersion or sinceVersion > self._version:
+                    return {
+                        "successful": True,
+                        "message": "Version is too old, a new snapshot is needed.",
+                        "errors": [],
+                        "data": {'version': self._version, 'reset': True}
+                    }
+
+                data = {'version': self._version, 'reset': False}
+                for table, fields in (('aps', self.apFields), ('clients', self.clientFields)):
+                    added = []
+                    changed = []
+                    for addedVersion, changedVersion, row in self._rows[table].values():
+                        if addedVersion > sinceVersion:
+                            added.append(row)
+                        elif changedVersion > sinceVersion:
+                            changed.append(row)
+                    data[table] = {
+                        'added': self._toColumns(fields, added),
+                        'changed': self._toColumns(fields, changed),
+                        'removed': [rowId for rowId, version in self._removed[table].items() if version > sinceVersion]
+                    }
+
+                samples = []
+                if self._sampleMarks[self._version] > self._sampleMarks[sinceVersion]:
+                    cur, con = self._dbConnection()
+                    try:
+                        rows = cur.execute(
+                            '''SELECT sampleId, accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount
+                            FROM tbl_TrafficSamples WHERE sampleId > ? AND sampleId <= ? ORDER BY sampleId''',
+                            (self._sampleMarks[sinceVersion], self._sampleMarks[self._version])
+                        ).fetchall()
+                    finally:
+                        con.close()
+                    # only the samples a run has gained since sinceVersion, the frontend has the ones before
+                    for row in rows:
+                        samples.extend(expandSamples([row])[self._knownSamples(row[1], row[6], sinceVersion):])
+                data['samples'] = self._toColumns(self.sampleFields, samples)
+                return {
+                    "successful": True,
+                    "message": "Changes loaded.",
+                    "errors": [],
+                    "data": data
+                }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error loading dashboard changes.",
+                "errors": [str(error)]
+            }
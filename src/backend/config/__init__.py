@@ -1,13 +1,69 @@
 # loads configuration from .\config.py
 
+from . import config as _config
 from .config import (
-    API_KEY,
-    CONSOLE_IP,
-    SITE_ID,
     projectRoot,
     dataFolder,
     databaseFile,
-    FETCH_INTERVAL
+    schemaFile,
+    sitesFile,
+    sitesFolder,
+    FETCH_INTERVAL,
+    PIPELINE_BATCH_SIZE,
+    PIPELINE_QUEUE_SIZE,
+    SPOOL_SEGMENT_BYTES,
+    SPOOL_SYNC_BYTES,
+    SPOOL_RETRY_DELAY,
+    SPOOL_RETRY_MAX_DELAY,
+    COLLECT_CADENCES,
+    COLLECT_JITTER,
+    COLLECT_OVERLAP,
+    COLLECT_BUDGET_FRACTION,
+    API_REQUEST_TIMEOUT,
+    API_MIN_REQUEST_TIME,
+    DEADLINE_WATCHDOG_GRACE,
+    DEADLINE_WATCHDOG_INTERVAL,
+    COLLECTOR_STATUS_INTERVAL,
+    COLLECTOR_RESTART_DELAY,
+    COLLECTOR_RESTART_MAX_DELAY,
+    COLLECTOR_AUDIT_FLUSH_TIMEOUT,
+    SAMPLE_MIN_INTERVAL,
+    SAMPLE_MAX_INTERVAL,
+    SAMPLE_REQUEST_BUDGET,
+    SAMPLE_BUSY_BPS,
+    SAMPLE_IDLE_BPS,
+    SAMPLE_RETRY_THRESHOLD,
+    SAMPLE_CHANGE_RATIO,
+    SAMPLE_RUNS,
+    SAMPLE_RUN_RATE_TOLERANCE,
+    SAMPLE_RUN_RETRY_TOLERANCE,
+    SAMPLE_RUN_SLOT_TOLERANCE,
+    SAMPLE_RUN_INTERVAL_STEP,
+    SESSION_TTL,
+    SESSION_CACHE_SIZE,
+    SESSION_TOUCH_INTERVAL,
+    AUDIT_BATCH_SIZE,
+    AUDIT_FLUSH_INTERVAL,
+    AUDIT_QUEUE_SIZE,
+    AUDIT_ENQUEUE_TIMEOUT,
+    AUDIT_WRITE_RETRIES,
+    AUDIT_CLOSE_TIMEOUT,
+    PING_PONG_WINDOW,
+    PING_PONG_WINDOW,
+    CLIENT_SEARCH_LIMIT,
+    CLIENT_SEARCH_REBUILD_RATIO,
+    BULK_WAVE_FRACTION,
+    BULK_CONCURRENCY,
+    BULK_ONLINE_TIMEOUT,
+    BULK_POLL_INTERVAL,
+    BULK_RESTART_GRACE,
+    METRICS_ENABLED,
+    METRICS_BUCKETS,
+    METRICS_FILE,
+    METRICS_PORT,
+    PROFILE_FOLDER,
+    PROFILE_SAMPLE_INTERVAL,
+    PROFILE_TOP_N
 )
 
 __all__ = [
@@ -17,5 +73,70 @@ __all__ = [
     'projectRoot',
     'dataFolder',
     'databaseFile',
-    'FETCH_INTERVAL'
-]
\ No newline at end of file
+    'schemaFile',
+    'sitesFile',
+    'sitesFolder',
+    'FETCH_INTERVAL',
+    'PIPELINE_BATCH_SIZE',
+    'PIPELINE_QUEUE_SIZE',
+    'SPOOL_SEGMENT_BYTES',
+    'SPOOL_SYNC_BYTES',
+    'SPOOL_RETRY_DELAY',
+    'SPOOL_RETRY_MAX_DELAY',
+    'COLLECT_CADENCES',
+    'COLLECT_JITTER',
+    'COLLECT_OVERLAP',
+    'COLLECT_BUDGET_FRACTION',
+    'API_REQUEST_TIMEOUT',
+    'API_MIN_REQUEST_TIME',
+    'DEADLINE_WATCHDOG_GRACE',
+    'DEADLINE_WATCHDOG_INTERVAL',
+    'COLLECTOR_STATUS_INTERVAL',
+    'COLLECTOR_RESTART_DELAY',
+    'COLLECTOR_RESTART_MAX_DELAY',
+    'COLLECTOR_AUDIT_FLUSH_TIMEOUT',
+    'SAMPLE_MIN_INTERVAL',
+    'SAMPLE_MAX_INTERVAL',
+    'SAMPLE_REQUEST_BUDGET',
+    'SAMPLE_BUSY_BPS',
+    'SAMPLE_IDLE_BPS',
+    'SAMPLE_RETRY_THRESHOLD',
+    'SAMPLE_CHANGE_RATIO',
+    'SAMPLE_RUNS',
+    'SAMPLE_RUN_RATE_TOLERANCE',
+    'SAMPLE_RUN_RETRY_TOLERANCE',
+    'SAMPLE_RUN_SLOT_TOLERANCE',
+    'SAMPLE_RUN_INTERVAL_STEP',
+    'SESSION_TTL',
+    'SESSION_CACHE_SIZE',
+    'SESSION_TOUCH_INTERVAL',
+    'AUDIT_BATCH_SIZE',
+    'AUDIT_FLUSH_INTERVAL',
+    'AUDIT_QUEUE_SIZE',
+    'AUDIT_ENQUEUE_TIMEOUT',
+    'AUDIT_WRITE_RETRIES',
+    'AUDIT_CLOSE_TIMEOUT',
+    'PING_PONG_WINDOW',
+    'PING_PONG_WINDOW',
+    'CLIENT_SEARCH_LIMIT',
+    'CLIENT_SEARCH_REBUILD_RATIO',
+    'BULK_WAVE_FRACTION',
+    'BULK_CONCURRENCY',
+    'BULK_ONLINE_TIMEOUT',
+    'BULK_POLL_INTERVAL',
+    'BULK_RESTART_GRACE',
+    'METRICS_ENABLED',
+    'METRICS_BUCKETS',
+    'METRICS_FILE',
+    'METRICS_PORT',
+    'PROFILE_FOLDER',
+    'PROFILE_SAMPLE_INTERVAL',
+    'PROFILE_TOP_N'
+]
+
+# API_KEY, CONSOLE_IP, SITE_ID and SITES are looked up from config.py when they are first used, so importing the config
+# doesn't read the .env file, https://peps.python.org/pep-0562/
+def __getattr__(name):
+    if name in _config.envSettings or name == 'SITES':
+        return getattr(_config, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -3,33 +3,150 @@
 
 import os
 from pathlib import Path
-# to manage environment variables, I will use the python-dotenv library, following https://www.geeksforgeeks.org/python/using-python-environment-variables-with-python-dotenv/
-from dotenv import load_dotenv
 
 # set up the project's root, the data folder file path, and the database file path
 projectRoot = Path(__file__).parent.parent.parent.parent
 dataFolder = projectRoot / 'data'
 databaseFile = dataFolder / 'database.db'
+schemaFile = dataFolder / 'schema.sql'
 
-# load environment vars from .env file
 envPath = projectRoot / '.env'
-load_dotenv(envPath)
+# the settings that come from the .env file
+envSettings = ['API_KEY', 'CONSOLE_IP', 'SITE_ID']
+_envLoaded = False
+
+# load environment vars from .env file
+# this used to happen as soon as the config was imported, but most of the app (the window, the dashboard, logging in)
+# never needs the api key, so now it only happens the first time one of the env settings is asked for
+def _loadEnv():
+    global _envLoaded
+    if not _envLoaded:
+        # to manage environment variables, I will use the python-dotenv library, following https://www.geeksforgeeks.org/python/using-python-environment-variables-with-python-dotenv/
+        from dotenv import load_dotenv
+        load_dotenv(envPath)
+        _envLoaded = True
 
 # get the API key and Site ID from the env vars
 # the site id is used by UniFi to specify the specific network 'site' I want to retrieve data from; this is retrieved from the UniFi dashboard
-API_KEY = os.getenv('API_KEY')
-CONSOLE_IP = os.getenv('CONSOLE_IP')
-SITE_ID = os.getenv('SITE_ID')
+# python calls this module level __getattr__ for names that aren't defined in the file, https://peps.python.org/pep-0562/
+# so config.API_KEY still works, it just loads the .env file the first time
+def __getattr__(name):
+    if name in envSettings:
+        _loadEnv()
+        value = os.getenv(name)
+        globals()[name] = value # saved so the next lookup doesn't come back here
+        return value
+    if name == 'SITES':
+        value = _loadSites()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# the consoles and sites to collect from, used by the multi-site collector (services/multiSite.py)
+# listed in sites.json in the project root, each one as {"name": ..., "consoleIp": ..., "apiKey": ..., "siteId": ...}
+# without a sites.json there is just the one site from the .env file, which keeps using the main database
+sitesFile = projectRoot / 'sites.json'
+sitesFolder = dataFolder / 'sites' # each site's own database (shard) goes in here, named after the site
+
+def _loadSites():
+    if sitesFile.exists():
+        import json
+        with open(sitesFile) as file:
+            return json.load(file)
+    return [{'name': 'default', 'consoleIp': __getattr__('CONSOLE_IP'), 'apiKey': __getattr__('API_KEY'), 'siteId': __getattr__('SITE_ID')}]
 
 # constants that will be used for the database
 FETCH_INTERVAL = 300 #time between making API calls for new data - 5 mins
 
+# constants for pipelined collection (databaseService pipelineBatchSize), off unless a batch size is passed in
+PIPELINE_BATCH_SIZE = 50 # APs or clients fetched per batch, each batch is written while the next is fetched
+PIPELINE_QUEUE_SIZE = 4 # max fetched batches waiting to be written, the fetching waits once this many are waiting
+
+# constants for the write spool (services/writeSpool.py), where traffic samples are kept while the database can't be written to
+SPOOL_SEGMENT_BYTES = 4 * 1024 * 1024 # a segment file is finished and a new one started once it is this big
+SPOOL_SYNC_BYTES = 1024 * 1024 # appends are fsynced together at the end of each push, or once this much is waiting to be
+SPOOL_RETRY_DELAY = 5 # seconds before the database is tried again after the spool failed to replay, doubled for each failure...
+SPOOL_RETRY_MAX_DELAY = 300 # ...up to this
+
+# constants for the background collection scheduler (services/collectionScheduler.py)
+# seconds between runs of each part of the collection, samples often, clients and topology every FETCH_INTERVAL, broadcasts rarely
+COLLECT_CADENCES = {'samples': 30, 'topology': FETCH_INTERVAL, 'broadcasts': 1800}
+COLLECT_JITTER = 0.1 # each run starts up to this fraction of its cadence late, so runs don't all hit the console at once
+COLLECT_OVERLAP = 'coalesce' # when a run overruns its next start: 'coalesce' runs once straight away, 'skip' waits for the next start
+
+# constants for the collection deadlines (services/deadline.py)
+COLLECT_BUDGET_FRACTION = 0.8 # each scheduled run has this fraction of its cadence to finish in, so it's done before its next slot
+API_REQUEST_TIMEOUT = 5.0 # the most time any one request to the console is given (httpx's default), less once the run has less left
+API_MIN_REQUEST_TIME = 0.5 # once a run has less than this left no more requests are sent, what was fetched is written
+DEADLINE_WATCHDOG_GRACE = 5 # the watchdog reports a run still going this many seconds after its deadline...
+DEADLINE_WATCHDOG_INTERVAL = 1 # ...checking every this many seconds
+
+# constants for the collector worker process (services/collectorProcess.py)
+COLLECTOR_STATUS_INTERVAL = 5 # seconds between the worker sending its status to the UI process
+COLLECTOR_RESTART_DELAY = 1 # seconds before restarting a worker that crashed, doubled for each crash in a row...
+COLLECTOR_RESTART_MAX_DELAY = 60 # ...up to this, and back to COLLECTOR_RESTART_DELAY once a worker has run this long
+COLLECTOR_AUDIT_FLUSH_TIMEOUT = 5 # seconds the worker waits for a job's audit logs to be written before telling the UI the job is done
+
+# constants for the adaptive traffic sampling (services/samplingScheduler.py), intervals are in seconds
+SAMPLE_MIN_INTERVAL = 30 # busy or struggling APs are sampled this often at most...
+SAMPLE_MAX_INTERVAL = 1800 # ...and idle or offline ones at least this often
+SAMPLE_REQUEST_BUDGET = 50 # max statistics requests sent to the console per collection
+SAMPLE_BUSY_BPS = 20000000 # an AP moving more than this (tx + rx) is busy
+SAMPLE_IDLE_BPS = 100000 # and less than this is idle
+SAMPLE_RETRY_THRESHOLD = 15 # a tx retry % at or above this counts as anomalous
+SAMPLE_CHANGE_RATIO = 1.0 # so does throughput changing by more than this fraction since the last sample
+
+# constants for storing unchanged traffic samples as runs (services/sampleRuns.py)
+SAMPLE_RUNS = False # store unchanged traffic samples as runs, the collector passes this to databaseService (plain rows when False)
+SAMPLE_RUN_RATE_TOLERANCE = 0.05 # a sample continues a run while its tx and rx rates are within this fraction of the run's...
+SAMPLE_RUN_RETRY_TOLERANCE = 1.0 # ...and its tx retry % is within this many points of the run's
+SAMPLE_RUN_SLOT_TOLERANCE = 0.25 # and it lands within this fraction of the run's interval from the run's next slot
+SAMPLE_RUN_INTERVAL_STEP = 10 # a run's interval is rounded to a multiple of this many seconds, so the collection's jitter doesn't make it drift
+
+# constants for the login sessions
+SESSION_TTL = 1800 # a session expires after 30 mins without being used (sliding expiry)
+SESSION_CACHE_SIZE = 256 # max number of sessions kept in memory, least recently used ones are dropped first
+SESSION_TOUCH_INTERVAL = 60 # only write the new expiry time to the database once it has moved by this many seconds
+
+# constants for the background audit log writer
+AUDIT_BATCH_SIZE = 500 # audit logs are written once this many are waiting...
+AUDIT_FLUSH_INTERVAL = 2.0 # ...or once the oldest waiting one is this many seconds old, whichever comes first
+AUDIT_QUEUE_SIZE = 10000 # max audit logs waiting in memory, enqueue() waits if the writer falls this far behind...
+AUDIT_ENQUEUE_TIMEOUT = 1.0 # ...but only this many seconds, then the audit log is dropped (and counted) rather than holding up the collection
+AUDIT_WRITE_RETRIES = 8 # times a batch is retried while the database is busy/locked before it is dropped (about a minute, each try also waits out sqlite's 5 second busy timeout)
+AUDIT_CLOSE_TIMEOUT = 10.0 # close() waits this many seconds at most for the writer to finish, so exiting can't hang on a stuck database
+
+# a client roaming back to the AP it just left within this many seconds counts as ping-pong roaming
+PING_PONG_WINDOW = 900
+
+# constants for the client search index (services/clientSearch.py)
+CLIENT_SEARCH_LIMIT = 20 # results given for a search unless another limit is asked for
+CLIENT_SEARCH_REBUILD_RATIO = 0.1 # an update changing more than this fraction of the clients re-sorts the index instead of inserting one at a time
+
+# constants for the bulk admin actions (services/adminActions.py)
+BULK_WAVE_FRACTION = 0.1 # a bulk restart restarts this fraction of the APs at a time (at least one)...
+BULK_CONCURRENCY = 8 # ...sending at most this many requests to the console at once
+BULK_ONLINE_TIMEOUT = 600 # seconds to wait for a wave's APs to come back ONLINE before calling off the waves left
+BULK_POLL_INTERVAL = 10 # seconds between checking the APs' states while waiting for a wave
+BULK_RESTART_GRACE = 60 # an AP never seen going offline counts as restarted once it has been ONLINE this long after the restart
+
+# constants for the collector's metrics (services/metrics.py)
+METRICS_ENABLED = False # off by default, can be turned on while the app is running with getMetrics().enable()
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # latency histogram buckets, in seconds
+METRICS_FILE = dataFolder / 'metrics.prom' # where writePrometheus() writes to by default
+METRICS_PORT = 9464 # port for the local /metrics endpoint
+
+# constants for the collector's profiling mode (services/profiler.py)
+PROFILE_FOLDER = dataFolder / 'profiles' # where the flamegraph stacks and reports are written
+PROFILE_SAMPLE_INTERVAL = 0.005 # seconds between stack samples
+PROFILE_TOP_N = 20 # number of queries/endpoints listed in the report
+
 if __name__ == "__main__":
     # for testing:
     print(f"Project root: {projectRoot}")
     print(f"Data folder: {dataFolder}")
     print(f"Database file: {databaseFile}")
-    print(f"API Key: {API_KEY}")
-    print(f"Console IP: {CONSOLE_IP}")
-    print(f"Site ID: {SITE_ID}")
+    print(f"API Key: {__getattr__('API_KEY')}")
+    print(f"Console IP: {__getattr__('CONSOLE_IP')}")
+    print(f"Site ID: {__getattr__('SITE_ID')}")
 
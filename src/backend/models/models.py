@@ -1,58 +1,98 @@
-class device():
-    def __init__(self, hostname, ip, mac):
-        self._hostname = hostname
-        self._ipAddress = ip
-        self._macAddress = mac
-
-class accessPoint(device):
-    def __init__(self, id, hostname, ip, mac, state):
-        super().__init__(hostname, ip, mac)
-        self.accessPointId = id
-        self._state = state
+from collections import namedtuple
+
+# the records collectData makes from the API's json, one per access point, client, connection, sample or broadcast
+# each one is a named tuple, so it is a single small object with no __dict__ (__slots__ is empty), and its fields are in
+# the same order as the columns they are inserted into, so a record is passed straight to sqlite as its query parameters
+# https://docs.python.org/3/library/collections.html#collections.namedtuple
+# they used to be a model object turned into a dictionary that database.py then unpacked into a tuple, three objects per row
+# fromJSON builds each one straight from the API response, toDictionary is still there for anything that wants a dictionary
+
+class accessPoint(namedtuple('accessPoint', ['accessPointId', 'hostname', 'ipAddress', 'macAddress', 'state'])):
+    __slots__ = ()
+
+    # a device from the list of adopted devices, https://developer.ui.com/network/v10.1.84/getadopteddeviceoverviewpage
+    @classmethod
+    def fromJSON(cls, device):
+        return cls(device['id'], device['name'], device['ipAddress'], device['macAddress'], device['state'])
 
     def toDictionary(self):
-        APdata = {'accessPointId': self.accessPointId, 'hostname': self._hostname, 'ipAddress': self._ipAddress, 'macAddress': self._macAddress, 'state': self._state}
-        return APdata
+        return self._asdict()
 
-class client(device):
-    def __init__(self, id, hostname, ip, mac):
-        super().__init__(hostname, ip, mac)
-        self.clientId = id
-        self._active = True
+class client(namedtuple('client', ['clientId', 'hostname', 'ipAddress', 'macAddress', 'active'])):
+    __slots__ = ()
+
+    # a client from the list of connected clients, the ip address can be missing
+    @classmethod
+    def fromJSON(cls, device):
+        return cls(device['id'], device['name'], device.get('ipAddress') or "Unknown", device['macAddress'], True)
 
     def toDictionary(self):
-        clientData = {'clientId': self.clientId, 'hostname': self._hostname, 'ipAddress': self._ipAddress, 'macAddress': self._macAddress, 'active': self._active}
-        return clientData
-    
-    
-class topologyConnection():
-    def __init__(self, clientId, accessPointId):
-        self._clientId = clientId
-        self._accessPointId = accessPointId
+        return self._asdict()
+
+class topologyConnection(namedtuple('topologyConnection', ['clientId', 'accessPointId'])):
+    __slots__ = ()
+
+    # a single client's details, the 'uplink' id is the id of the AP it is connected to
+    @classmethod
+    def fromJSON(cls, clientDetails):
+        return cls(clientDetails['id'], clientDetails['uplinkDeviceId'])
+
+    def toDictionary(self):
+        return self._asdict()
+
+class trafficSample(namedtuple('trafficSample', ['accessPointId', 'uptimeSec', 'txRetriesPct', 'txRateBps', 'rxRateBps'])):
+    __slots__ = ()
+
+    # a device's latest statistics, https://developer.ui.com/network/v10.1.84/getadopteddevicelateststatistics
+    @classmethod
+    def fromJSON(cls, accessPointId, statistics):
+        return cls(accessPointId, statistics['uptimeSec'], statistics['interfaces']['radios'][0]['txRetriesPct'], statistics['uplink']['txRateBps'], statistics['uplink']['rxRateBps'])
+
+    # the sample stored for an AP that isn't online
+    @classmethod
+    def offline(cls, accessPointId):
+        return cls(accessPointId, 0, 0, 0, 0)
 
     def toDictionary(self):
-        topologyData = {'clientId': self._clientId, 'accessPointId': self._accessPointId}
-        return topologyData
-    
-class trafficSample():
-    def __init__(self, id, uptimeSec, txRetriesPct, txRateBps, rxRateBps):
-        self._accessPointId = id
-        self._uptimeSec = uptimeSec
-        self._txRetriesPct = txRetriesPct
-        self._txRateBps = txRateBps
-        self._rxRateBps = rxRateBps
+        return self._asdict()
+
+class wifiBroadcast(namedtuple('wifiBroadcast', ['broadcastId', 'ssid', 'active', 'hideName'])):
+    __slots__ = ()
+
+    # a broadcast from the list of WiFi broadcasts, plus its details for whether the ssid is hidden
+    @classmethod
+    def fromJSON(cls, broadcast, details):
+        return cls(broadcast['id'], broadcast['name'], broadcast['enabled'], details['hideName'])
 
     def toDictionary(self):
-        trafficSampleData = {'accessPointId': self._accessPointId, 'uptimeSec': self._uptimeSec, 'txRetriesPct': self._txRetriesPct, 'txRateBps': self._txRateBps, 'rxRateBps': self._rxRateBps}
-        return trafficSampleData
-    
-class wifiBroadcast():
-    def __init__(self, id, name, active, hideName):
-        self._broadcastId = id
-        self._ssid = name
-        self._active = active
-        self._hideName = hideName
-    
+        return self._asdict()
+
+# event type codes for the network audit logs, these match the rows in tbl_AuditEventTypes (data/schema.sql)
+class auditEventType():
+    MESSAGE = 0
+    AP_ADDED = 1
+    AP_UPDATED = 2
+    BROADCAST_ADDED = 3
+    BROADCAST_UPDATED = 4
+    CLIENT_ROAMED = 5
+    CLIENT_NEW = 6
+    CLIENT_RECONNECTED = 7
+    CLIENT_DISCONNECTED = 8
+    AP_RESTARTED = 9
+    SSID_HIDDEN = 10
+    SSID_SHOWN = 11
+
+# one network audit log event, the subject/target are the names that appear in the message
+class auditEvent():
+    def __init__(self, eventType, subject=None, target=None, accessPointId=None, clientId=None, broadcastId=None, dateCreated=None):
+        self._eventType = eventType
+        self._subject = subject
+        self._target = target
+        self._accessPointId = accessPointId
+        self._clientId = clientId
+        self._broadcastId = broadcastId
+        self._dateCreated = dateCreated
+
     def toDictionary(self):
-        wifiBroadcastData = {'broadcastId': self._broadcastId, 'ssid': self._ssid, 'active': self._active, 'hideName': self._hideName}
-        return wifiBroadcastData
\ No newline at end of file
+        auditEventData = {'eventType': self._eventType, 'subject': self._subject, 'target': self._target, 'accessPointId': self._accessPointId, 'clientId': self._clientId, 'broadcastId': self._broadcastId, 'dateCreated': self._dateCreated}
+        return auditEventData
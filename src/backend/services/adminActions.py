@@ -1,20 +1,37 @@
-import httpx
 import json
+import math
 import sqlite3
-from src.backend.config import databaseFile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from src.backend.config import (
+    databaseFile, BULK_WAVE_FRACTION, BULK_CONCURRENCY, BULK_ONLINE_TIMEOUT, BULK_POLL_INTERVAL, BULK_RESTART_GRACE
+)
+from .auditQueue import insertAuditEvents
+from .metrics import getMetrics
+from ..models.models import auditEvent, auditEventType
 
 class adminActions:
      # constructor which defines the base url from the console ip and site id
-    def __init__(self, consoleIp, apiKey, siteId):
+    # auditQueue is optional, when an auditLogQueue is passed in the audit logs are written in the background
+    def __init__(self, consoleIp, apiKey, siteId, auditQueue=None, dbPath=databaseFile):
+        self._dbPath = dbPath
+        self._auditQueue = auditQueue
+        self._pendingAuditLogs = []
         self._consoleIp = consoleIp
         self._apiKey = apiKey
         self._siteId = siteId
         self._baseURL = f"https://{self._consoleIp}/proxy/network/integration/v1/sites/{self._siteId}"
 
-        # creating a http client for efficiency, can then close this client when I am done with a request
-        # that way I do not build up a bunch of open HTTP clients that are making requests
-        # https://www.python-httpx.org/advanced/clients/
-        self._client = httpx.Client(verify=False)
+        self._client = None # made on the first action, same as APIclient._getClient
+
+    # creating a http client for efficiency, can then close this client when I am done with a request
+    # that way I do not build up a bunch of open HTTP clients that are making requests
+    # https://www.python-httpx.org/advanced/clients/
+    def _getClient(self):
+        if self._client is None:
+            import httpx
+            self._client = httpx.Client(verify=False)
+        return self._client
 
     # from the UniFi network API documentation, I need to have these custom headers that include the API key and say i want a json response
     # additionally, I need to specify the content type, as these are POST actions rather than GET requests
@@ -28,10 +45,30 @@ class adminActions:
     
     # Reusable protected method to establish a connection to the database.
     def _dbConnection(self):
-        con = sqlite3.connect(databaseFile)
+        con = sqlite3.connect(self._dbPath)
         cur = con.cursor()
         return cur, con
     
+    # inserts the audit event straight away, or holds it until the action's transaction commits when using the audit log queue
+    def _writeAuditLog(self, cur, event):
+        if self._auditQueue is not None:
+            self._pendingAuditLogs.append(event)
+        else:
+            insertAuditEvents(cur, [event]) # insert a new audit log record
+
+    # the same for a whole batch of audit events, so a bulk action inserts them all with one executemany
+    def _writeAuditLogs(self, cur, events):
+        if self._auditQueue is not None:
+            self._pendingAuditLogs.extend(events)
+        elif events:
+            insertAuditEvents(cur, events)
+
+    # called straight after a commit, hands the held audit logs to the background writer
+    def _releaseAuditLogs(self):
+        if self._auditQueue is not None and self._pendingAuditLogs:
+            self._auditQueue.enqueueMany(self._pendingAuditLogs)
+        self._pendingAuditLogs = []
+
     # Protected method that adds a record to the network audit logs table in the database.
     def _createNetworkAuditLog(self, cur, con, id, type, hideNameVal=None):
         if type == "AP":
@@ -47,11 +84,8 @@ class adminActions:
                 raise ValueError(f"No accessPoint with id {id}.")
 
             apName = result[0] # extract the hostname from the result tuple
-            message = f"Access point {apName} was restarted." # create the message with the access point's name just fetched
-            cur.execute(
-                '''INSERT INTO tbl_AuditLogs (accessPointId, logMessage) VALUES (?, ?)''',
-                (id, message)
-            ) # insert a new audit log record
+            # create the event with the access point's name just fetched
+            self._writeAuditLog(cur, auditEvent(auditEventType.AP_RESTARTED, subject=apName, accessPointId=id).toDictionary())
         elif type == "WIFI":
             #find the ssid of the wifi broadcast
             result = cur.execute(
@@ -64,11 +98,9 @@ class adminActions:
                 # again will raise a value error to be caught by the parent method calling it
                 raise ValueError(f"Wifi broadcast with id {id} not found - audit log failed.")
             ssid = result[0] # extract the ssid from the result tuple
-            message = f"SSID broadcasting for {ssid} has been {'disabled' if hideNameVal else 'enabled'}." # create the message with the wifi broadcast's ssid just fetched
-            cur.execute(
-                '''INSERT INTO tbl_AuditLogs (logMessage) VALUES (?)''',
-                (message,)
-            ) # insert a new audit log record, no link to specific access point or wifi broadcast, so null for both FKs.
+            eventType = auditEventType.SSID_HIDDEN if hideNameVal else auditEventType.SSID_SHOWN
+            # create the event with the wifi broadcast's ssid just fetched, linked to the broadcast rather than an access point
+            self._writeAuditLog(cur, auditEvent(eventType, subject=ssid, broadcastId=id).toDictionary())
         # con.commit() will occur in the parent method.
 
     # Method for the admin to restart a specific access point.
@@ -83,7 +115,7 @@ class adminActions:
 
         cur, con = self._dbConnection() # establish connection to database for the audit log Method
         try:
-            response = self._client.post(url, headers=headers, content=payload) # actually make the POST request to UniFi Network API
+            response = self._getClient().post(url, headers=headers, content=payload) # actually make the POST request to UniFi Network API
             if response.status_code != 200: # if not successful
                 return {
                     "successful": False,
@@ -93,6 +125,7 @@ class adminActions:
             
             self._createNetworkAuditLog(cur, con, deviceId, "AP")
             con.commit() #commits transaction from the protected method above
+            self._releaseAuditLogs()
             return { # return success message
             "successful": True,
             "message": "Access point is restarting.",
@@ -106,6 +139,7 @@ class adminActions:
             }
         finally:
             con.close() # close the database connection
+            self._pendingAuditLogs = []
 
     # this is the Method to enable/disable ssid broadcasting for a wifi broadcast which is stored in tbl_WifiBroadcasts
     def toggleBroadcasting(self, wifiBroadcastId):
@@ -142,7 +176,7 @@ class adminActions:
             })
         
             # Make the PUT request to UniFi Network API
-            response = self._client.put(url, headers=headers, content=payload)
+            response = self._getClient().put(url, headers=headers, content=payload)
             if response.status_code != 200:
                 # handle when the response code is not 200, not successful.
                 return {
@@ -159,6 +193,7 @@ class adminActions:
             # create a network audit log for this action by calling the protected method
             self._createNetworkAuditLog(cur, con, wifiBroadcastId, "WIFI", hideNameVal)
             con.commit() #Commit transaction and save changes for both the hideName update and the audit log record
+            self._releaseAuditLogs()
             # return success message
             return {
                 "successful": True,
@@ -172,4 +207,246 @@ class adminActions:
                 "errors": [str(error)]
             }
         finally:
-            con.close() # close the database connection
\ No newline at end of file
+            con.close() # close the database connection
+            self._pendingAuditLogs = []
+
+    # ---- bulk actions ----
+    # restarting 80 APs after a firmware push one restartAccessPoint at a time means 80 requests, connections and commits
+    # in a row, the bulk versions below send the requests on threads and write all of the audit logs in one transaction
+
+    # sends one request for a bulk action, returning (sent, error, seconds) rather than raising so one AP or broadcast
+    # failing doesn't stop the rest of its wave. httpx clients are safe to share between threads
+    def _sendAction(self, method, endpoint, payload):
+        start = time.perf_counter()
+        try:
+            response = self._getClient().request(method, f"{self._baseURL}/{endpoint}", headers=self._getHeaders(), content=json.dumps(payload))
+            if response.status_code != 200:
+                return False, f"Status code: {response.status_code}, Response: {response.text}", time.perf_counter() - start
+            return True, None, time.perf_counter() - start
+        except Exception as error:
+            return False, str(error), time.perf_counter() - start
+
+    # the state of every AP on the console, {deviceId: state}, read the same way as APIclient.fetchAccessPoints
+    def _fetchDeviceStates(self):
+        response = self._getClient().get(f"{self._baseURL}/devices", headers=self._getHeaders())
+        if response.status_code != 200:
+            raise Exception(f"Request to network api failed: {response.status_code}, {response.text}")
+        return {device['id']: device.get('state') for device in response.json()['data']}
+
+    # waits for the APs just restarted to come back, returns {deviceId: seconds taken} for the ones that did before the timeout
+    # an AP is back once it has been seen not ONLINE and then ONLINE again. one that is never seen going offline (it
+    # restarted between two checks) counts as back once it is ONLINE restartGrace seconds after the restart
+    def _waitForOnline(self, deviceIds, restartedAt, timeout, pollInterval, restartGrace):
+        wentDown = set()
+        back = {}
+        deadline = restartedAt + timeout
+        while len(back) < len(deviceIds):
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            time.sleep(min(pollInterval, deadline - now))
+            try:
+                states = self._fetchDeviceStates()
+            except Exception:
+                # the console can drop out for a moment while the APs restart (eg its own uplink), so keep waiting
+                continue
+            now = time.monotonic()
+            for id in deviceIds:
+                state = states.get(id)
+                if id in back or state is None:
+                    continue
+                if state != "ONLINE":
+                    wentDown.add(id)
+                elif id in wentDown or now - restartedAt >= restartGrace:
+                    back[id] = round(now - restartedAt, 1)
+        return back
+
+    # {id: row} for the APs or broadcasts that are in the database, found with one query rather than one per id
+    def _lookupTargets(self, cur, type, ids):
+        placeholders = ', '.join('?' * len(ids))
+        if type == "AP":
+            rows = cur.execute(f'''SELECT accessPointId, hostname FROM tbl_APdevices WHERE accessPointId IN ({placeholders})''', ids)
+        else:
+            rows = cur.execute(f'''SELECT broadcastId, ssid, hideName FROM tbl_WifiBroadcasts WHERE broadcastId IN ({placeholders})''', ids)
+        return {row[0]: row for row in rows.fetchall()}
+
+    # the report returned by both bulk actions, data has an entry per id in the order they were asked for
+    def _bulkReport(self, action, items, doneStatus, message, errors):
+        metrics = getMetrics()
+        counts = {}
+        for item in items:
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+            metrics.incrementCounter('openhaven_admin_actions_total', action=action, outcome=item['status'])
+        errors = [f"{item['name'] or item['id']}: {item['error']}" for item in items if item['error']] + errors
+        return {
+            "successful": not errors and all(item['status'] in (doneStatus, 'unchanged') for item in items),
+            "message": message,
+            "errors": errors,
+            "data": {"items": items, "counts": counts}
+        }
+
+    # Method for the admin to restart a lot of access points at once, eg after a firmware push
+    # the APs are restarted in waves of waveFraction of them (at least one) so the whole site never goes down at once,
+    # each wave's requests are sent concurrency at a time, then with waitOnline the next wave only starts once every AP
+    # in this one is back ONLINE. if any of them don't come back within onlineTimeout the waves left are called off
+    # rather than taking more of the network down; an AP whose restart request failed is still up so doesn't stop the waves
+    # each item in the report has a status of restarted, failed, timedOut, skipped (its wave was called off) or notFound
+    def bulkRestartAccessPoints(self, deviceIds, waveFraction=BULK_WAVE_FRACTION, concurrency=BULK_CONCURRENCY, waitOnline=True,
+                                onlineTimeout=BULK_ONLINE_TIMEOUT, pollInterval=BULK_POLL_INTERVAL, restartGrace=BULK_RESTART_GRACE):
+        deviceIds = list(dict.fromkeys(deviceIds)) # the same AP asked for twice is only restarted once
+        items = {id: {"id": id, "name": None, "status": "skipped", "wave": None, "error": None, "seconds": None} for id in deviceIds}
+        if not deviceIds:
+            return self._bulkReport('restart', [], 'restarted', "No access points to restart.", [])
+
+        cur, con = self._dbConnection()
+        try:
+            targets = self._lookupTargets(cur, "AP", deviceIds)
+        except Exception as error:
+            con.close()
+            return {
+                "successful": False,
+                "message": "Restarting the access points failed.",
+                "errors": [str(error)]
+            }
+        for id in deviceIds:
+            if id in targets:
+                items[id]['name'] = targets[id][1]
+            else:
+                items[id]['status'] = "notFound"
+                items[id]['error'] = f"No accessPoint with id {id}."
+
+        found = [id for id in deviceIds if id in targets]
+        waveSize = max(1, math.ceil(len(found) * waveFraction))
+        waves = [found[i:i + waveSize] for i in range(0, len(found), waveSize)]
+        for number, wave in enumerate(waves, 1):
+            for id in wave:
+                items[id]['wave'] = number
+
+        errors = []
+        calledOff = None
+        try:
+            self._getClient() # made here, so the pool's threads don't each make (and leak) one of their own
+            with ThreadPoolExecutor(max_workers=max(1, min(concurrency, waveSize))) as pool:
+                for number, wave in enumerate(waves, 1):
+                    results = list(pool.map(lambda id: self._sendAction('POST', f"devices/{id}/actions", {"action": "RESTART"}), wave))
+                    restartedAt = time.monotonic()
+                    restarting = []
+                    for id, (sent, error, seconds) in zip(wave, results):
+                        if sent:
+                            restarting.append(id)
+                            items[id]['status'] = "restarted"
+                            items[id]['seconds'] = round(seconds, 1)
+                        else:
+                            items[id]['status'] = "failed"
+                            items[id]['error'] = error
+
+                    # one transaction with every audit log for the wave, written before waiting so they're in the
+                    # database even if the wait is given up on
+                    try:
+                        self._writeAuditLogs(cur, [
+                            auditEvent(auditEventType.AP_RESTARTED, subject=items[id]['name'], accessPointId=id).toDictionary() for id in restarting
+                        ])
+                        con.commit()
+                        self._releaseAuditLogs()
+                    except Exception as error:
+                        con.rollback()
+                        self._pendingAuditLogs = []
+                        errors.append(f"Audit logs for wave {number} couldn't be written: {error}")
+
+                    if not waitOnline or not restarting:
+                        continue
+                    back = self._waitForOnline(restarting, restartedAt, onlineTimeout, pollInterval, restartGrace)
+                    for id in restarting:
+                        if id in back:
+                            items[id]['seconds'] = back[id]
+                        else:
+                            items[id]['status'] = "timedOut"
+                            items[id]['error'] = f"Wasn't back ONLINE within {onlineTimeout} seconds."
+                    if len(back) < len(restarting) and number < len(waves):
+                        calledOff = number
+                        break
+        finally:
+            con.close()
+            self._pendingAuditLogs = []
+
+        for item in items.values():
+            if item['status'] == "skipped":
+                item['error'] = f"Called off as wave {calledOff} didn't come back ONLINE."
+        restartedCount = sum(1 for item in items.values() if item['status'] == "restarted")
+        message = f"{restartedCount} of {len(deviceIds)} access points restarted in {len(waves)} waves."
+        if calledOff:
+            message = f"{restartedCount} of {len(deviceIds)} access points restarted, the restart was called off after wave {calledOff} of {len(waves)}."
+        return self._bulkReport('restart', list(items.values()), 'restarted', message, errors)
+
+    # this is the Method to hide or show a lot of wifi broadcasts at once
+    # with hideName left as None each broadcast is toggled like toggleBroadcasting does, otherwise they are all set to
+    # hideName (ones already set to it are left alone and reported as unchanged). the PUT requests are sent concurrency at
+    # a time, then every hideName update and audit log is written in one transaction
+    # each item in the report has a status of updated, unchanged, failed or notFound
+    def bulkToggleBroadcasting(self, wifiBroadcastIds, hideName=None, concurrency=BULK_CONCURRENCY):
+        wifiBroadcastIds = list(dict.fromkeys(wifiBroadcastIds))
+        items = {id: {"id": id, "name": None, "hideName": None, "status": "notFound", "error": None, "seconds": None} for id in wifiBroadcastIds}
+        if not wifiBroadcastIds:
+            return self._bulkReport('toggleBroadcasting', [], 'updated', "No wifi broadcasts to change.", [])
+
+        cur, con = self._dbConnection()
+        try:
+            targets = self._lookupTargets(cur, "WIFI", wifiBroadcastIds)
+            sending = []
+            for id in wifiBroadcastIds:
+                if id not in targets:
+                    items[id]['error'] = f"Couldn't find wifi broadcast with id {id}."
+                    continue
+                broadcastId, ssid, current = targets[id]
+                items[id]['name'] = ssid
+                items[id]['hideName'] = not bool(current) if hideName is None else bool(hideName)
+                if items[id]['hideName'] == bool(current):
+                    items[id]['status'] = "unchanged"
+                else:
+                    sending.append(id)
+
+            if sending:
+                self._getClient() # same as bulkRestartAccessPoints, made once before the threads share it
+                with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(sending)))) as pool:
+                    results = list(pool.map(lambda id: self._sendAction('PUT', f"wifi/broadcasts/{id}", {"hideName": items[id]['hideName']}), sending))
+            else:
+                results = []
+            updated = []
+            for id, (sent, error, seconds) in zip(sending, results):
+                items[id]['seconds'] = round(seconds, 1)
+                if sent:
+                    items[id]['status'] = "updated"
+                    updated.append(id)
+                else:
+                    items[id]['status'] = "failed"
+                    items[id]['error'] = error
+
+            errors = []
+            if updated:
+                try:
+                    cur.executemany(
+                        '''UPDATE tbl_WifiBroadcasts SET hideName = ? where broadcastId = ?''',
+                        [(items[id]['hideName'], id) for id in updated]
+                    )
+                    self._writeAuditLogs(cur, [
+                        auditEvent(auditEventType.SSID_HIDDEN if items[id]['hideName'] else auditEventType.SSID_SHOWN, subject=items[id]['name'], broadcastId=id).toDictionary()
+                        for id in updated
+                    ])
+                    con.commit()
+                    self._releaseAuditLogs()
+                except Exception as error:
+                    # the console has already been changed, the next collection brings hideName back in line
+                    con.rollback()
+                    errors.append(f"The changes couldn't be saved to the database: {error}")
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error occured while changing ssid broadcasting.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+            self._pendingAuditLogs = []
+
+        message = f"SSID broadcasting changed for {len(updated)} of {len(wifiBroadcastIds)} wifi broadcasts."
+        return self._bulkReport('toggleBroadcasting', list(items.values()), 'updated', message, errors)
@@ -0,0 +1,254 @@
+import re
+import json
+import base64
+import sqlite3
+from datetime import datetime
+from src.backend.config import databaseFile
+
+# read side of the network audit logs, used by the audit log page of the dashboard
+# logs are read through vw_AuditLogs, which puts each message together from its event type template and names
+class auditLogService:
+    def __init__(self, dbPath=databaseFile):
+        self._dbPath = dbPath
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    # dates can be passed in as datetime objects or as strings already in the same format sqlite uses for CURRENT_TIMESTAMP
+    def _formatDate(self, date):
+        if isinstance(date, datetime):
+            return date.strftime("%Y-%m-%d %H:%M:%S")
+        return date
+
+    # turns what the user typed into a safe FTS5 query
+    # every word is quoted so characters like - or : can't be read as FTS5 syntax, and the last word
+    # is a prefix search so results show up while the user is still typing, https://www.sqlite.org/fts5.html#fts5_prefix_queries
+    def _buildMatchQuery(self, text):
+        words = re.findall(r"\w+", text)
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] = terms[-1] + '*'
+        return ' '.join(terms) # words separated by a space must all match (implicit AND)
+
+    # builds the extra WHERE conditions for the optional filters, shared by the search and list methods
+    def _buildFilters(self, accessPointId, clientId, startDate, endDate):
+        conditions = []
+        params = []
+        if accessPointId:
+            conditions.append('a.accessPointId = ?')
+            params.append(accessPointId)
+        if clientId:
+            conditions.append('a.clientId = ?')
+            params.append(clientId)
+        if startDate:
+            conditions.append('a.dateCreated >= ?')
+            params.append(self._formatDate(startDate))
+        if endDate:
+            conditions.append('a.dateCreated < ?')
+            params.append(self._formatDate(endDate))
+        return conditions, params
+
+    # cursors are the (dateCreated, auditLogId) of the last row on a page, encoded so the frontend just passes them back
+    # https://docs.python.org/3/library/base64.html#base64.urlsafe_b64encode
+    def _encodeCursor(self, dateCreated, auditLogId):
+        return base64.urlsafe_b64encode(json.dumps([dateCreated, auditLogId]).encode()).decode()
+
+    def _decodeCursor(self, cursor):
+        dateCreated, auditLogId = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(dateCreated, str) or not isinstance(auditLogId, int):
+            raise ValueError("Invalid cursor.")
+        return dateCreated, auditLogId
+
+    # lists audit logs newest first, one page at a time
+    # this uses keyset (seek) pagination rather than OFFSET: the next page starts directly after the last row of the
+    # previous one using the index, so page 1000 is as fast as page 1, https://use-the-index-luke.com/no-offset
+    # pass the nextCursor from the previous page to get the page after it, or None for the first page
+    def getAuditLogs(self, accessPointId=None, clientId=None, startDate=None, endDate=None, cursor=None, pageSize=50):
+        pageSize = max(1, min(int(pageSize), 200))
+        conditions, params = self._buildFilters(accessPointId, clientId, startDate, endDate)
+        if cursor:
+            try:
+                lastDate, lastId = self._decodeCursor(cursor)
+            except Exception as error:
+                return {
+                    "successful": False,
+                    "message": "Invalid page cursor.",
+                    "errors": [str(error)]
+                }
+            # row values compare column by column, https://www.sqlite.org/rowvalue.html
+            conditions.append('(a.dateCreated, a.auditLogId) < (?, ?)')
+            params.extend([lastDate, lastId])
+
+        whereClause = ('WHERE ' + ' AND '.join(conditions)) if conditions else ''
+        cur, con = self._dbConnection()
+        try:
+            result = cur.execute(
+                '''SELECT a.auditLogId, a.accessPointId, a.clientId, a.dateCreated, a.logMessage, a.eventName, a.broadcastId
+                FROM vw_AuditLogs a
+                %s
+                ORDER BY a.dateCreated DESC, a.auditLogId DESC
+                LIMIT ?''' % whereClause,
+                params + [pageSize + 1]
+            )
+            rows = result.fetchall()
+            logs = []
+            for row in rows[:pageSize]:
+                logs.append({
+                    'auditLogId': row[0],
+                    'accessPointId': row[1],
+                    'clientId': row[2],
+                    'dateCreated': row[3],
+                    'logMessage': row[4],
+                    'eventName': row[5],
+                    'broadcastId': row[6]
+                })
+            nextCursor = None
+            if len(rows) > pageSize: # there is at least one more row after this page
+                nextCursor = self._encodeCursor(logs[-1]['dateCreated'], logs[-1]['auditLogId'])
+            return {
+                "successful": True,
+                "message": f"Retrieved {len(logs)} audit logs.",
+                "errors": [],
+                "data": {
+                    'logs': logs,
+                    'nextCursor': nextCursor
+                }
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error while retrieving the audit logs.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+    # full text search over the audit logs, best matches first (bm25 ranking)
+    # pages start at 1, pageSize is capped so the frontend can't request the whole table at once
+    def searchLogs(self, text, accessPointId=None, clientId=None, startDate=None, endDate=None, page=1, pageSize=50):
+        matchQuery = self._buildMatchQuery(text or '')
+        if matchQuery is None:
+            return {
+                "successful": False,
+                "message": "Enter something to search for.",
+                "errors": ["Search text is empty."]
+            }
+        page = max(1, int(page))
+        pageSize = max(1, min(int(pageSize), 200))
+
+        conditions, params = self._buildFilters(accessPointId, clientId, startDate, endDate)
+        conditions.insert(0, 'tbl_AuditLogsSearch MATCH ?')
+        params.insert(0, matchQuery)
+
+        cur, con = self._dbConnection()
+        try:
+            # one extra row is fetched to know if there is another page, without a separate COUNT(*) query
+            result = cur.execute(
+                '''SELECT a.auditLogId, a.accessPointId, a.clientId, a.dateCreated, a.logMessage, a.eventName, a.broadcastId, bm25(tbl_AuditLogsSearch) AS rank
+                FROM tbl_AuditLogsSearch
+                JOIN vw_AuditLogs a ON a.auditLogId = tbl_AuditLogsSearch.rowid
+                WHERE %s
+                ORDER BY rank, a.auditLogId DESC
+                LIMIT ? OFFSET ?''' % ' AND '.join(conditions),
+                params + [pageSize + 1, (page - 1) * pageSize]
+            )
+            rows = result.fetchall()
+            logs = []
+            for row in rows[:pageSize]:
+                logs.append({
+                    'auditLogId': row[0],
+                    'accessPointId': row[1],
+                    'clientId': row[2],
+                    'dateCreated': row[3],
+                    'logMessage': row[4],
+                    'eventName': row[5],
+                    'broadcastId': row[6],
+                    'rank': row[7]
+                })
+            return {
+                "successful": True,
+                "message": f"Found {len(logs)} matching audit logs.",
+                "errors": [],
+                "data": {
+                    'logs': logs,
+                    'page': page,
+                    'pageSize': pageSize,
+                    'hasMore': len(rows) > pageSize
+                }
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error while searching the audit logs.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+    # counts events of one type per access point (or client) per day, eg roams per AP per day
+    # this only reads the event type and ids, so no message text has to be parsed
+    def getEventCounts(self, eventType, groupBy='accessPointId', startDate=None, endDate=None):
+        if groupBy not in ('accessPointId', 'clientId'):
+            return {
+                "successful": False,
+                "message": "Event counts can only be grouped by accessPointId or clientId.",
+                "errors": [f"Invalid groupBy {groupBy}."]
+            }
+        conditions, params = self._buildFilters(None, None, startDate, endDate)
+        conditions.insert(0, 'a.eventType = ?')
+        params.insert(0, eventType)
+
+        cur, con = self._dbConnection()
+        try:
+            result = cur.execute(
+                '''SELECT a.%s, date(a.dateCreated) AS day, COUNT(*)
+                FROM tbl_AuditLogs a
+                WHERE %s
+                GROUP BY a.%s, day
+                ORDER BY day, a.%s''' % (groupBy, ' AND '.join(conditions), groupBy, groupBy),
+                params
+            )
+            counts = []
+            for row in result.fetchall():
+                counts.append({
+                    groupBy: row[0],
+                    'day': row[1],
+                    'count': row[2]
+                })
+            return {
+                "successful": True,
+                "message": f"Counted events for {len(counts)} groups.",
+                "errors": [],
+                "data": counts
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error while counting audit log events.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+    # rebuilds the search index from tbl_AuditLogs, only needed if the index ever gets out of sync
+    def rebuildSearchIndex(self):
+        cur, con = self._dbConnection()
+        try:
+            cur.execute('''INSERT INTO tbl_AuditLogsSearch (tbl_AuditLogsSearch) VALUES ('rebuild')''')
+            con.commit()
+            return {
+                "successful": True,
+                "message": "Audit log search index rebuilt.",
+                "errors": []
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error rebuilding the audit log search index.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
@@ -0,0 +1,215 @@
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from src.backend.config import databaseFile, AUDIT_BATCH_SIZE, AUDIT_FLUSH_INTERVAL, AUDIT_QUEUE_SIZE, AUDIT_ENQUEUE_TIMEOUT, AUDIT_WRITE_RETRIES, AUDIT_CLOSE_TIMEOUT
+from ..models.models import auditEvent
+from .metrics import getMetrics
+
+# looks up the nameId for every name used by a list of events, adding any names that are new
+# returns a dictionary of name -> nameId
+def _internNames(cur, names):
+    names = list(set(name for name in names if name is not None))
+    if not names:
+        return {}
+    cur.executemany(
+        '''INSERT OR IGNORE INTO tbl_AuditNames (name) VALUES (?)''',
+        [(name,) for name in names]
+    )
+    nameIds = {}
+    # looked up in chunks so the number of ? placeholders stays under sqlite's limit
+    for i in range(0, len(names), 500):
+        chunk = names[i:i + 500]
+        placeholders = ', '.join('?' for _ in chunk)
+        result = cur.execute(
+            '''SELECT name, nameId FROM tbl_AuditNames WHERE name IN (%s)''' % placeholders,
+            chunk
+        )
+        nameIds.update(result.fetchall())
+    return nameIds
+
+# writes a list of audit event dictionaries (auditEvent.toDictionary()) in one executemany
+# used by the background writer below, and by the services when they write their audit logs straight away
+def insertAuditEvents(cur, events):
+    nameIds = _internNames(cur, [event['subject'] for event in events] + [event['target'] for event in events])
+    cur.executemany(
+        '''INSERT INTO tbl_AuditLogs (eventType, accessPointId, clientId, broadcastId, subjectNameId, targetNameId, dateCreated)
+        VALUES (?, ?, ?, ?, ?, ?, coalesce(?, CURRENT_TIMESTAMP))''',
+        [(event['eventType'], event['accessPointId'], event['clientId'], event['broadcastId'],
+          nameIds.get(event['subject']), nameIds.get(event['target']), event['dateCreated']) for event in events]
+    )
+
+# background writer for network audit logs
+# any service can call enqueue(), which only puts the event on an in-memory queue and returns straight away
+# a writer thread takes events off the queue and inserts them in batches, either once AUDIT_BATCH_SIZE are waiting
+# or once the oldest one has waited AUDIT_FLUSH_INTERVAL seconds
+#
+# durability: an event is only on disk once its batch is committed, so if the app crashes the events from the last
+# AUDIT_FLUSH_INTERVAL seconds can be lost. flush() waits until everything enqueued so far is committed, and close()
+# (also run automatically when python exits) writes whatever is left, waiting AUDIT_CLOSE_TIMEOUT seconds at most.
+# a batch that fails to commit because the database is busy/locked is retried AUDIT_WRITE_RETRIES times, any other
+# error (no such table, disk full, ...) won't go away by retrying, so the batch is dropped straight away. an event is
+# also dropped if the queue is still full after AUDIT_ENQUEUE_TIMEOUT seconds. every dropped event is counted in
+# getStatus() and openhaven_audit_logs_dropped_total, so a stuck database shows up instead of hanging the app
+class auditLogQueue:
+    def __init__(self, batchSize=AUDIT_BATCH_SIZE, flushInterval=AUDIT_FLUSH_INTERVAL, maxSize=AUDIT_QUEUE_SIZE, dbPath=databaseFile,
+                 enqueueTimeout=AUDIT_ENQUEUE_TIMEOUT, writeRetries=AUDIT_WRITE_RETRIES):
+        self._dbPath = dbPath
+        self._batchSize = batchSize
+        self._flushInterval = flushInterval
+        self._enqueueTimeout = enqueueTimeout
+        self._writeRetries = writeRetries
+        # https://docs.python.org/3/library/queue.html, it is thread safe so producers need no locks of their own
+        self._queue = queue.Queue(maxsize=maxSize)
+        self._closed = False
+        self._dropped = 0
+        self._lastError = None
+        self._statusLock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="auditLogWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    # adds an event (an auditEvent's dictionary) to the queue
+    # the timestamp is taken now rather than when the row is written, so the log shows when the event actually happened
+    def enqueue(self, event):
+        if self._closed:
+            raise RuntimeError("The audit log queue has been closed.")
+        if event['dateCreated'] is None:
+            event = dict(event)
+            # same format and timezone (UTC) as sqlite's CURRENT_TIMESTAMP
+            event['dateCreated'] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self._queue.put(event, timeout=self._enqueueTimeout)
+        except queue.Full: # the writer is stuck or far behind, don't hold up the caller with it
+            self._drop(1, 'queueFull', "The audit log queue is full.")
+
+    def enqueueMany(self, events):
+        for event in events:
+            self.enqueue(event)
+
+    # shortcut so a service can log an event without building the auditEvent itself
+    def logEvent(self, eventType, subject=None, target=None, accessPointId=None, clientId=None, broadcastId=None):
+        self.enqueue(auditEvent(eventType, subject, target, accessPointId, clientId, broadcastId).toDictionary())
+
+    # blocks until every event enqueued before this call has been committed (or dropped)
+    # returns False if that didn't happen within timeout seconds
+    def flush(self, timeout=None):
+        if self._closed or not self._thread.is_alive():
+            # nothing would ever set the event, so just say whether the writer has finished what it had
+            return not self._thread.is_alive()
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout) # the writer sets this once it has written everything in front of it
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    # writes any remaining events and stops the writer thread
+    # returns False if the writer was still going after timeout seconds (it is a daemon thread, so it won't keep python running)
+    def close(self, timeout=AUDIT_CLOSE_TIMEOUT):
+        if self._closed:
+            return not self._thread.is_alive()
+        self._closed = True
+        try:
+            self._queue.put(None, timeout=timeout) # None tells the writer thread to stop
+        except queue.Full:
+            return False
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
+    def getStatus(self):
+        with self._statusLock:
+            return {'waiting': self._queue.qsize(), 'dropped': self._dropped, 'lastError': self._lastError, 'closed': self._closed}
+
+    def _drop(self, count, reason, error):
+        with self._statusLock:
+            self._dropped += count
+            self._lastError = error
+        getMetrics().incrementCounter('openhaven_audit_logs_dropped_total', count, reason=reason)
+
+    # writes one batch, retrying it while the database is busy/locked, and dropping it once that has gone on for too
+    # long or if the error isn't one that retrying can fix
+    def _writeBatch(self, cur, con, batch):
+        delay = 0.1
+        attempts = 0
+        while True:
+            try:
+                insertAuditEvents(cur, batch)
+                con.commit()
+                return
+            except sqlite3.OperationalError as error:
+                con.rollback()
+                # https://docs.python.org/3/library/sqlite3.html#sqlite3.Error.sqlite_errorcode
+                # the low byte is the primary code, so extended codes like SQLITE_BUSY_SNAPSHOT count as busy too
+                code = getattr(error, 'sqlite_errorcode', None)
+                busy = code is not None and code & 0xff in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+                if not busy or attempts >= self._writeRetries:
+                    self._drop(len(batch), 'locked' if busy else 'error', str(error))
+                    return
+                attempts += 1
+                time.sleep(delay)
+                delay = min(delay * 2, 5) # back off so a locked database isn't hammered with retries
+            except sqlite3.Error:
+                # one of the events itself is invalid, so retrying the whole batch would never work
+                # write them one at a time instead so only the invalid event is left out
+                con.rollback()
+                for event in batch:
+                    try:
+                        insertAuditEvents(cur, [event])
+                        con.commit()
+                    except sqlite3.Error as error:
+                        con.rollback()
+                        self._drop(1, 'invalid', str(error))
+                return
+
+    def _run(self):
+        cur, con = self._dbConnection() # the connection has to be made in the thread that uses it
+        batch = []
+        waiters = []
+        deadline = None
+        stopping = False
+        try:
+            while not stopping:
+                timeout = None if deadline is None else max(0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = False # the flush interval ran out
+
+                if item is None:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not False:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self._flushInterval
+
+                if stopping or waiters or item is False or len(batch) >= self._batchSize:
+                    if batch:
+                        self._writeBatch(cur, con, batch)
+                        batch = []
+                    deadline = None
+                    for waiter in waiters:
+                        waiter.set()
+                    waiters = []
+        finally:
+            con.close()
+
+# one shared queue for the whole app, created the first time a service asks for it
+_sharedQueue = None
+_sharedQueueLock = threading.Lock()
+
+def getAuditLogQueue():
+    global _sharedQueue
+    with _sharedQueueLock:
+        if _sharedQueue is None:
+            _sharedQueue = auditLogQueue()
+        return _sharedQueue
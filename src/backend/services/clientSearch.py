@@ -0,0 +1,311 @@
+import bisect
+import ipaddress
+import re
+import sqlite3
+import threading
+from src.backend.config import databaseFile, CLIENT_SEARCH_LIMIT, CLIENT_SEARCH_REBUILD_RATIO
+
+_macSeparators = re.compile(r'[\s:.\-]')
+_hexDigits = re.compile(r'^[0-9a-f]+$')
+_hostnameSeparators = re.compile(r'[^0-9a-z]+')
+_addressCharacters = re.compile(r'^[0-9a-f:.\-]+$')
+
+# a MAC's 12 hex digits in lower case, whatever separators it was stored with, or None if it isn't a MAC
+def _normaliseMac(value):
+    mac = _macSeparators.sub('', (value or '').lower())
+    return mac if len(mac) == 12 and _hexDigits.match(mac) else None
+
+# (version, number, text) for an IP address, or None if it isn't one (eg "Unknown")
+# IPv4 octets can have leading zeros (ipaddress won't accept them), an IPv6 address can have a zone on the end (fe80::1%eth0)
+def _normaliseIp(value):
+    value = (value or '').strip()
+    parts = value.split('.')
+    if len(parts) == 4 and all(part.isdigit() for part in parts):
+        octets = [int(part) for part in parts]
+        if max(octets) > 255:
+            return None
+        return 4, (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3], '.'.join(map(str, octets))
+    try:
+        address = ipaddress.ip_address(value.split('%')[0])
+    except ValueError:
+        return None
+    return address.version, int(address), address.compressed
+
+# a subnet typed into the search, with the same leniency as _normaliseIp for the address part
+def _normaliseNetwork(text):
+    address, _, prefixLength = text.partition('/')
+    ip = _normaliseIp(address)
+    if ip is None or not prefixLength.isdigit():
+        return None
+    try:
+        return ipaddress.ip_network(f"{ip[2]}/{prefixLength}", strict=False)
+    except ValueError:
+        return None
+
+# the start of an IPv4 address with the leading zeros taken off each octet, so it matches the normalised addresses
+# or the text as it is for what could be the start of an IPv6 address, None if it can't be the start of either
+def _normaliseIpPrefix(text):
+    parts = text.split('.')
+    if len(parts) <= 4 and all(part.isdigit() for part in parts[:-1]) and (parts[-1] == '' or parts[-1].isdigit()):
+        return '.'.join(str(int(part)) if part else part for part in parts)
+    if ':' in text and _addressCharacters.match(text):
+        return text
+    return None
+
+def _looksLikeAddress(text):
+    return bool(_addressCharacters.match(text)) and any(character in text for character in ':.-')
+
+# a sorted list kept in chunks of up to 2 * chunkSize entries, with the first entry of each chunk in its own sorted list
+# adding or removing an entry in one big sorted list moves everything after it along (about 50us at 400k entries),
+# in a chunk it only moves the rest of that chunk
+class _sortedIndex:
+    def __init__(self, entries=(), chunkSize=512):
+        self._chunkSize = chunkSize
+        entries = sorted(entries)
+        self._chunks = [entries[i:i + chunkSize] for i in range(0, len(entries), chunkSize)]
+        self._firsts = [chunk[0] for chunk in self._chunks]
+
+    # the chunk an entry belongs in, the last one starting at or before it
+    def _chunkFor(self, entry):
+        return max(bisect.bisect_right(self._firsts, entry) - 1, 0)
+
+    def add(self, entry):
+        if not self._chunks:
+            self._chunks.append([entry])
+            self._firsts.append(entry)
+            return
+        i = self._chunkFor(entry)
+        chunk = self._chunks[i]
+        bisect.insort(chunk, entry)
+        self._firsts[i] = chunk[0]
+        if len(chunk) > 2 * self._chunkSize:
+            half = len(chunk) // 2
+            self._chunks[i:i + 1] = [chunk[:half], chunk[half:]]
+            self._firsts[i:i + 1] = [chunk[0], chunk[half]]
+
+    def discard(self, entry):
+        if not self._chunks:
+            return
+        i = self._chunkFor(entry)
+        chunk = self._chunks[i]
+        j = bisect.bisect_left(chunk, entry)
+        if j < len(chunk) and chunk[j] == entry:
+            del chunk[j]
+            if chunk:
+                self._firsts[i] = chunk[0]
+            else:
+                del self._chunks[i]
+                del self._firsts[i]
+
+    # every entry from the first one at or after entry, in order
+    def iterFrom(self, entry):
+        if not self._chunks:
+            return
+        i = self._chunkFor(entry)
+        j = bisect.bisect_left(self._chunks[i], entry)
+        for chunk in self._chunks[i:]:
+            for k in range(j, len(chunk)):
+                yield chunk[k]
+            j = 0
+
+# type-ahead search over the clients by hostname, MAC address or IP address, held in memory
+# searching tbl_Clients with LIKE '%...%' goes through every row, and MACs and IPs are stored however the console sent
+# them (aa:bb:.., AA-BB-.., aabb.ccdd.., 010.000.001.005) so the same address typed another way wouldn't be found at all
+#
+# every address is normalised once when it is indexed: a MAC to its 12 lower case hex digits, an IPv4 address to plain
+# dotted decimal without leading zeros (and a number, for subnets), an IPv6 address to its compressed form
+# each index is a sorted list of (key, clientId) (kept in chunks, see _sortedIndex), so everything starting with what
+# was typed is found with a binary search (bisect) and then read off in order, https://docs.python.org/3/library/bisect.html
+#   hostnames  the whole hostname and each word in it, so 'iphone' finds johns-iphone.local
+#   macs       normalised MACs, typed with or without separators
+#   ipTexts    normalised IPs, for typing the start of an address
+#   ipNumbers  (version, number), a subnet like 10.0.1.0/24 is every number between its first and last address
+#
+# like topologyGraph it is loaded from the database once and then kept up to date: databaseService updates it after
+# each client push that commits, and the dashboard updates its own from the client rows that changed since its last refresh
+class clientSearch:
+    def __init__(self, dbPath=databaseFile, rebuildRatio=CLIENT_SEARCH_REBUILD_RATIO):
+        self._dbPath = dbPath
+        self._rebuildRatio = rebuildRatio
+        self._clients = {} # clientId -> (hostname, ipAddress, macAddress, active), as stored
+        self._hostnames = _sortedIndex()
+        self._macs = _sortedIndex()
+        self._ipTexts = _sortedIndex()
+        self._ipNumbers = _sortedIndex()
+        self._loaded = False
+        self._lock = threading.Lock() # the collector updates the index while the UI searches it
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    # loads every client from the database, a cursor can be passed in to read inside an open transaction
+    # rows can be passed in instead by something that has just read tbl_Clients anyway (the dashboard)
+    # rows are tuples starting with clientId, hostname, ipAddress, macAddress, active, like the client record
+    def load(self, cur=None, rows=None):
+        if rows is None:
+            con = None
+            if cur is None:
+                cur, con = self._dbConnection()
+            try:
+                rows = cur.execute('''SELECT clientId, hostname, ipAddress, macAddress, active FROM tbl_Clients''').fetchall()
+            finally:
+                if con is not None:
+                    con.close()
+
+        with self._lock:
+            self._clients = {row[0]: (row[1], row[2], row[3], bool(row[4])) for row in rows}
+            self._rebuild()
+            self._loaded = True
+
+    def isLoaded(self):
+        return self._loaded
+
+    # every (index name, entry) a client is in, worked out from its stored record so the same entries can be found to remove
+    def _entries(self, clientId, record):
+        hostname, ipAddress, macAddress, active = record
+        entries = []
+        hostname = (hostname or '').lower()
+        for word in {hostname, *_hostnameSeparators.split(hostname)}:
+            if word:
+                entries.append(('_hostnames', (word, clientId)))
+        mac = _normaliseMac(macAddress)
+        if mac is not None:
+            entries.append(('_macs', (mac, clientId)))
+        ip = _normaliseIp(ipAddress)
+        if ip is not None:
+            version, number, text = ip
+            entries.append(('_ipTexts', (text, clientId)))
+            entries.append(('_ipNumbers', (version, number, clientId)))
+        return entries
+
+    # builds every index again from self._clients, sorting each one once
+    def _rebuild(self):
+        entries = {'_hostnames': [], '_macs': [], '_ipTexts': [], '_ipNumbers': []}
+        for clientId, record in self._clients.items():
+            for name, entry in self._entries(clientId, record):
+                entries[name].append(entry)
+        for name, indexEntries in entries.items():
+            setattr(self, name, _sortedIndex(indexEntries))
+
+    def _insert(self, clientId, record):
+        for name, entry in self._entries(clientId, record):
+            getattr(self, name).add(entry)
+
+    def _remove(self, clientId, record):
+        for name, entry in self._entries(clientId, record):
+            getattr(self, name).discard(entry)
+
+    # adds new clients and updates changed ones, a list of client records or rows like load() takes
+    # a big enough update (eg the first one) sorts the indexes again instead of adding the clients one at a time
+    def update(self, clients):
+        # the last row for a client wins if it is in the list more than once
+        records = {row[0]: (row[1], row[2], row[3], bool(row[4])) for row in clients}
+        with self._lock:
+            changed = []
+            for clientId, record in records.items():
+                old = self._clients.get(clientId)
+                if old != record:
+                    changed.append((clientId, old, record))
+            if not changed:
+                return
+            if len(changed) > self._rebuildRatio * len(self._clients):
+                for clientId, old, record in changed:
+                    self._clients[clientId] = record
+                self._rebuild()
+                return
+            for clientId, old, record in changed:
+                self._clients[clientId] = record
+                # only the active flag changing doesn't move the client in any of the indexes
+                if old is not None and old[:3] == record[:3]:
+                    continue
+                if old is not None:
+                    self._remove(clientId, old)
+                self._insert(clientId, record)
+
+    # marks clients as active/inactive, eg the ones databaseService.detectInactiveClients found had disconnected
+    def setActive(self, clientIds, active):
+        with self._lock:
+            for clientId in clientIds:
+                record = self._clients.get(clientId)
+                if record is not None:
+                    self._clients[clientId] = record[:3] + (bool(active),)
+
+    def remove(self, clientIds):
+        with self._lock:
+            for clientId in clientIds:
+                record = self._clients.pop(clientId, None)
+                if record is not None:
+                    self._remove(clientId, record)
+
+    # reads the clients whose key starts with prefix off a sorted index, until there are limit matches
+    def _scanPrefix(self, index, prefix, field, matches, limit, activeOnly):
+        for key, clientId in index.iterFrom((prefix,)):
+            if len(matches) >= limit or not key.startswith(prefix):
+                break
+            if clientId not in matches and (not activeOnly or self._clients[clientId][3]):
+                matches[clientId] = field
+
+    def _scanRange(self, version, first, last, matches, limit, activeOnly):
+        for entryVersion, number, clientId in self._ipNumbers.iterFrom((version, first)):
+            if len(matches) >= limit or entryVersion != version or number > last:
+                break
+            if clientId not in matches and (not activeOnly or self._clients[clientId][3]):
+                matches[clientId] = 'ipAddress'
+
+    # the clients matching what has been typed so far, best matches first
+    # query can be the start of a hostname or a word in it, the start of a MAC (any separators or none), the start of
+    # an IP address, or a subnet like 10.0.1.0/24. what looks like an address is matched against the addresses first
+    # data is a list of {'clientId', 'hostname', 'ipAddress', 'macAddress', 'active', 'matchedOn'}
+    def search(self, query, limit=CLIENT_SEARCH_LIMIT, activeOnly=False):
+        text = (query or '').strip().lower()
+        limit = max(1, int(limit))
+        matches = {} # clientId -> the field it matched on, in the order found
+        try:
+            with self._lock:
+                if '/' in text:
+                    network = _normaliseNetwork(text)
+                    if network is None:
+                        return {
+                            "successful": False,
+                            "message": "That isn't a valid subnet, eg 10.0.1.0/24.",
+                            "errors": [f"Invalid subnet: {query}"]
+                        }
+                    self._scanRange(network.version, int(network.network_address), int(network.broadcast_address), matches, limit, activeOnly)
+                elif text:
+                    scans = []
+                    mac = _macSeparators.sub('', text)
+                    if mac and len(mac) <= 12 and _hexDigits.match(mac):
+                        scans.append((self._macs, mac, 'macAddress'))
+                    ipPrefix = _normaliseIpPrefix(text)
+                    if ipPrefix:
+                        scans.append((self._ipTexts, ipPrefix, 'ipAddress'))
+                    hostnameScan = (self._hostnames, text, 'hostname')
+                    # a hostname that happens to be hex (eg 'cafe') is still matched, just after the addresses
+                    if _looksLikeAddress(text):
+                        scans.append(hostnameScan)
+                    else:
+                        scans.insert(0, hostnameScan)
+                    for index, prefix, field in scans:
+                        self._scanPrefix(index, prefix, field, matches, limit, activeOnly)
+
+                results = []
+                for clientId, field in matches.items():
+                    hostname, ipAddress, macAddress, active = self._clients[clientId]
+                    results.append({
+                        'clientId': clientId, 'hostname': hostname, 'ipAddress': ipAddress,
+                        'macAddress': macAddress, 'active': active, 'matchedOn': field
+                    })
+            return {
+                "successful": True,
+                "message": f"{len(results)} clients found.",
+                "errors": [],
+                "data": results
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error searching clients.",
+                "errors": [str(error)]
+            }
@@ -1,67 +1,130 @@
 from ..models.models import accessPoint, client, topologyConnection, trafficSample, wifiBroadcast
 from .unifi_api import APIclient
+from .deadline import deadlineExceeded
+from .metrics import timed
 
 class collectData:
 
-    def __init__(self, apiClient = APIclient):
+    # sampler is optional, when a samplingScheduler is passed in it picks which APs get a traffic sample each time
+    # (see services/samplingScheduler.py), otherwise every AP gets one
+    def __init__(self, apiClient = APIclient, sampler=None):
         self._api = apiClient
+        self._sampler = sampler
+        self._deadline = None
+
+    # the cycleDeadline of the run being collected (services/deadline.py), or None for no time limit
+    # it is passed on to the api client for its request timeouts. once it is up, the per-AP samples, per-client topology
+    # and per-broadcast details that are left aren't fetched, and that part of the run is marked incomplete
+    # the lists of APs, clients and broadcasts are one request each, if there isn't time for them deadlineExceeded is raised
+    def setDeadline(self, deadline):
+        self._deadline = deadline
+        if hasattr(self._api, 'setDeadline'): # a stand-in api (eg a benchmark's synthetic one) may not take one
+            self._api.setDeadline(deadline)
+
+    # fetches one AP's sample, one client's topology or one broadcast's details with fetch()
+    # returns None without fetching once the run is out of time, or if the request ran out of time
+    def _fetchInTime(self, part, fetch, *args):
+        if self._deadline is None:
+            return fetch(*args)
+        try:
+            self._deadline.check()
+            return fetch(*args)
+        except deadlineExceeded:
+            self._deadline.markIncomplete(part)
+            return None
 
     def _collectTrafficSample(self, id, state):
-        trafficSampleJSON = self._api.fetchTrafficSample(id)
-       # response format https://developer.ui.com/network/v10.1.84/getadopteddevicelateststatistics
+        # an AP that isn't online has no statistics worth having, so it gets an all zero sample without asking the console
         if state != "ONLINE":
-            trafficSampleObject = trafficSample(id=id, uptimeSec=0, txRetriesPct=0, txRateBps=0, rxRateBps=0)
-        else:
-            trafficSampleObject = trafficSample(id=id, uptimeSec=trafficSampleJSON['uptimeSec'], txRetriesPct=trafficSampleJSON['interfaces']['radios'][0]['txRetriesPct'], txRateBps=trafficSampleJSON['uplink']['txRateBps'], rxRateBps=trafficSampleJSON['uplink']['rxRateBps'])
-        trafficSampleDict = trafficSampleObject.toDictionary()
+            return trafficSample.offline(id)
+
+        statistics = self._fetchInTime('trafficSamples', self._api.fetchTrafficSample, id)
+        if statistics is None: # out of time, the sampler still has it as due so it is sampled first next time
+            return None
+        sample = trafficSample.fromJSON(id, statistics)
+        if self._sampler is not None:
+            self._sampler.recordSample(id, sample) # decides when this AP is sampled next
+
+        return sample
 
-        return trafficSampleDict
+    # just the access points' details, no traffic samples are requested (and the sampler isn't asked)
+    @timed('openhaven_collect_seconds', stage='accessPoints')
+    def collectAccessPoints(self):
+        return [accessPoint.fromJSON(device) for device in self._api.fetchAccessPoints()]
 
+    @timed('openhaven_collect_seconds', stage='accessPoints')
     def collectAPData(self):
-        allDevices = self._api.fetchAccessPoints()
         apData = []
         trafficSamples = []
-        for device in allDevices:
-            ap = accessPoint(id=device['id'], hostname=device['name'], ip=device['ipAddress'], mac=device['macAddress'], state=device['state'])
-            apDict = ap.toDictionary()
-
-            trafficSampleDict = self._collectTrafficSample(ap.accessPointId, device['state'])
-            apData.append(apDict)
-            trafficSamples.append(trafficSampleDict)
+        for apBatch, sampleBatch in self.iterAPData():
+            apData.extend(apBatch)
+            trafficSamples.extend(sampleBatch)
 
         return apData, trafficSamples
 
+    # the same data as collectAPData, batchSize APs at a time, so databaseService can write one batch
+    # while the traffic samples for the next are still being fetched. all of them in one batch if batchSize is None
+    def iterAPData(self, batchSize=None):
+        allDevices = self._api.fetchAccessPoints()
+        sampleIds = None # every AP gets a sample
+        if self._sampler is not None:
+            fetchIds, offlineIds = self._sampler.plan(allDevices)
+            sampleIds = set(fetchIds) | set(offlineIds)
+        batchSize = batchSize or max(len(allDevices), 1)
+        for start in range(0, len(allDevices), batchSize):
+            apData = []
+            trafficSamples = []
+            for device in allDevices[start:start + batchSize]:
+                ap = accessPoint.fromJSON(device)
+                apData.append(ap)
+
+                if sampleIds is None or ap.accessPointId in sampleIds:
+                    sample = self._collectTrafficSample(ap.accessPointId, ap.state)
+                    if sample is not None:
+                        trafficSamples.append(sample)
+            yield apData, trafficSamples
+
     def _collectTopology(self, id):
-        perClientData = self._api.fetchTopology(clientId=id)
+        perClientData = self._fetchInTime('connections', self._api.fetchTopology, id)
+        if perClientData is None: # out of time, the client's connection is left as it was
+            return None
         #extract the client's id, and then its 'uplink' id, which is the id of the router it is connected to
-        toplogy = topologyConnection(clientId=perClientData['id'], accessPointId=perClientData['uplinkDeviceId'])
-        topologyDict = toplogy.toDictionary()
-        return topologyDict
+        return topologyConnection.fromJSON(perClientData)
     
 
+    @timed('openhaven_collect_seconds', stage='clients')
     def collectClientData(self):
-        allClients = self._api.fetchClients()
         clientData = []
         topologyData = []
-        for device in allClients:
-            ip_address = device.get('ipAddress') or "Unknown"
-            clientDevice = client(id=device['id'], hostname=device['name'], ip=ip_address, mac=device['macAddress'])
-            clientDict = clientDevice.toDictionary()
-
-            topologyDict = self._collectTopology(clientDevice.clientId)
-            clientData.append(clientDict)
-            topologyData.append(topologyDict)
+        for clientBatch, topologyBatch in self.iterClientData():
+            clientData.extend(clientBatch)
+            topologyData.extend(topologyBatch)
         return clientData, topologyData
+
+    # the same data as collectClientData, batchSize clients at a time (see iterAPData)
+    def iterClientData(self, batchSize=None):
+        allClients = self._api.fetchClients()
+        batchSize = batchSize or max(len(allClients), 1)
+        for start in range(0, len(allClients), batchSize):
+            clientData = []
+            topologyData = []
+            for device in allClients[start:start + batchSize]:
+                clientDevice = client.fromJSON(device)
+                clientData.append(clientDevice)
+                topology = self._collectTopology(clientDevice.clientId)
+                if topology is not None:
+                    topologyData.append(topology)
+            yield clientData, topologyData
         
+    @timed('openhaven_collect_seconds', stage='wifiBroadcasts')
     def collectWifiBroadcasts(self):
         allWifiBroadcasts = self._api.fetchWifiBroadcasts()
         wifiBroadcastData = []
         for broadcast in allWifiBroadcasts:
             # fetch the broadcast's details, primarily to get whether ssid broadcasting is enabled/disabled
-            broadcastDetails = self._api.fetchBroadcastDetails(broadcast['id'])
-            wifiBroadcastObject = wifiBroadcast(id=broadcast['id'], name=broadcast['name'], active=broadcast['enabled'], hideName=broadcastDetails['hideName'])
-
-            wifiBroadcastDict = wifiBroadcastObject.toDictionary()
-            wifiBroadcastData.append(wifiBroadcastDict)
+            broadcastDetails = self._fetchInTime('wifiBroadcasts', self._api.fetchBroadcastDetails, broadcast['id'])
+            if broadcastDetails is None: # out of time, the broadcast is left as it was
+                continue
+            wifiBroadcastData.append(wifiBroadcast.fromJSON(broadcast, broadcastDetails))
 
         return wifiBroadcastData
\ No newline at end of file
@@ -0,0 +1,202 @@
+import random
+import threading
+import time
+from src.backend.config import COLLECT_CADENCES, COLLECT_JITTER, COLLECT_OVERLAP, COLLECT_BUDGET_FRACTION
+from .deadline import cycleDeadline, cycleWatchdog
+from .metrics import getMetrics
+
+# runs the collection in the background, each part of it on its own cadence (COLLECT_CADENCES):
+#   samples     databaseService.collectSamples()     AP data and traffic samples
+#   topology    databaseService.collectTopology()    AP details, clients, connections and inactive clients
+#   broadcasts  databaseService.collectBroadcasts()  the WiFi broadcasts
+#
+# every job has fixed start times (slots) one cadence apart, so the times don't creep later with every run.
+# each run starts a random amount after its slot, up to COLLECT_JITTER of the cadence, so the jobs of one or many
+# collectors don't all hit the console at the same moment
+#
+# the jobs run one at a time on a single thread, as databaseService keeps the fetched data between its stages and
+# isn't safe to use from two threads. a job that runs past its next slot has overrun, and COLLECT_OVERLAP decides what
+# happens: 'coalesce' runs it once straight away for all of the slots it missed, 'skip' drops them and waits for the
+# next slot. either way the same job never piles up behind itself
+#
+# each run also gets a deadline of budgetFraction of its cadence (see services/deadline.py), so a console that stops
+# answering cuts the run short rather than making it overrun, and what was fetched in time is still written.
+# a cycleWatchdog reports any run that goes past its deadline anyway, and stop() cancels the run that is going
+#
+# for each run the metrics registry gets:
+#   openhaven_schedule_lag_seconds    how late the run started compared to when it was planned (jitter included),
+#                                     ie the time it waited for other jobs
+#   openhaven_schedule_drift_seconds  how far the run started from its slot, jitter and lag together
+#   openhaven_schedule_overruns_total runs that went past their next slot, by job and what was done about it
+class collectionScheduler:
+    # service is a databaseService, cadences is {job name: seconds} with any of the jobs above
+    # onJobFinished is optional, it is called with the job's name and result after every run (eg to tell the dashboard)
+    # budgetFraction is the fraction of a job's cadence each run has as its deadline, None for no deadline
+    # onOverrun is optional, the watchdog calls it with a report for every run that goes past its deadline
+    def __init__(self, service, cadences=None, jitter=COLLECT_JITTER, overlap=COLLECT_OVERLAP, onJobFinished=None, budgetFraction=COLLECT_BUDGET_FRACTION, onOverrun=None):
+        if overlap not in ('coalesce', 'skip'):
+            raise ValueError(f"Unknown overlap policy {overlap}, use 'coalesce' or 'skip'.")
+        functions = {
+            'samples': service.collectSamples,
+            'topology': service.collectTopology,
+            'broadcasts': service.collectBroadcasts
+        }
+        cadences = cadences if cadences is not None else COLLECT_CADENCES
+        self._jitter = jitter
+        self._overlap = overlap
+        self._onJobFinished = onJobFinished
+        self._budgetFraction = budgetFraction
+        self._watchdog = cycleWatchdog(onOverrun=onOverrun)
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._jobs = []
+        for name, cadence in cadences.items():
+            if name not in functions:
+                raise ValueError(f"Unknown collection job {name}.")
+            # every job is due straight away, in the order above, so samples fetch the AP data before topology uses it
+            self._jobs.append({
+                'name': name, 'function': functions[name], 'cadence': cadence,
+                'slot': None, 'plannedAt': None,
+                'runs': 0, 'overruns': 0, 'missedSlots': 0,
+                'lastLag': None, 'maxLag': 0.0, 'lastDrift': None, 'lastDuration': None, 'lastResult': None,
+                'budget': None if budgetFraction is None else cadence * budgetFraction,
+                'deadlineOverruns': 0, 'lastIncomplete': []
+            })
+        self._jobs.sort(key=lambda job: list(functions).index(job['name']))
+
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.isRunning():
+            return
+        now = time.monotonic()
+        with self._lock:
+            for job in self._jobs:
+                job['slot'] = now
+                job['plannedAt'] = now
+        self._stopping.clear()
+        self._watchdog.start()
+        self._thread = threading.Thread(target=self._run, name="collectionScheduler", daemon=True)
+        self._thread.start()
+
+    # stops the scheduler once the job that is running (if any) has finished, nothing is left half written as
+    # every push stage commits on its own. the running job's deadline is cancelled so it stops fetching and writes
+    # what it has straight away. returns False if the job was still running after timeout seconds
+    def stop(self, timeout=None):
+        if self._thread is None:
+            return True
+        self._stopping.set()
+        self._wake.set()
+        self._watchdog.cancelAll("The collection was cancelled as the collector is stopping.")
+        self._thread.join(timeout)
+        stopped = not self._thread.is_alive()
+        if stopped:
+            self._thread = None
+            self._watchdog.stop()
+        return stopped
+
+    # runs a job as soon as the thread is free, eg from a refresh button. asking again before it has run does nothing more
+    def runNow(self, name):
+        with self._lock:
+            for job in self._jobs:
+                if job['name'] == name:
+                    job['plannedAt'] = min(job['plannedAt'], time.monotonic()) if job['plannedAt'] is not None else time.monotonic()
+                    break
+            else:
+                raise ValueError(f"Unknown collection job {name}.")
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self._lock:
+                job = min(self._jobs, key=lambda job: job['plannedAt'], default=None)
+                wait = None if job is None else job['plannedAt'] - time.monotonic()
+            if wait is None or wait > 0:
+                self._wake.wait(wait)
+                self._wake.clear()
+                continue
+            self._runJob(job)
+
+    def _runJob(self, job):
+        metrics = getMetrics()
+        start = time.monotonic()
+        lag = start - job['plannedAt']
+        drift = start - job['slot']
+        metrics.observe('openhaven_schedule_lag_seconds', lag, job=job['name'])
+        metrics.observe('openhaven_schedule_drift_seconds', drift, job=job['name'])
+        deadline = None
+        if job['budget'] is not None:
+            deadline = cycleDeadline(job['budget'], name=job['name'])
+            self._watchdog.watch(deadline)
+        try:
+            result = job['function'](deadline=deadline) if deadline is not None else job['function']()
+        except Exception as error: # the collect methods catch their own errors, this is only a last resort
+            result = {"successful": False, "message": "Error during collection.", "errors": [str(error)]}
+        finally:
+            if deadline is not None:
+                self._watchdog.finished(deadline)
+        finished = time.monotonic()
+
+        with self._lock:
+            job['runs'] += 1
+            job['lastLag'] = lag
+            job['maxLag'] = max(job['maxLag'], lag)
+            job['lastDrift'] = drift
+            job['lastDuration'] = finished - start
+            job['lastResult'] = result
+            if deadline is not None:
+                job['lastIncomplete'] = deadline.incomplete()
+                job['deadlineOverruns'] += 1 if deadline.overrun() > 0 else 0
+
+            cadence = job['cadence']
+            slot = job['slot'] + cadence
+            overran = slot <= finished # the run (or the wait before it) went past the next slot
+            if not overran:
+                job['slot'] = slot
+                job['plannedAt'] = slot + self._random.uniform(0, self._jitter * cadence)
+            else:
+                missed = int((finished - slot) // cadence) + 1
+                job['overruns'] += 1
+                job['missedSlots'] += missed
+                if self._overlap == 'coalesce':
+                    # one run straight away stands in for all of the missed ones, its slot is the latest one missed
+                    job['slot'] = slot + (missed - 1) * cadence
+                    job['plannedAt'] = finished
+                else:
+                    job['slot'] = slot + missed * cadence
+                    job['plannedAt'] = job['slot'] + self._random.uniform(0, self._jitter * cadence)
+        if overran:
+            metrics.incrementCounter('openhaven_schedule_overruns_total', job=job['name'], action=self._overlap)
+        if self._onJobFinished is not None:
+            try:
+                self._onJobFinished(job['name'], result)
+            except Exception: # a broken callback shouldn't stop the collection
+                pass
+
+    # how each job is doing, for the dashboard
+    def getStatus(self):
+        now = time.monotonic()
+        with self._lock:
+            return {job['name']: {
+                'cadence': job['cadence'],
+                'runs': job['runs'],
+                'overruns': job['overruns'],
+                'missedSlots': job['missedSlots'],
+                'lastLag': job['lastLag'],
+                'maxLag': job['maxLag'],
+                'lastDrift': job['lastDrift'],
+                'lastDuration': job['lastDuration'],
+                'lastSuccessful': None if job['lastResult'] is None else job['lastResult']['successful'],
+                'budget': job['budget'],
+                'lastIncomplete': job['lastIncomplete'],
+                'deadlineOverruns': job['deadlineOverruns'],
+                'nextRunIn': None if job['plannedAt'] is None else max(0.0, job['plannedAt'] - now)
+            } for job in self._jobs}
+
+    # the watchdog's overrun reports and the runs it is watching
+    def getWatchdogStatus(self):
+        return self._watchdog.getStatus()
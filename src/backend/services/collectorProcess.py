@@ -0,0 +1,202 @@
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+from src.backend.config import (
+    databaseFile, COLLECT_OVERLAP, COLLECTOR_STATUS_INTERVAL, COLLECTOR_RESTART_DELAY, COLLECTOR_RESTART_MAX_DELAY,
+    COLLECTOR_AUDIT_FLUSH_TIMEOUT, AUDIT_CLOSE_TIMEOUT
+)
+
+# runs the collection in a separate process from the UI
+# in the same process, every collection cycle's json parsing and sqlite writes would hold the GIL away from the
+# pywebview UI, so the dashboard stutters while the data is collected. in its own process the worker has its own GIL
+#
+# the worker owns the APIclient, collectData, databaseService and the collectionScheduler that runs them
+# the UI process only has a collectorSupervisor, which talks to the worker over two multiprocessing queues:
+#   commands (UI -> worker):  ('runNow', job), ('stop',)
+#   events   (worker -> UI):  ('started', pid), ('dataUpdated', job, successful, errors), ('status', scheduler status),
+#                             ('overrun', watchdog report), ('stopped', pid)
+# https://docs.python.org/3/library/multiprocessing.html#exchanging-objects-between-processes
+# the supervisor restarts the worker if it crashes, waiting longer after each crash in a row
+
+# the worker process, it has to be a module level function so the spawned process can import it
+def _collectorMain(commands, events, cadences, overlap, dbPath):
+    # ctrl+c in the terminal is sent to every process in the group, the worker is stopped by the supervisor instead
+    # so it can finish the job it is on
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # imported here so the UI process never loads the collection code (or httpx)
+    from src.backend.config import CONSOLE_IP, API_KEY, SITE_ID, PIPELINE_BATCH_SIZE, SAMPLE_RUNS
+    from .unifi_api import APIclient
+    from .collectData import collectData
+    from .samplingScheduler import samplingScheduler
+    from .database import databaseService
+    from .auditQueue import auditLogQueue
+    from .writeSpool import writeSpool
+    from .collectionScheduler import collectionScheduler
+
+    auditQueue = auditLogQueue(dbPath=dbPath)
+    spool = writeSpool(dbPath=dbPath)
+    service = databaseService(collectData(APIclient(consoleIp=CONSOLE_IP, apiKey=API_KEY, siteId=SITE_ID), sampler=samplingScheduler()), auditQueue=auditQueue, dbPath=dbPath, pipelineBatchSize=PIPELINE_BATCH_SIZE, spool=spool, sampleRuns=SAMPLE_RUNS)
+
+    def jobFinished(name, result):
+        successful, errors = result['successful'], list(result['errors'])
+        # so the audit logs are there when the dashboard refreshes, but a stuck database mustn't hold up the scheduler
+        if not auditQueue.flush(timeout=COLLECTOR_AUDIT_FLUSH_TIMEOUT):
+            successful = False
+            errors.insert(0, f"The audit logs weren't written within {COLLECTOR_AUDIT_FLUSH_TIMEOUT} seconds.")
+        events.put(('dataUpdated', name, successful, errors[:10]))
+
+    # a run that goes past its deadline is reported to the UI straight away, rather than with the next status
+    def overrun(report):
+        events.put(('overrun', report))
+
+    scheduler = collectionScheduler(service, cadences, overlap=overlap, onJobFinished=jobFinished, onOverrun=overrun)
+    scheduler.start()
+    events.put(('started', os.getpid()))
+    try:
+        while True:
+            try:
+                command = commands.get(timeout=COLLECTOR_STATUS_INTERVAL)
+            except queue.Empty:
+                command = ('status',)
+            if command[0] == 'stop':
+                break
+            if command[0] == 'runNow':
+                try:
+                    scheduler.runNow(command[1])
+                except ValueError:
+                    pass
+            events.put(('status', scheduler.getStatus()))
+    finally:
+        scheduler.stop()
+        spool.close()
+        auditQueue.close(timeout=AUDIT_CLOSE_TIMEOUT) # anything it couldn't write by then is lost with the process
+        events.put(('stopped', os.getpid()))
+
+# lives in the UI process, starts the worker and restarts it if it crashes
+class collectorSupervisor:
+    # onDataUpdated is optional, it is called with the job's name whenever the worker has written new data,
+    # eg dashboardAPI.notifyDataUpdated so the next refresh reads it straight away
+    def __init__(self, cadences=None, overlap=COLLECT_OVERLAP, dbPath=databaseFile, onDataUpdated=None):
+        from src.backend.config import COLLECT_CADENCES
+        self._cadences = cadences if cadences is not None else COLLECT_CADENCES
+        self._overlap = overlap
+        self._dbPath = dbPath
+        self._onDataUpdated = onDataUpdated
+        # spawn starts a fresh interpreter, rather than a fork of the UI process with all of its threads
+        self._context = multiprocessing.get_context('spawn')
+        self._process = None
+        self._commands = None
+        self._events = None
+        self._startedAt = None
+        self._monitor = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._restarts = 0
+        self._lastExitCode = None
+        self._jobs = {} # the last status the worker sent
+        self._lastResults = {} # job -> (successful, errors) of its last run
+        self._overruns = [] # the watchdog's last reports of runs going past their deadline, newest last
+
+    def start(self):
+        if self._monitor is not None and self._monitor.is_alive():
+            return
+        self._stopping.clear()
+        self._startWorker()
+        self._monitor = threading.Thread(target=self._watch, name="collectorSupervisor", daemon=True)
+        self._monitor.start()
+
+    def _startWorker(self):
+        # new queues for every worker, as a worker that is killed while writing to a queue can leave it unusable
+        self._commands = self._context.Queue()
+        self._events = self._context.Queue()
+        self._process = self._context.Process(
+            target=_collectorMain,
+            args=(self._commands, self._events, self._cadences, self._overlap, self._dbPath),
+            name="openhavenCollector",
+            daemon=True
+        )
+        self._process.start()
+        self._startedAt = time.monotonic()
+
+    # reads the worker's events, and restarts the worker when it exits without being asked to
+    def _watch(self):
+        delay = COLLECTOR_RESTART_DELAY
+        while not self._stopping.is_set():
+            try:
+                self._handleEvent(self._events.get(timeout=0.5))
+            except queue.Empty:
+                pass
+            if self._process.is_alive() or self._stopping.is_set():
+                continue
+
+            with self._lock:
+                self._lastExitCode = self._process.exitcode
+                self._pid = None
+            # a worker that had been running for a while starts the backoff again
+            if time.monotonic() - self._startedAt >= COLLECTOR_RESTART_MAX_DELAY:
+                delay = COLLECTOR_RESTART_DELAY
+            if self._stopping.wait(delay):
+                break
+            delay = min(delay * 2, COLLECTOR_RESTART_MAX_DELAY)
+            with self._lock:
+                self._restarts += 1
+            self._startWorker()
+
+    def _handleEvent(self, event):
+        kind = event[0]
+        with self._lock:
+            if kind == 'started':
+                self._pid = event[1]
+            elif kind == 'status':
+                self._jobs = event[1]
+            elif kind == 'dataUpdated':
+                self._lastResults[event[1]] = (event[2], event[3])
+            elif kind == 'overrun':
+                self._overruns = (self._overruns + [event[1]])[-20:]
+        if kind == 'dataUpdated' and self._onDataUpdated is not None:
+            try:
+                self._onDataUpdated(event[1])
+            except Exception: # a broken callback shouldn't stop the supervisor
+                pass
+
+    # runs a collection job in the worker as soon as it is free, eg from a refresh button
+    def runNow(self, name):
+        if self._process is not None and self._process.is_alive():
+            self._commands.put(('runNow', name))
+
+    # asks the worker to finish its current job and exit, it is killed if it hasn't after timeout seconds
+    def stop(self, timeout=30):
+        self._stopping.set()
+        if self._monitor is not None:
+            self._monitor.join()
+            self._monitor = None
+        if self._process is None:
+            return True
+        stopped = True
+        if self._process.is_alive():
+            self._commands.put(('stop',))
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+                self._process.join()
+                stopped = False
+        with self._lock:
+            self._lastExitCode = self._process.exitcode
+            self._pid = None
+        self._process = None
+        return stopped
+
+    def getStatus(self):
+        with self._lock:
+            return {
+                'running': self._process is not None and self._process.is_alive(),
+                'pid': self._pid,
+                'restarts': self._restarts,
+                'lastExitCode': self._lastExitCode,
+                'overruns': list(self._overruns),
+                'jobs': {name: dict(status, lastErrors=self._lastResults.get(name, (None, []))[1]) for name, status in self._jobs.items()}
+            }
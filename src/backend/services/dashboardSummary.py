@@ -0,0 +1,113 @@
+import sqlite3
+from src.backend.config import databaseFile
+
+# the counts for the overview page, read from the single row of tbl_DashboardSummary
+# the row is kept up to date by triggers in data/schema.sql whenever the APs, clients, connections, broadcasts or
+# samples change, whoever changes them (the collector, the snapshot importer, data retention or admin actions)
+# so nothing here has to be called when data is written
+class dashboardSummary:
+    # the columns of tbl_DashboardSummary after summaryId, in the same order as vw_DashboardSummary
+    fields = [
+        'accessPoints', 'apsOnline', 'apsOffline', 'apsUpdating', 'apsGettingReady', 'apsConnectionInterrupted',
+        'clients', 'activeClients', 'connections', 'broadcasts', 'broadcastsEnabled', 'broadcastsHidden', 'lastSample'
+    ]
+    # apState -> the column counting the APs in that state
+    stateFields = {
+        'ONLINE': 'apsOnline', 'OFFLINE': 'apsOffline', 'UPDATING': 'apsUpdating',
+        'GETTING_READY': 'apsGettingReady', 'CONNECTION_INTERRUPTED': 'apsConnectionInterrupted'
+    }
+
+    def __init__(self, dbPath=databaseFile):
+        self._dbPath = dbPath
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    def _toSummary(self, row):
+        summary = dict(zip(self.fields, row))
+        summary['apsByState'] = {state: summary[field] for state, field in self.stateFields.items()}
+        # clients only connect to online APs, so that is what they are shared between
+        summary['clientsPerAccessPoint'] = round(summary['connections'] / summary['apsOnline'], 1) if summary['apsOnline'] else 0
+        return summary
+
+    def getSummary(self):
+        cur, con = self._dbConnection()
+        try:
+            row = cur.execute('''SELECT %s FROM tbl_DashboardSummary WHERE summaryId = 1''' % ', '.join(self.fields)).fetchone()
+            if row is None:
+                return {
+                    "successful": False,
+                    "message": "The dashboard summary hasn't been set up, run scripts/init_db.py.",
+                    "errors": ["tbl_DashboardSummary is empty"]
+                }
+            return {
+                "successful": True,
+                "message": "Dashboard summary loaded.",
+                "errors": [],
+                "data": self._toSummary(row)
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error loading the dashboard summary.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+    # works every count out again from scratch with vw_DashboardSummary and compares it with the row
+    # both are read in one transaction so a collection writing in between can't make them look different
+    # data is {field: {'stored': ..., 'recomputed': ...}} for every field that doesn't match, empty when it all does
+    def verify(self):
+        cur, con = self._dbConnection()
+        try:
+            cur.execute('''BEGIN''')
+            stored = cur.execute('''SELECT %s FROM tbl_DashboardSummary WHERE summaryId = 1''' % ', '.join(self.fields)).fetchone()
+            recomputed = cur.execute('''SELECT %s FROM vw_DashboardSummary''' % ', '.join(self.fields)).fetchone()
+            stored = stored or (None,) * len(self.fields)
+            mismatches = {
+                field: {'stored': storedValue, 'recomputed': recomputedValue}
+                for field, storedValue, recomputedValue in zip(self.fields, stored, recomputed)
+                if storedValue != recomputedValue
+            }
+            return {
+                "successful": not mismatches,
+                "message": "The dashboard summary matches the tables." if not mismatches else f"{len(mismatches)} dashboard summary counts don't match the tables.",
+                "errors": [f"{field}: stored {values['stored']}, recomputed {values['recomputed']}" for field, values in mismatches.items()],
+                "data": mismatches
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error checking the dashboard summary.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.rollback()
+            con.close()
+
+    # replaces the row with a full recompute, for if verify() ever finds it has drifted
+    # (eg rows changed while the triggers had been dropped by hand)
+    def rebuild(self):
+        cur, con = self._dbConnection()
+        try:
+            cur.execute(
+                '''INSERT OR REPLACE INTO tbl_DashboardSummary (summaryId, %s) SELECT 1, %s FROM vw_DashboardSummary''' % (', '.join(self.fields), ', '.join(self.fields))
+            )
+            con.commit()
+            return {
+                "successful": True,
+                "message": "Dashboard summary rebuilt.",
+                "errors": []
+            }
+        except Exception as error:
+            con.rollback()
+            return {
+                "successful": False,
+                "message": "Error rebuilding the dashboard summary.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
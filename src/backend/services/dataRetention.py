@@ -1,13 +1,14 @@
 import sqlite3
 from src.backend.config import databaseFile
 from datetime import datetime, timedelta
+from .metrics import timed
 
 class dataRetention:
-    def __init__(self):
-        pass
+    def __init__(self, dbPath=databaseFile):
+        self._dbPath = dbPath
 
     def _dbConnection(self):
-        con = sqlite3.connect(databaseFile)
+        con = sqlite3.connect(self._dbPath)
         cur = con.cursor()
         return cur, con
     
@@ -53,12 +54,43 @@ class dataRetention:
             (cutoffDateStr,)
         )
 
+    # names that are no longer used by any audit log after the old logs are deleted
+    def _deleteUnusedAuditNames(self, cur, con):
+        cur.execute(
+            '''DELETE FROM tbl_AuditNames WHERE nameId NOT IN (SELECT subjectNameId FROM tbl_AuditLogs WHERE subjectNameId IS NOT NULL)
+            AND nameId NOT IN (SELECT targetNameId FROM tbl_AuditLogs WHERE targetNameId IS NOT NULL)'''
+        )
+
+    # a run of samples (see services/sampleRuns.py) is only deleted once its last sample is too old
     def _deleteOldSamples(self, cur, con, cutoffDateStr):
         cur.execute(
-            '''DELETE FROM tbl_TrafficSamples WHERE dateCreated < ?''',
+            '''DELETE FROM tbl_TrafficSamples WHERE coalesce(endDate, dateCreated) < ?''',
+            (cutoffDateStr,)
+        )
+
+    # old roams and their hourly totals are kept for the same retention period
+    def _deleteOldRoams(self, cur, con, cutoffDateStr):
+        cur.execute(
+            '''DELETE FROM tbl_RoamEvents WHERE dateCreated < ?''',
+            (cutoffDateStr,)
+        )
+        cur.execute(
+            '''DELETE FROM tbl_ClientRoamsHourly WHERE hour < ?''',
+            (cutoffDateStr,)
+        )
+        cur.execute(
+            '''DELETE FROM tbl_APRoamsHourly WHERE hour < ?''',
+            (cutoffDateStr,)
+        )
+
+    # the record of old collection runs goes too
+    def _deleteOldCollectionRuns(self, cur, con, cutoffDateStr):
+        cur.execute(
+            '''DELETE FROM tbl_CollectionRuns WHERE dateCreated < ?''',
             (cutoffDateStr,)
         )
 
+    @timed('openhaven_retention_seconds', failures='openhaven_retention_failures_total')
     def deleteOldData(self):
         cur, con = self._dbConnection()
 
@@ -72,6 +104,9 @@ class dataRetention:
             cutoffDateStr = cutoffDate.strftime("%Y-%m-%d %H:%M:%S")
 
             self._deleteOldLogs(cur, con, cutoffDateStr)
+            self._deleteUnusedAuditNames(cur, con)
+            self._deleteOldRoams(cur, con, cutoffDateStr)
+            self._deleteOldCollectionRuns(cur, con, cutoffDateStr)
             self._deleteOldSamples(cur, con, cutoffDateStr)
             con.commit()
 
@@ -1,31 +1,77 @@
 # importing the collectData class that will allow me to get all the dictionaries of data that will be examined and pushed to the database
 from .collectData import collectData
+from .auditQueue import insertAuditEvents
+from .topologyGraph import topologyGraph
+from .roamAnalytics import roamAnalytics
+from .sampleRuns import writeSampleRuns
+from .deadline import deadlineExceeded
+from .metrics import timed
+from .profiler import getProfiler
+from ..models.models import auditEvent, auditEventType
 
+import queue
 import sqlite3
-from src.backend.config import databaseFile
+import threading
+import time
+from datetime import datetime, timezone
+from src.backend.config import databaseFile, PIPELINE_QUEUE_SIZE
 
 class databaseService():
-    def __init__(self, collectDataInstance):
+    # auditQueue is optional, when an auditLogQueue is passed in the audit logs are written in the background
+    # instead of inside each push method's transaction
+    # topologyGraphInstance is optional, when a topologyGraph is passed in it is kept up to date with every connection push
+    # dbPath is the database file to use, the app's own database unless another one is passed in
+    # pipelineBatchSize is optional, when it is set the access points and clients are fetched and written in batches of
+    # that size at the same time (see _runPipeline), PIPELINE_BATCH_SIZE is a good default
+    # spool is optional, when a writeSpool is passed in the traffic samples that can't be written are kept in it and
+    # written later instead of being lost (see services/writeSpool.py)
+    # sampleRuns is optional, when it is True unchanged traffic samples are stored as runs (see services/sampleRuns.py)
+    # clientSearchInstance is optional, when a loaded clientSearch is passed in it is kept up to date with every client push
+    def __init__(self, collectDataInstance, auditQueue=None, topologyGraphInstance=None, dbPath=databaseFile, pipelineBatchSize=None, spool=None, sampleRuns=False, clientSearchInstance=None):
+        self._dbPath = dbPath
+        self._pipelineBatchSize = pipelineBatchSize
+        self._spool = spool
+        self._sampleRuns = sampleRuns
         self._collectData = collectDataInstance
+        self._auditQueue = auditQueue
+        self._topologyGraph = topologyGraphInstance
+        self._clientSearch = clientSearchInstance
+        self._roamAnalytics = roamAnalytics(dbPath=dbPath)
+        self._pendingAuditLogs = [] # audit logs waiting for the current transaction to commit before being queued
         self._apData = None
         self._trafficSamples = None
         self._clientData = None
         self._topologyData = None
+        self._deadline = None # the cycleDeadline of the run in progress, if it was given one
 
     # establishes connection to the database; I will reuse this throughout my methods, so I made it into its own protected method
+    # the cursor comes from the profiler, which times each statement while a cycle is being profiled
     def _dbConnection(self):
-        con = sqlite3.connect(databaseFile)
-        cur = con.cursor()
+        con = sqlite3.connect(self._dbPath)
+        cur = getProfiler().cursor(con)
         return cur, con
     
     # Method for creating a network audit log based of the events that are detected throughout all of the below processes
-    # Optionally pass in the clientId and accessPointId
-    def _pushNetworkAuditLog(self, cur, con, message, clientId=None, accessPointId=None):
-        # Insert the log message into tbl_AuditLogs, and optionally if available the clientId, accessPointId, or both
-        cur.execute(
-            '''INSERT INTO tbl_AuditLogs (logMessage, clientId, accessPointId) VALUES (?, ?, ?)''',
-            (message, clientId, accessPointId) 
-        )
+    # the log is stored as an event type (see auditEventType) plus the names and ids involved, the message is only
+    # put together when the log is read. Optionally pass in the clientId, accessPointId and broadcastId
+    def _pushNetworkAuditLog(self, cur, con, eventType, subject, target=None, clientId=None, accessPointId=None, broadcastId=None):
+        event = auditEvent(eventType, subject=subject, target=target, accessPointId=accessPointId, clientId=clientId, broadcastId=broadcastId).toDictionary()
+        self._pushNetworkAuditEvents(cur, [event])
+
+    # same as above for a list of auditEvent dictionaries, written with one executemany
+    def _pushNetworkAuditEvents(self, cur, events):
+        if self._auditQueue is not None:
+            # held back until the push method commits, so a rolled back change never gets an audit log
+            self._pendingAuditLogs.extend(events)
+            return
+        # Insert the events into tbl_AuditLogs straight away, inside the push method's transaction
+        insertAuditEvents(cur, events)
+
+    # called straight after a commit, hands the audit logs for that transaction to the background writer
+    def _releaseAuditLogs(self):
+        if self._auditQueue is not None and self._pendingAuditLogs:
+            self._auditQueue.enqueueMany(self._pendingAuditLogs)
+        self._pendingAuditLogs = []
 
     # this method checks if I already collected the AP and traffic sample data
     # avoids multiple api calls to fetch the same data
@@ -36,18 +82,34 @@ class databaseService():
     # the simplest data collection and push to db will be traffic samples, as I do not need to do any additional checks, just create new records for all of them
     # traffic samples is historical data
 
+    # inserts a list of traffic samples, inside the caller's transaction
+    def _writeTrafficSamples(self, cur, trafficSamples):
+        if self._sampleRuns:
+            writeSampleRuns(cur, trafficSamples)
+            return
+        cur.executemany(
+            '''INSERT INTO tbl_TrafficSamples (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps) VALUES (?, ?, ?, ?, ?)''', # Inserts each traffic sample into the table
+            # each trafficSample record is already the parameters in the right order, but sqlite binds a plain tuple
+            # faster than a tuple subclass so they are passed as plain tuples (see scripts/benchmarks/models.py)
+            map(tuple, trafficSamples)
+        )
+
+    @timed('openhaven_push_seconds', failures='openhaven_push_failures_total', stage='trafficSamples')
     def pushTrafficSamples(self):
         # as AP data and traffic samples are collected together, I call collectAPData then just use the traffic sample data
         # I conditionally check in the first protected method _fetchAPData to see if I have already collected the data
         # this is because i will need the AP device dictionary later on, and do not want to make another API call as that would be ineffcient
         self._fetchAPData()
-        cur, con = self._dbConnection() # Establishes sql connection and cursor
+        if self._spool is not None and self._spool.hasPending():
+            # older samples are still waiting in the spool, so these go in behind them to keep the samples in order
+            self._spoolTrafficSamples(self._trafficSamples)
+            return self._replaySpool()
         try:
-            for sample in self._trafficSamples: # Loops through each traffic sample in the dictionary of all of them
-                cur.execute(
-                    '''INSERT INTO tbl_TrafficSamples (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps) VALUES (?, ?, ?, ?, ?)''', # Inserts each traffic sample into the table
-                    (sample['accessPointId'], sample['uptimeSec'], sample['txRetriesPct'], sample['txRateBps'], sample['rxRateBps'])
-                )
+            cur, con = self._dbConnection() # Establishes sql connection and cursor
+        except sqlite3.Error as error: # eg the database file can't be opened
+            return self._trafficSamplesFailed(error)
+        try:
+            self._writeTrafficSamples(cur, self._trafficSamples)
             con.commit() # Commits the transaction to save changes 
             return {
                 "successful": True,
@@ -56,33 +118,76 @@ class databaseService():
             }
         except Exception as error: # catches any errors that occur in trying to do the above
             con.rollback() # rolls back the entire operation if one of the inserts fail, that way the database is not partially updated
-            return{
+            return self._trafficSamplesFailed(error)
+        finally:
+            con.close() # finally, close the connection to the sql database
+
+    # only problems with the database itself (locked, busy, read only, full or missing) are worth spooling for,
+    # a sample the table won't accept would fail again every time it was replayed
+    def _canSpool(self, error):
+        return self._spool is not None and isinstance(error, sqlite3.DatabaseError) and not isinstance(error, (sqlite3.IntegrityError, sqlite3.DataError, sqlite3.ProgrammingError))
+
+    # adds traffic samples to the spool with the time they were collected, as they may be written a long time after
+    def _spoolTrafficSamples(self, trafficSamples):
+        # same format and timezone (UTC) as sqlite's CURRENT_TIMESTAMP
+        dateCreated = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        return self._spool.append('trafficSamples', [sample + (dateCreated,) for sample in trafficSamples])
+
+    def _trafficSamplesFailed(self, error):
+        if not self._canSpool(error):
+            return {
                 "successful": False,
                 'message': "Error inserting traffic sample.",
                 "errors": [str(error)]
             }
-        finally:
-            con.close() # finally, close the connection to the sql database
+        spooled = self._spoolTrafficSamples(self._trafficSamples)
+        self._spool.sync()
+        self._spool.deferReplay()
+        return {
+            "successful": False,
+            "message": f"Error inserting traffic samples, {spooled} were kept in the spool to be written later.",
+            "errors": [str(error)],
+            "data": self._spool.getStatus()
+        }
+
+    # fsyncs the spool, then writes everything in it to the database unless it is still waiting after a failed attempt
+    # so while the database is locked it is only tried every so often, not by every push
+    def _replaySpool(self):
+        self._spool.sync()
+        if not self._spool.replayDue():
+            return {
+                "successful": True,
+                "message": "Traffic samples kept in the spool until the db can be written to again.",
+                "errors": [],
+                "data": self._spool.getStatus()
+            }
+        return self._spool.replay(sampleRuns=self._sampleRuns)
+
 
+    # inserts or updates a list of access points with their audit logs, inside the caller's transaction
+    def _writeAPData(self, cur, con, apData):
+        for ap in apData: # Loops through each access point in the dictionary
+            cur.execute(
+                '''INSERT INTO tbl_APdevices (accessPointId, hostname, ipAddress, macAddress, apState) VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(accessPointId) DO UPDATE SET hostname=excluded.hostname, ipAddress=excluded.ipAddress, macAddress=excluded.macAddress, apState=excluded.apState''',
+                ap # the accessPoint record's fields are in the same order as the columns
+            ) # ON CONFLICT(accessPointId) DO UPDATE SET allows me to update any change in the details of each access point that already exits in the table
+            if cur.rowcount == 1: # checking if a new row was inserted from last sql operation
+                eventType = auditEventType.AP_ADDED
+            else: # otherwise it has just updated an existing record (rowcount 0)
+                eventType = auditEventType.AP_UPDATED
+            # push the aduit log for the ap
+            self._pushNetworkAuditLog(con=con, cur=cur, eventType=eventType, subject=ap.hostname, accessPointId=ap.accessPointId)
 
+    @timed('openhaven_push_seconds', failures='openhaven_push_failures_total', stage='accessPoints')
     def pushAPData(self): # Method to push new access point data to the database
-        self._fetchAPData() # Fetches data if not done so already for the APs
+        if self._apData is None:
+            self._fetchAPData() # Fetches data if not done so already for the APs
         cur, con = self._dbConnection() # establishes sql connection and cursor
         try:
-            for ap in self._apData: # Loops through each access point in the dictionary
-                cur.execute(
-                    '''INSERT INTO tbl_APdevices (accessPointId, hostname, ipAddress, macAddress, apState) VALUES (?, ?, ?, ?, ?)
-                    ON CONFLICT(accessPointId) DO UPDATE SET hostname=excluded.hostname, ipAddress=excluded.ipAddress, macAddress=excluded.macAddress, apState=excluded.apState''',
-                    (ap['accessPointId'], ap['hostname'], ap['ipAddress'], ap['macAddress'], ap['state'])
-                ) # ON CONFLICT(accessPointId) DO UPDATE SET allows me to update any change in the details of each access point that already exits in the table
-                if cur.rowcount == 1: # checking if a new row was inserted from last sql operation
-                    message = f"Access point {ap['hostname']} was added to the network."
-                else: # otherwise it has just updated an existing record (rowcount 0)
-                    message = f"Access point {ap['hostname']} was updated."
-                # push the aduit log for the ap and message
-                self._pushNetworkAuditLog(con=con, cur=cur, message=message, accessPointId=ap['accessPointId'])
-            
+            self._writeAPData(cur, con, self._apData)
             con.commit() # Commits the transaction, saves changes
+            self._releaseAuditLogs()
             return {
                 "successful": True,
                 "message": "AP data successfuly inserted or updated in db.",
@@ -96,8 +201,10 @@ class databaseService():
             }
         finally:
             con.close() # Closes the connection to the SQL database
+            self._pendingAuditLogs = [] # drops the audit logs of a transaction that did not commit
 
 
+    @timed('openhaven_push_seconds', failures='openhaven_push_failures_total', stage='wifiBroadcasts')
     def pushWifiBroadcastData(self): # Method to push new wifi broadcast data into the database
         wifiBroadcasts = self._collectData.collectWifiBroadcasts() # collects all wifi broadcast data using the collectData service
         cur, con = self._dbConnection() # Esatblishes connection to the SQL database and cursor
@@ -106,14 +213,15 @@ class databaseService():
                 cur.execute(
                     '''INSERT INTO tbl_WifiBroadcasts (broadcastId, ssid, active, hideName) VALUES (?, ?, ?, ?)
                     ON CONFLICT(broadcastId) DO UPDATE SET ssid=excluded.ssid, active=excluded.active, hideName=excluded.hideName''',
-                    (broadcast['broadcastId'], broadcast['ssid'], broadcast['active'], broadcast['hideName'])
+                    broadcast # the wifiBroadcast record's fields are in the same order as the columns
                 ) # ON CONFLICT(broadcastId) DO UPDATE SET works the same as in the pushAPData method, updating any changes in attributes for pre-existing records
                 if cur.rowcount == 1: # checks if a new row was inserted from the last INSERT/UPDATE operation
-                    message = f"Wifi broadcast {broadcast['ssid']} was added to the network." # Message to say new broadcast was added
+                    eventType = auditEventType.BROADCAST_ADDED # new broadcast was added
                 else: # rowcount is 0, so no new insert, just an update of an existing record
-                    message = f"Wifi broadcast {broadcast['ssid']} was updated."
-                self._pushNetworkAuditLog(con=con, cur=cur, message=message)
+                    eventType = auditEventType.BROADCAST_UPDATED
+                self._pushNetworkAuditLog(con=con, cur=cur, eventType=eventType, subject=broadcast.ssid, broadcastId=broadcast.broadcastId)
             con.commit() # commits the transaction and saves changes
+            self._releaseAuditLogs()
             return {
                 "successful": True,
                 "message": "WiFi broadcasts successfully inserted or updated in db.",
@@ -128,6 +236,13 @@ class databaseService():
                 }
         finally:
             con.close() # closes the connection to the database
+            self._pendingAuditLogs = []
+
+    # the shared client search index is only changed once the database has the same changes, like the topology graph
+    # one that hasn't been loaded yet is left alone, it reads every client when it is loaded
+    def _updateClientSearch(self, clientData):
+        if self._clientSearch is not None and self._clientSearch.isLoaded():
+            self._clientSearch.update(clientData)
 
     # Checks if client data and topology data have already been collected to prevent the app from making too many API calls
     # these two sets of data are collected together in the collectData service, so I check for both
@@ -135,57 +250,65 @@ class databaseService():
         if self._clientData is None or self._topologyData is None:
             self._clientData, self._topologyData = self._collectData.collectClientData()
 
-    def _clientRoamDetected(self, clientId, newAccessPointId, cur, con):
-        # Create a network audit log saying that client roamed from ap (currentAPid) to ap (topology['accessPointId'])
-        # Need to fetch the hostnames of each of the involved devices
-        apName = cur.execute(
-            '''SELECT hostname FROM tbl_APdevices WHERE accessPointId = ?''',
-            (newAccessPointId,)
+    # Creates the network audit event saying that client roamed to ap newAccessPointId
+    # pushConnectionData collects these and pushes them all at once
+    def _clientRoamDetected(self, clientId, newAccessPointId, clientName, apName):
+        return auditEvent(auditEventType.CLIENT_ROAMED, subject=clientName, target=apName, clientId=clientId, accessPointId=newAccessPointId).toDictionary()
+
+    # the shared topology graph if there is one, otherwise one loaded from the table in one query,
+    # rather than one SELECT per client like before
+    def _loadedGraph(self, cur):
+        graph = self._topologyGraph
+        if graph is None or not graph.isLoaded():
+            graph = graph or topologyGraph(self._dbPath)
+            graph.load(cur)
+        return graph
+
+    # writes the connection changes for a list of topology data, inside the caller's transaction
+    # clientData is the fetched client data the topology came from, for the client names in the audit logs
+    # returns the changes, which are applied to the graph once the caller has committed
+    def _writeConnectionData(self, cur, graph, topologyData, clientData):
+        # compares each fetched client-AP pair with the current connections
+        changes = graph.diff(topologyData)
+
+        # new client-AP connections are inserted, and clients connected to a different AP than before are updated
+        cur.executemany(
+            '''INSERT INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''',
+            changes['newConnections']
         )
-        apName = apName.fetchone()[0] # getting the hostname value from the tuple generated by .fetchone()
-        clientName = cur.execute(
-            '''SELECT hostname FROM tbl_Clients WHERE clientId = ?''',
-            (clientId,)
+        cur.executemany(
+            '''UPDATE tbl_Connections SET accessPointId = ? WHERE clientId = ?''',
+            [(newAccessPointId, clientId) for clientId, oldAccessPointId, newAccessPointId in changes['roams']]
         )
-        clientName = clientName.fetchone()[0] # getting the hostname value from the tuple generated by .fetchone()
+        # the roams also go into the roam history and its hourly totals, in the same transaction
+        self._roamAnalytics.recordRoams(cur, changes['roams'])
 
-        # Create the log message
-        message = f"Client {clientName} roamed to AP {apName}."
-        # Call the protected method that actually pushes the log into the database
-        self._pushNetworkAuditLog(con=con, cur=cur, message=message, clientId=clientId, accessPointId=newAccessPointId)
+        # both are logged as the client roaming to its AP, the hostnames come from the fetched client data
+        # and one query for the access points, instead of two SELECTs for every roam
+        if changes['newConnections'] or changes['roams']:
+            clientNames = {client.clientId: client.hostname for client in clientData}
+            apNames = dict(cur.execute('''SELECT accessPointId, hostname FROM tbl_APdevices''').fetchall())
+            moves = changes['newConnections'] + [(clientId, newAccessPointId) for clientId, oldAccessPointId, newAccessPointId in changes['roams']]
+            roamEvents = [self._clientRoamDetected(clientId=clientId, newAccessPointId=accessPointId, clientName=clientNames.get(clientId), apName=apNames.get(accessPointId)) for clientId, accessPointId in moves]
+            self._pushNetworkAuditEvents(cur, roamEvents)
+        return changes
 
     # Method to push new or updated client - access point connections to the link table in the database, tbl_Connections
+    @timed('openhaven_push_seconds', failures='openhaven_push_failures_total', stage='connections')
     def pushConnectionData(self):
         self._fetchClientData() # Fetching client and topology data if not done already
         cur, con = self._dbConnection() # Establishes connection to database and cursor
         
         try:
-            for topology in self._topologyData: # Loops through each client-AP pair in the dictionary
-                # Checking if there is already a record for the client with cliendId in the database
-                res = cur.execute(
-                    '''SELECT accessPointId FROM tbl_Connections WHERE clientId = ?''',
-                    (topology['clientId'],)
-                )
-                existing = res.fetchone() # .fetchone() will return None if no records, or a tuple of (accessPointId) if there is an existing record
-                if existing:
-                    currentAPid = existing[0] # extract the value of this accessPointId from the tuple
-                    if currentAPid != topology['accessPointId']: # compares the new fetched accessPointId with the current one in the record
-                        # updates it to the new accessPointId if they are not the same
-                        cur.execute( 
-                            '''UPDATE tbl_Connections SET accessPointId = ? WHERE clientId = ?''',
-                            (topology['accessPointId'], topology['clientId'])
-                        )
-                        # Call the protected method clientRoamDetected to create a network audit log for this event
-                        self._clientRoamDetected(clientId=topology['clientId'], newAccessPointId=topology['accessPointId'], cur=cur, con=con)
-                else:
-                    # otherwise, there is a new client-AP connection that needs to be inserted as a new record in tbl_Connections
-                    cur.execute(
-                        '''INSERT INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''',
-                        (topology['clientId'], topology['accessPointId'])
-                    )
-                    # create a network audit log saying that a new client roamed to its respective AP
-                    self._clientRoamDetected(clientId=topology['clientId'], newAccessPointId=topology['accessPointId'], cur=cur, con=con)
+            # the current connections come from the topology graph if there is one, otherwise they are read from the
+            # table in one query, rather than one SELECT per client like before
+            graph = self._loadedGraph(cur)
+            changes = self._writeConnectionData(cur, graph, self._topologyData, self._clientData)
             con.commit() # commits the transaction and saves changes
+            self._releaseAuditLogs()
+            # the shared graph is only changed once the database has the same changes
+            if graph is self._topologyGraph:
+                graph.apply(changes)
             return {
                 "successful": True,
                 "message": "Connection data inserted successfuly.",
@@ -200,46 +323,52 @@ class databaseService():
             }
         finally:
             con.close() # Finally closes the connection to the database
+            self._pendingAuditLogs = []
     
+    # inserts new clients and updates existing ones with their audit logs, inside the caller's transaction
+    def _writeClientData(self, cur, con, clientData):
+        for client in clientData: # Loops through each client in the dictionary
+            # Checking for existing record with clientId's that have been fetched and their active status
+            res = cur.execute(
+                '''SELECT clientId, active FROM tbl_Clients WHERE clientId = ?''',
+                (client.clientId,)
+            )
+            # existing will be None if no existing record for the clientId, or if there is it will be a tuple of (clientId, active)
+            existing = res.fetchone()
+            if existing:
+                if not existing[1]:  # existing[1] is the active field, I am checking if it is inactive
+                    # if inactive in the db, but present in my fetched data, then it is now reconnected. So I update all of its records to reflect this.
+                    cur.execute(
+                        '''UPDATE tbl_Clients SET hostname = ?, ipAddress = ?, macAddress = ?, active = ? WHERE clientId = ?''',
+                        (client.hostname, client.ipAddress, client.macAddress, client.active, client.clientId)
+                    )
+                    # create a network audit log saying that the client with id client.clientId is now active again
+                    self._pushNetworkAuditLog(con=con, cur=cur, eventType=auditEventType.CLIENT_RECONNECTED, subject=client.hostname, clientId=client.clientId) # calls the protected method to push the network audit log to the database
+                else:
+                    # In this case, client is already active, so just update any other attributes
+                    cur.execute(
+                        '''UPDATE tbl_Clients SET hostname = ?, ipAddress = ?, macAddress = ? WHERE clientId = ?''',
+                        (client.hostname, client.ipAddress, client.macAddress, client.clientId)
+                    )
+            else:
+                # Otherwise, this is a new client and needs to be inserted as new record in tbl_Clients
+                cur.execute(
+                    '''INSERT INTO tbl_Clients (clientId, hostname, ipAddress, macAddress, active) VALUES (?, ?, ?, ?, ?)''',
+                    client # the client record's fields are in the same order as the columns
+                )
+                # create a network audit log saying that a new client with id client.clientId was added
+                self._pushNetworkAuditLog(con=con, cur=cur, eventType=auditEventType.CLIENT_NEW, subject=client.hostname, clientId=client.clientId) # calls the protected method to push the network audit log to the database
+
+    @timed('openhaven_push_seconds', failures='openhaven_push_failures_total', stage='clients')
     def pushClientData(self): # Method to push new or updates client data into tbl_Clients
         self._fetchClientData() # fetches client and topology data if not done so already
         cur, con = self._dbConnection() # Establishes connection to database and cursor
 
         try:
-            for client in self._clientData: # Loops through each client in the dictionary
-                # Checking for existing record with clientId's that have been fetched and their active status
-                res = cur.execute(
-                    '''SELECT clientId, active FROM tbl_Clients WHERE clientId = ?''',
-                    (client['clientId'],)
-                )
-                # existing will be None if no existing record for the clientId, or if there is it will be a tuple of (clientId, active)
-                existing = res.fetchone()
-                if existing:
-                    if not existing[1]:  # existing[1] is the active field, I am checking if it is inactive
-                        # if inactive in the db, but present in my fetched data, then it is now reconnected. So I update all of its records to reflect this.
-                        cur.execute(
-                            '''UPDATE tbl_Clients SET hostname = ?, ipAddress = ?, macAddress = ?, active = ? WHERE clientId = ?''',
-                            (client['hostname'], client['ipAddress'], client['macAddress'], client['active'], client['clientId'])
-                        )
-                        # create a network audit log saying that the client with id client['clientId'] is now active again
-                        message = f"Client {client['hostname']} connected to the network again."
-                        self._pushNetworkAuditLog(con=con, cur=cur, message=message, clientId=client['clientId']) # calls the protected method to push the network audit log to the database
-                    else:
-                        # In this case, client is already active, so just update any other attributes
-                        cur.execute(
-                            '''UPDATE tbl_Clients SET hostname = ?, ipAddress = ?, macAddress = ? WHERE clientId = ?''',
-                            (client['hostname'], client['ipAddress'], client['macAddress'], client['clientId'])
-                        )
-                else:
-                    # Otherwise, this is a new client and needs to be inserted as new record in tbl_Clients
-                    cur.execute(
-                        '''INSERT INTO tbl_Clients (clientId, hostname, ipAddress, macAddress, active) VALUES (?, ?, ?, ?, ?)''',
-                        (client['clientId'], client['hostname'], client['ipAddress'], client['macAddress'], client['active'])
-                    )
-                    # create a network audit log saying that a new client with id client['clientId'] was added
-                    message = f"New client {client['hostname']} connected to the network."
-                    self._pushNetworkAuditLog(con=con, cur=cur, message=message, clientId=client['clientId']) # calls the protected method to push the network audit log to the database
+            self._writeClientData(cur, con, self._clientData)
             con.commit() # Commit the transaction and save changes
+            self._releaseAuditLogs()
+            self._updateClientSearch(self._clientData)
             return {
                 "successful": True,
                 "message": "Client data inserted/ updated successfully.",
@@ -254,14 +383,17 @@ class databaseService():
             }
         finally:
             con.close() # close the connection to the database
+            self._pendingAuditLogs = []
 
+    @timed('openhaven_push_seconds', failures='openhaven_push_failures_total', stage='inactiveClients')
     def detectInactiveClients(self):
         self._fetchClientData()
         cur, con = self._dbConnection()
         # I need to compare the list of clients I fetched from the API with the list of active clients in the database
         # if the client is in the database as active, but not in the fetched client data, that means it has disconnected
-        allClientIds_InFetch = [client['clientId'] for client in self._clientData]
-        
+        allClientIds_InFetch = [client.clientId for client in self._clientData]
+        inactiveClientIds = []
+
         try:
             if allClientIds_InFetch: # Making sure there is at least one client in the above list
                 # the following method to check if a client is active in the database but NOT IN the list above
@@ -289,11 +421,12 @@ class databaseService():
                             (clientId,)
                         )
                         clientName = clientName.fetchone()[0] # getting the hostname value from the tuple generated by .fetchone()
-                        # Creating the log message
-                        message = f"Client {clientName} disconnected from the network."
-                        self._pushNetworkAuditLog(con=con, cur=cur, message=message, clientId=clientId) # call the protected method to push the network audit log to the database
+                        self._pushNetworkAuditLog(con=con, cur=cur, eventType=auditEventType.CLIENT_DISCONNECTED, subject=clientName, clientId=clientId) # call the protected method to push the network audit log to the database
 
             con.commit() # Commit the transaction and save changes
+            self._releaseAuditLogs()
+            if self._clientSearch is not None and self._clientSearch.isLoaded():
+                self._clientSearch.setActive(inactiveClientIds, False)
             return {
                 "successful": True,
                 "message": "Inactive cleints detected.",
@@ -307,4 +440,307 @@ class databaseService():
                 "errors": [str(error)]
             }
         finally:
-            con.close() # close the connection to the database
\ No newline at end of file
+            con.close() # close the connection to the database
+            self._pendingAuditLogs = []
+
+    # one full collection cycle: fresh data is fetched from the api, then every push stage runs in order
+    # (access points before their samples and connections, clients before their connections)
+    # when the profiler is enabled the whole cycle is profiled, see services/profiler.py
+    # deadline is optional, a cycleDeadline the cycle has to finish within (see services/deadline.py and _runWithin)
+    def runCycle(self, deadline=None):
+        return self._runWithin('cycle', deadline, self._runCycleStages)
+
+    def _runCycleStages(self):
+        # the data from the last cycle is dropped so every cycle fetches it again
+        self._apData = None
+        self._trafficSamples = None
+        self._clientData = None
+        self._topologyData = None
+        if self._pipelineBatchSize:
+            return self._runStages([
+                self.pushPipelinedCycle,
+                self.pushWifiBroadcastData
+            ])
+        return self._runStages([
+            self.pushAPData,
+            self.pushTrafficSamples,
+            self.pushWifiBroadcastData,
+            self.pushClientData,
+            self.pushConnectionData,
+            self.detectInactiveClients
+        ])
+
+    # the same stages split up by how often their data changes, so the collection scheduler can run each part
+    # on its own cadence (see services/collectionScheduler.py)
+
+    # fresh AP data and traffic samples
+    def collectSamples(self, deadline=None):
+        def stages():
+            self._apData = None
+            self._trafficSamples = None
+            if self._pipelineBatchSize:
+                return self._runStages([self.pushPipelinedSamples])
+            return self._runStages([self.pushTrafficSamples])
+        return self._runWithin('samples', deadline, stages)
+
+    # the access points' details from the last samples run, then fresh clients and their connections
+    # the AP data is kept from collectSamples() so the APs aren't fetched (and sampled) twice
+    def collectTopology(self, deadline=None):
+        def stages():
+            self._clientData = None
+            self._topologyData = None
+            if self._pipelineBatchSize:
+                return self._runStages([self.pushAPDetails, self.pushPipelinedClients])
+            return self._runStages([self.pushAPDetails, self.pushClientData, self.pushConnectionData, self.detectInactiveClients])
+        return self._runWithin('topology', deadline, stages)
+
+    # collectTopology's AP stage. when the samples job hasn't left its AP data behind (its first run hasn't happened
+    # yet, or it failed) only the details are fetched, the traffic samples are left to that job rather than requested
+    # here and thrown away
+    def pushAPDetails(self):
+        if self._apData is None:
+            self._apData = self._collectData.collectAccessPoints()
+        return self.pushAPData()
+
+    def collectBroadcasts(self, deadline=None):
+        return self._runWithin('broadcasts', deadline, lambda: self._runStages([self.pushWifiBroadcastData]))
+
+    # what each stage writes, marked incomplete when a stage is cut short because there was no time left to fetch its data
+    _stageParts = {
+        'pushAPData': ['accessPoints'],
+        'pushAPDetails': ['accessPoints'],
+        'pushTrafficSamples': ['trafficSamples'],
+        'pushWifiBroadcastData': ['wifiBroadcasts'],
+        'pushClientData': ['clients'],
+        'pushConnectionData': ['connections'],
+        'detectInactiveClients': ['inactiveClients']
+    }
+
+    # runs a job's stages with the deadline handed down to collectData and the api client. what is fetched in time is
+    # written as normal, and once the time is up the stages that still need to fetch are cut short (see _runStages)
+    # the deadline's summary is added to the result as data['deadline'], with 'complete' and the 'incomplete' parts,
+    # and a row is added to tbl_CollectionRuns so the dashboard can tell a partial run from a full one
+    def _runWithin(self, job, deadline, function):
+        if deadline is None:
+            return self._profiled(function)
+        self._deadline = deadline
+        self._collectData.setDeadline(deadline)
+        try:
+            result = self._profiled(function)
+        finally:
+            self._deadline = None
+            self._collectData.setDeadline(None)
+        summary = deadline.summary()
+        if not summary['complete']:
+            result['successful'] = False
+            result['message'] = f"Collection {'was cancelled' if summary['cancelled'] else 'ran out of time'}, what was fetched has been saved."
+            result['errors'].append(f"{job} stopped after {summary['elapsedSec']:.1f} seconds with {', '.join(summary['incomplete'])} incomplete.")
+        result['data']['deadline'] = summary
+        self._recordRun(job, result, summary)
+        return result
+
+    def _recordRun(self, job, result, summary):
+        try:
+            cur, con = self._dbConnection()
+        except sqlite3.Error as error:
+            result['errors'].append(f"Couldn't record the collection run: {error}")
+            return
+        try:
+            cur.execute(
+                '''INSERT INTO tbl_CollectionRuns (job, budgetSec, elapsedSec, complete, incomplete, successful) VALUES (?, ?, ?, ?, ?, ?)''',
+                (job, summary['budget'], summary['elapsedSec'], summary['complete'], ','.join(summary['incomplete']) or None, result['successful'])
+            )
+            con.commit()
+        except sqlite3.Error as error: # eg the database is locked, the run itself has still happened
+            con.rollback()
+            result['errors'].append(f"Couldn't record the collection run: {error}")
+        finally:
+            con.close()
+
+    def _profiled(self, function):
+        profiler = getProfiler()
+        if profiler.enabled:
+            return profiler.profile(function)
+        return function()
+
+    def _runStages(self, stages):
+        results = {}
+        errors = []
+        for stage in stages:
+            try:
+                results[stage.__name__] = stage()
+            except deadlineExceeded as error: # there was no time left to fetch what the stage needed
+                if self._deadline is not None:
+                    self._deadline.markIncomplete(*self._stageParts.get(stage.__name__, [stage.__name__]))
+                results[stage.__name__] = {"successful": False, "message": "Cut short, the collection ran out of time.", "errors": [str(error)]}
+            except Exception as error: # fetching from the api happens in the stages and isn't caught by them
+                results[stage.__name__] = {"successful": False, "message": "Error during collection.", "errors": [str(error)]}
+            errors.extend(results[stage.__name__]['errors'])
+        return {
+            "successful": not errors,
+            "message": "Collection cycle complete." if not errors else "Collection cycle finished with errors.",
+            "errors": errors,
+            "data": results
+        }
+
+    # the pipelined versions of the push stages, used instead of them when pipelineBatchSize is set
+    # access points, their samples, clients and connections, then inactive clients
+    def pushPipelinedCycle(self):
+        return self._runPipeline(writeAPs=True, writeSamples=True, writeClients=True)
+
+    def pushPipelinedSamples(self):
+        return self._runPipeline(writeAPs=False, writeSamples=True, writeClients=False)
+
+    # clients and connections, then inactive clients
+    def pushPipelinedClients(self):
+        return self._runPipeline(writeAPs=False, writeSamples=False, writeClients=True)
+
+    # pipelined collection: a fetcher thread gets the access points and/or clients from collectData one batch at a time
+    # and puts each batch on a queue, while this thread writes and commits the batch before it
+    # so the time spent waiting on the API and the time spent writing overlap instead of adding up, and only a few
+    # batches are ever held in memory. the queue holds at most PIPELINE_QUEUE_SIZE batches, once it is full the fetcher
+    # waits for the writer to catch up (back-pressure)
+    # a batch that fails to write is rolled back on its own and the rest carry on. inactive clients are only looked for
+    # after the last batch, and only if every client was fetched, as a client missing from a fetch that failed part way
+    # would otherwise be marked as disconnected. with a spool, the samples of a batch that fails go into it like in pushTrafficSamples
+    # with a deadline the fetcher stops once the time is up (see collectData.setDeadline), the batches already fetched
+    # are still written, and whatever wasn't fetched is marked incomplete on the deadline
+    @timed('openhaven_push_seconds', failures='openhaven_push_failures_total', stage='pipeline')
+    def _runPipeline(self, writeAPs, writeSamples, writeClients):
+        batches = queue.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+        stopped = threading.Event() # set if the writer stops early, so the fetcher doesn't wait on a full queue forever
+        complete = {'accessPoints': not (writeAPs or writeSamples), 'clients': not writeClients}
+        timings = {'fetchSec': 0.0, 'writeSec': 0.0}
+        errors = []
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        # runs on the fetcher thread, timing only the fetching and not the waits on a full queue
+        def fetchAll(kind, iterator):
+            while True:
+                start = time.perf_counter()
+                try:
+                    batch = next(iterator)
+                except StopIteration:
+                    return True
+                finally:
+                    timings['fetchSec'] += time.perf_counter() - start
+                if not put((kind,) + batch):
+                    return False
+
+        def fetch():
+            try:
+                if writeAPs or writeSamples:
+                    complete['accessPoints'] = fetchAll('aps', self._collectData.iterAPData(self._pipelineBatchSize))
+                if writeClients:
+                    complete['clients'] = fetchAll('clients', self._collectData.iterClientData(self._pipelineBatchSize))
+            except Exception as error:
+                errors.append(str(error))
+            finally:
+                put(None) # tells the writer there is nothing more coming
+
+        apData = []
+        trafficSamples = []
+        clientData = []
+        topologyData = []
+        batchCount = 0
+        spooled = 0
+        start = time.perf_counter()
+        fetcher = threading.Thread(target=fetch, name="collectionFetcher", daemon=True)
+        # the connection is opened before the fetcher starts, if it fails there is no thread left waiting to put batches
+        cur, con = self._dbConnection()
+        fetcher.start()
+        try:
+            graph = self._loadedGraph(cur) if writeClients else None
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                kind, first, second = item
+                batchCount += 1
+                writeStart = time.perf_counter()
+                changes = None
+                samplesToSpool = None
+                try:
+                    if kind == 'aps':
+                        apData.extend(first)
+                        trafficSamples.extend(second)
+                        if writeAPs:
+                            self._writeAPData(cur, con, first)
+                        if writeSamples and self._spool is not None and self._spool.hasPending():
+                            samplesToSpool = second # behind the older samples waiting in the spool, to keep them in order
+                        elif writeSamples:
+                            self._writeTrafficSamples(cur, second)
+                    else:
+                        clientData.extend(first)
+                        topologyData.extend(second)
+                        self._writeClientData(cur, con, first)
+                        changes = self._writeConnectionData(cur, graph, second, first)
+                    con.commit()
+                    self._releaseAuditLogs()
+                    if changes is not None:
+                        graph.apply(changes) # later batches are compared with the graph including this one
+                        self._updateClientSearch(first)
+                except Exception as error:
+                    con.rollback()
+                    errors.append(str(error))
+                    if kind == 'aps' and writeSamples and self._canSpool(error):
+                        samplesToSpool = second
+                        self._spool.deferReplay()
+                finally:
+                    if samplesToSpool:
+                        spooled += self._spoolTrafficSamples(samplesToSpool)
+                    self._pendingAuditLogs = []
+                    timings['writeSec'] += time.perf_counter() - writeStart
+        finally:
+            stopped.set()
+            fetcher.join()
+            con.close()
+
+        deadline = self._deadline
+        if deadline is not None and deadline.expired():
+            if not complete['accessPoints']:
+                deadline.markIncomplete(*(['accessPoints'] if writeAPs else []) + (['trafficSamples'] if writeSamples else []))
+            if not complete['clients']:
+                deadline.markIncomplete('clients', 'connections', 'inactiveClients')
+
+        # the spool is fsynced once for the whole collection, and written to the database if it is due
+        spool = None
+        if spooled or (writeSamples and self._spool is not None and self._spool.hasPending()):
+            spool = self._replaySpool()
+            errors.extend(spool['errors'])
+
+        # what was fetched is kept like the other push methods do, so the later stages don't fetch it again
+        if complete['accessPoints'] and (writeAPs or writeSamples):
+            self._apData, self._trafficSamples = apData, trafficSamples
+        inactiveClients = None
+        if writeClients and complete['clients']:
+            self._clientData, self._topologyData = clientData, topologyData
+            inactiveClients = self.detectInactiveClients()
+            errors.extend(inactiveClients['errors'])
+
+        wallSec = time.perf_counter() - start
+        return {
+            "successful": not errors,
+            "message": f"Pipelined collection wrote {batchCount} batches." if not errors else "Pipelined collection finished with errors.",
+            "errors": errors,
+            "data": {
+                'batches': batchCount,
+                'complete': complete,
+                'fetchSec': timings['fetchSec'],
+                'writeSec': timings['writeSec'],
+                'wallSec': wallSec,
+                # how much of the fetching and writing happened at the same time
+                'overlapSec': max(0.0, timings['fetchSec'] + timings['writeSec'] - wallSec),
+                'inactiveClients': inactiveClients,
+                'spooledSamples': spooled,
+                'spool': spool
+            }
+        }
@@ -0,0 +1,219 @@
+import os
+import sys
+import threading
+import time
+from src.backend.config import API_REQUEST_TIMEOUT, API_MIN_REQUEST_TIME, DEADLINE_WATCHDOG_GRACE, DEADLINE_WATCHDOG_INTERVAL
+from .metrics import getMetrics
+
+# deadlines for the collection, so one hung request can't hold up a whole run and make the next one pile up behind it
+#
+# every scheduled run gets a cycleDeadline with a budget (a fraction of its cadence, COLLECT_BUDGET_FRACTION), which is
+# handed down through databaseService -> collectData -> APIclient:
+#   APIclient      gives each request a timeout of whatever is left of the budget (at most API_REQUEST_TIMEOUT), and
+#                  doesn't send one at all once less than API_MIN_REQUEST_TIME is left
+#   collectData    stops fetching traffic samples, client topology or broadcast details once the time is up, and marks
+#                  that part of the run as incomplete, the APs/clients it already has are still returned
+#   databaseService writes what was fetched as usual, stages that would need to fetch more are cut short, and the
+#                  run's completeness is saved in tbl_CollectionRuns and returned with its result
+# cancel() stops a run the same way before its time is up, eg when the collector is being stopped, and runs the
+# onCancel callbacks, which APIclient uses to cut off the request it is waiting on rather than letting it run to its timeout
+# the cycleWatchdog reports any run that is still going well past its deadline, and where it is stuck
+
+# raised instead of sending a request (or while reading one) once the run is out of time or has been cancelled
+class deadlineExceeded(Exception):
+    pass
+
+class cycleDeadline:
+    # budget is in seconds, None for a run with no time limit that can still be cancelled
+    def __init__(self, budget=None, name=None):
+        self.name = name
+        self.budget = budget
+        self.startedAt = time.monotonic()
+        self._expiresAt = None if budget is None else self.startedAt + budget
+        self._cancelled = threading.Event()
+        self._reason = None
+        self._incomplete = set()
+        self._onCancel = {} # key -> callback, see onCancel
+        self._lock = threading.Lock() # the pipelined collection's fetcher thread marks parts incomplete too
+
+    def elapsed(self):
+        return time.monotonic() - self.startedAt
+
+    # seconds left, None if there is no budget
+    def remaining(self):
+        if self._expiresAt is None:
+            return None
+        return max(0.0, self._expiresAt - time.monotonic())
+
+    # how far past its budget the run has gone
+    def overrun(self):
+        if self._expiresAt is None:
+            return 0.0
+        return max(0.0, time.monotonic() - self._expiresAt)
+
+    def cancel(self, reason="The collection was cancelled."):
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._reason = reason
+            self._cancelled.set()
+            callbacks = list(self._onCancel.values())
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception: # one broken callback shouldn't stop the others
+                pass
+
+    # callback is called (from the thread cancelling the run) if the run is cancelled, straight away if it already has been
+    # returns a function that removes it again, eg once the request it would cut off has finished
+    def onCancel(self, callback):
+        with self._lock:
+            if not self._cancelled.is_set():
+                key = object()
+                self._onCancel[key] = callback
+
+                def remove():
+                    with self._lock:
+                        self._onCancel.pop(key, None)
+                return remove
+        callback()
+        return lambda: None
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def expired(self):
+        return self._cancelled.is_set() or self.remaining() == 0.0
+
+    def check(self):
+        if self._cancelled.is_set():
+            raise deadlineExceeded(self._reason)
+        if self.remaining() == 0.0:
+            raise deadlineExceeded(f"The collection ran out of time after {self.budget:g} seconds.")
+
+    # the timeout for the next request to the console, or deadlineExceeded if there isn't time to send one
+    def requestTimeout(self):
+        self.check()
+        remaining = self.remaining()
+        if remaining is None:
+            return API_REQUEST_TIMEOUT
+        if remaining < API_MIN_REQUEST_TIME:
+            raise deadlineExceeded(f"The collection ran out of time after {self.budget:g} seconds.")
+        return min(API_REQUEST_TIMEOUT, remaining)
+
+    # called when part of the run (eg 'trafficSamples', 'connections') was cut short, so its data is only partial
+    def markIncomplete(self, *parts):
+        with self._lock:
+            self._incomplete.update(parts)
+
+    def incomplete(self):
+        with self._lock:
+            return sorted(self._incomplete)
+
+    def summary(self):
+        incomplete = self.incomplete()
+        return {
+            'budget': self.budget,
+            'elapsedSec': round(self.elapsed(), 3),
+            'overrunSec': round(self.overrun(), 3),
+            'cancelled': self.cancelled(),
+            'complete': not incomplete,
+            'incomplete': incomplete
+        }
+
+# watches the runs that are going, and reports each one that goes past its deadline:
+#   still running DEADLINE_WATCHDOG_GRACE seconds after it    reported straight away with where its thread is stuck
+#                                                             (eg a request that isn't giving up), and cancelled
+#   finished past it, but within the grace                    reported when it finishes
+# each report goes into openhaven_deadline_overruns_total, getStatus() and the onOverrun callback
+class cycleWatchdog:
+    # onOverrun is optional, it is called with each report (eg to send it to the UI process)
+    def __init__(self, grace=DEADLINE_WATCHDOG_GRACE, interval=DEADLINE_WATCHDOG_INTERVAL, onOverrun=None, keep=20):
+        self._grace = grace
+        self._interval = interval
+        self._onOverrun = onOverrun
+        self._keep = keep
+        self._lock = threading.Lock()
+        self._watching = {} # id(deadline) -> [deadline, threadId, reported]
+        self._reports = [] # the last `keep` reports, newest last
+        self._overruns = 0
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="cycleWatchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    # called by the thread about to do the run
+    def watch(self, deadline):
+        with self._lock:
+            self._watching[id(deadline)] = [deadline, threading.get_ident(), False]
+
+    # called once the run has finished, reports it if it went over and wasn't reported while running
+    def finished(self, deadline):
+        with self._lock:
+            entry = self._watching.pop(id(deadline), None)
+        if entry is not None and not entry[2] and deadline.overrun() > 0:
+            self._report(deadline, None)
+
+    def cancelAll(self, reason):
+        with self._lock:
+            deadlines = [entry[0] for entry in self._watching.values()]
+        for deadline in deadlines:
+            deadline.cancel(reason)
+
+    def _run(self):
+        while not self._stopping.wait(self._interval):
+            with self._lock:
+                late = [entry for entry in self._watching.values() if not entry[2] and entry[0].overrun() > self._grace]
+                for entry in late:
+                    entry[2] = True
+            for deadline, threadId, reported in late:
+                self._report(deadline, threadId)
+                deadline.cancel(f"The collection was cancelled {deadline.overrun():.0f} seconds past its deadline.")
+
+    # the innermost few calls of the thread doing the run, innermost first
+    # https://docs.python.org/3/library/sys.html#sys._current_frames
+    def _where(self, threadId, depth=4):
+        frame = sys._current_frames().get(threadId)
+        calls = []
+        while frame is not None and len(calls) < depth:
+            calls.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return calls
+
+    def _report(self, deadline, threadId):
+        report = {
+            'job': deadline.name,
+            'budget': deadline.budget,
+            'overrunSec': round(deadline.overrun(), 3),
+            'stillRunning': threadId is not None,
+            'where': self._where(threadId) if threadId is not None else [],
+            'at': time.time()
+        }
+        getMetrics().incrementCounter('openhaven_deadline_overruns_total', job=deadline.name, state='running' if threadId is not None else 'finished')
+        with self._lock:
+            self._overruns += 1
+            self._reports = (self._reports + [report])[-self._keep:]
+        if self._onOverrun is not None:
+            try:
+                self._onOverrun(report)
+            except Exception: # a broken callback shouldn't stop the watchdog
+                pass
+
+    def getStatus(self):
+        with self._lock:
+            return {
+                'overruns': self._overruns,
+                'running': [{'job': entry[0].name, 'elapsedSec': round(entry[0].elapsed(), 3), 'budget': entry[0].budget} for entry in self._watching.values()],
+                'recent': list(self._reports)
+            }
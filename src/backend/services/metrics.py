@@ -0,0 +1,266 @@
+import functools
+import math
+import os
+import threading
+import time
+from src.backend.config import METRICS_ENABLED, METRICS_BUCKETS, METRICS_FILE, METRICS_PORT
+
+# stands in for a real timer while metrics are turned off, so timing a block costs one attribute check
+class _nullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _nullTimer()
+
+# times a block of code and adds it to a histogram, returned by metricsRegistry.timer()
+class _timer:
+    __slots__ = ('_registry', '_name', '_labels', '_start')
+
+    def __init__(self, registry, name, labels):
+        self._registry = registry
+        self._name = name
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._registry.observe(self._name, time.perf_counter() - self._start, **self._labels)
+        return False
+
+# counters and latency histograms for the collector, kept in memory
+# a counter only goes up (eg number of api requests), a histogram counts how many timings fell into each bucket
+# (eg how many requests took under 0.1s, under 0.25s...), which is how prometheus stores latencies
+# https://prometheus.io/docs/concepts/metric_types/
+#
+# every metric can have labels, eg openhaven_api_request_seconds{endpoint="devices"}, each set of labels is its own series
+# while the registry is disabled every method returns straight away, so the instrumented code runs at the same speed
+class metricsRegistry:
+    def __init__(self, enabled=METRICS_ENABLED, buckets=METRICS_BUCKETS):
+        self.enabled = enabled
+        self._buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock() # the collector, the audit log writer and the ui can all record metrics
+        self._counters = {} # (name, labels) -> value
+        self._histograms = {} # (name, labels) -> [bucket counts..., sum, count, max]
+        self._help = {} # name -> description, shown in the prometheus output
+        self._server = None
+
+    # metrics can be turned on and off while the app is running
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._histograms = {}
+
+    def describe(self, name, description):
+        self._help[name] = description
+
+    # labels are stored as a sorted tuple so they can be used in a dictionary key
+    # the values are stored as strings, like they end up in the export, so one label having an int (status 200) and a
+    # str ('error') doesn't stop the keys being sorted
+    def _key(self, name, labels):
+        return (name, tuple(sorted((key, str(value)) for key, value in labels.items())))
+
+    def incrementCounter(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    # adds one timing (in seconds) to a histogram
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = [0] * len(self._buckets) + [0.0, 0, 0.0]
+                self._histograms[key] = histogram
+            # buckets are stored on their own here and added up when exported
+            for i, bound in enumerate(self._buckets):
+                if seconds <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-3] += seconds
+            histogram[-2] += 1
+            histogram[-1] = max(histogram[-1], seconds)
+
+    # with metrics.timer('openhaven_push_seconds', stage='clients'): ...
+    def timer(self, name, **labels):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _timer(self, name, labels)
+
+    def _formatLabels(self, labels, extra=None):
+        labels = list(labels) + ([extra] if extra else [])
+        if not labels:
+            return ''
+        # label values have \, " and newlines escaped, https://prometheus.io/docs/instrumenting/exposition_formats/
+        escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in labels]
+        return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+    # everything in the prometheus text format, https://prometheus.io/docs/instrumenting/exposition_formats/
+    def toPrometheus(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+        lines = []
+        lastName = None
+        for (name, labels), value in counters:
+            if name != lastName:
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                lastName = name
+            lines.append(f'{name}{self._formatLabels(labels)} {value}')
+        for (name, labels), histogram in histograms:
+            if name != lastName:
+                if name in self._help:
+                    lines.append(f'# HELP {name} {self._help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                lastName = name
+            # prometheus buckets are cumulative, each one counts every timing up to its bound
+            total = 0
+            for bound, count in zip(self._buckets, histogram):
+                total += count
+                lines.append(f'{name}_bucket{self._formatLabels(labels, ("le", bound))} {total}')
+            lines.append(f'{name}_bucket{self._formatLabels(labels, ("le", "+Inf"))} {histogram[-2]}')
+            lines.append(f'{name}_sum{self._formatLabels(labels)} {histogram[-3]}')
+            lines.append(f'{name}_count{self._formatLabels(labels)} {histogram[-2]}')
+        return '\n'.join(lines) + '\n'
+
+    # writes the metrics to a file, eg for node_exporter's textfile collector
+    # written to a temporary file first then renamed, so nothing ever reads a half written file
+    def writePrometheus(self, path=METRICS_FILE):
+        tempPath = f'{path}.tmp'
+        with open(tempPath, 'w') as file:
+            file.write(self.toPrometheus())
+        os.replace(tempPath, path)
+
+    # serves the metrics at http://127.0.0.1:<port>/metrics for prometheus to scrape, on a background thread
+    # only listens on localhost, the metrics aren't meant to be reachable from the rest of the network
+    def startServer(self, port=METRICS_PORT, host='127.0.0.1'):
+        if self._server is not None:
+            return self._server.server_address[1]
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry = self
+
+        class metricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/metrics':
+                    self.send_error(404)
+                    return
+                body = registry.toPrometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # don't print a line for every scrape
+
+        self._server = ThreadingHTTPServer((host, port), metricsHandler)
+        threading.Thread(target=self._server.serve_forever, name="metricsServer", daemon=True).start()
+        return self._server.server_address[1]
+
+    def stopServer(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    # roughly where a percentile falls, the upper bound of the bucket it lands in
+    def _percentile(self, histogram, fraction):
+        target = math.ceil(histogram[-2] * fraction)
+        total = 0
+        for bound, count in zip(self._buckets, histogram):
+            total += count
+            if total >= target:
+                return bound
+        return histogram[-1] # above the last bucket, so the slowest timing is the best answer
+
+    # a readable summary for the app, each histogram's count, average, p95 and slowest time, and the counters
+    def getSummary(self):
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(value)) for key, value in self._histograms.items())
+        timings = []
+        for (name, labels), histogram in histograms:
+            count = histogram[-2]
+            timings.append({
+                'name': name,
+                'labels': dict(labels),
+                'count': count,
+                'totalSec': histogram[-3],
+                'averageSec': histogram[-3] / count if count else 0,
+                'p95Sec': self._percentile(histogram, 0.95),
+                'maxSec': histogram[-1]
+            })
+        # slowest overall first, as that is usually what is being looked for
+        timings.sort(key=lambda timing: timing['totalSec'], reverse=True)
+        return {
+            "successful": True,
+            "message": "Metrics are enabled." if self.enabled else "Metrics are disabled.",
+            "errors": [],
+            "data": {
+                'timings': timings,
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in counters]
+            }
+        }
+
+# one registry for the whole app, the services record into it and the ui/exporter reads from it
+_sharedMetrics = metricsRegistry()
+
+def getMetrics():
+    return _sharedMetrics
+
+# decorator that times every call of a method into a histogram
+# when the method returns one of the usual result dictionaries with successful False (or raises), failures is also counted
+def timed(name, failures=None, **labels):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _sharedMetrics.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = function(*args, **kwargs)
+                failed = isinstance(result, dict) and result.get('successful') is False
+                return result
+            finally:
+                _sharedMetrics.observe(name, time.perf_counter() - start, **labels)
+                if failed and failures:
+                    _sharedMetrics.incrementCounter(failures, **labels)
+        return wrapper
+    return decorator
+
+_sharedMetrics.describe('openhaven_api_request_seconds', 'Time taken by each UniFi Network API request.')
+_sharedMetrics.describe('openhaven_api_requests_total', 'UniFi Network API requests by endpoint and status code.')
+_sharedMetrics.describe('openhaven_collect_seconds', 'Time taken to collect each kind of data from the API.')
+_sharedMetrics.describe('openhaven_push_seconds', 'Time taken by each stage that pushes collected data to the database.')
+_sharedMetrics.describe('openhaven_push_failures_total', 'Push stages that failed and were rolled back.')
+_sharedMetrics.describe('openhaven_sample_requests_total', 'Traffic sample requests the sampling scheduler sent to the console.')
+_sharedMetrics.describe('openhaven_samples_skipped_total', 'Access points not sampled in a collection, by reason (notDue, budget, offline).')
+_sharedMetrics.describe('openhaven_schedule_lag_seconds', 'How late each scheduled collection job started compared to its planned time.')
+_sharedMetrics.describe('openhaven_schedule_drift_seconds', 'How far each scheduled collection job started from its fixed slot, jitter included.')
+_sharedMetrics.describe('openhaven_schedule_overruns_total', 'Scheduled collection jobs that ran past their next slot, by job and action.')
+_sharedMetrics.describe('openhaven_spool_rows_total', 'Rows that went into the write spool, and were later written from it or left out (action).')
+_sharedMetrics.describe('openhaven_spool_replay_failures_total', 'Attempts to write the write spool to the database that failed.')
+_sharedMetrics.describe('openhaven_retention_seconds', 'Time taken by each data retention run.')
+_sharedMetrics.describe('openhaven_retention_failures_total', 'Data retention runs that failed.')
+_sharedMetrics.describe('openhaven_deadline_overruns_total', 'Collection runs that went past their deadline, by job and whether they were still running when reported.')
+_sharedMetrics.describe('openhaven_admin_actions_total', 'Access points and wifi broadcasts acted on by the bulk admin actions, by action and outcome.')
+_sharedMetrics.describe('openhaven_audit_logs_dropped_total', 'Audit logs the background writer dropped, by reason (queueFull, locked, error, invalid).')
@@ -0,0 +1,221 @@
+import heapq
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from src.backend.config import databaseFile, schemaFile, sitesFolder
+from .unifi_api import APIclient
+from .collectData import collectData
+from .database import databaseService
+from .deadline import cycleDeadline
+from .auditLogs import auditLogService
+from .roamAnalytics import roamAnalytics
+from .dashboardSummary import dashboardSummary
+
+# collecting from many consoles/sites at once
+# each site gets its own database file (a shard) in data/sites, so the sites never wait on each other's write locks,
+# and each site is collected in its own process, so adding sites uses more cores instead of making the cycle longer
+# federatedQuery reads from all of the shards and merges the results for the dashboard
+
+def _allSites():
+    from src.backend.config import SITES # only read when needed, it loads sites.json or the .env file
+    return SITES
+
+# the database file for a site. the single site from the .env file keeps using the main database,
+# a site can also name its own file with "database" in sites.json
+def siteDatabaseFile(site):
+    if site.get('database'):
+        return site['database']
+    if site['name'] == 'default':
+        return databaseFile
+    # only letters, numbers, - and _ in the file name, so a site name can't point somewhere else on disk
+    return sitesFolder / f"{re.sub(r'[^A-Za-z0-9_-]', '_', site['name'])}.db"
+
+# makes a site's database from the schema the first time the site is collected
+def _createShard(dbPath):
+    if os.path.exists(dbPath):
+        return
+    os.makedirs(os.path.dirname(dbPath), exist_ok=True)
+    with open(schemaFile, 'r') as file:
+        schema = file.read()
+    con = sqlite3.connect(dbPath)
+    try:
+        con.executescript(schema)
+        con.commit()
+    finally:
+        con.close()
+
+# services for each site, kept between cycles in each worker process so the http client's connections are reused
+_workerServices = {}
+
+# runs one site's collection cycle, in a worker process
+# it has to be a module level function so the process pool can send it to the worker
+# budget is the seconds the cycle has (or None), the deadline itself is made in the worker as it can't be sent to it
+def _collectSite(site, dbPath, budget=None):
+    start = time.perf_counter()
+    try:
+        service = _workerServices.get(site['name'])
+        if service is None:
+            _createShard(dbPath)
+            api = APIclient(consoleIp=site['consoleIp'], apiKey=site['apiKey'], siteId=site['siteId'])
+            service = databaseService(collectData(api), dbPath=dbPath)
+            _workerServices[site['name']] = service
+        result = service.runCycle(deadline=cycleDeadline(budget, name=site['name']) if budget is not None else None)
+    except Exception as error:
+        result = {"successful": False, "message": "Error collecting the site.", "errors": [str(error)]}
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+class multiSiteCollector:
+    # sites is a list of site dictionaries like in sites.json, all of the configured sites by default
+    # workers is the number of processes, one per site up to the number of cores by default
+    def __init__(self, sites=None, workers=None):
+        self._sites = sites if sites is not None else _allSites()
+        self._workers = workers or max(1, min(len(self._sites), os.cpu_count() or 1))
+        self._pool = None # the worker processes are started on the first cycle and kept for the next ones
+
+    def getSites(self):
+        return [site['name'] for site in self._sites]
+
+    # collects every site at the same time, a site that fails doesn't stop the others
+    # budget is optional, the seconds each site's cycle has before it is cut short (see services/deadline.py)
+    def runCycle(self, budget=None):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self._workers)
+        start = time.perf_counter()
+        futures = {site['name']: self._pool.submit(_collectSite, site, siteDatabaseFile(site), budget) for site in self._sites}
+        results = {}
+        errors = []
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as error: # the worker process itself died
+                results[name] = {"successful": False, "message": "Error collecting the site.", "errors": [str(error)]}
+            errors.extend(f"{name}: {error}" for error in results[name]['errors'])
+        return {
+            "successful": not errors,
+            "message": f"Collected {len(self._sites)} sites in {time.perf_counter() - start:.1f}s." + (" Some sites had errors." if errors else ""),
+            "errors": errors,
+            "data": results
+        }
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+# reads from every site's database and merges the results, each row gets a 'site' key saying where it came from
+# the shards are read at the same time on threads, sqlite lets go of the GIL while it reads
+class federatedQuery:
+    def __init__(self, sites=None):
+        self._sites = sites if sites is not None else _allSites()
+        self._paths = {site['name']: siteDatabaseFile(site) for site in self._sites}
+
+    # runs function(siteName, dbPath) for every site that has a database, returns {siteName: result}
+    def _eachSite(self, function):
+        paths = {name: path for name, path in self._paths.items() if os.path.exists(path)}
+        if not paths:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(len(paths), 16)) as pool:
+            futures = {name: pool.submit(function, name, path) for name, path in paths.items()}
+            return {name: future.result() for name, future in futures.items()}
+
+    # puts each site's rows together, adding the site name to each one
+    def _merge(self, results, message):
+        rows = []
+        errors = []
+        for name, result in results.items():
+            if not result['successful']:
+                errors.extend(f"{name}: {error}" for error in result['errors'])
+                continue
+            rows.extend(dict(row, site=name) for row in result['data'])
+        return {
+            "successful": not errors,
+            "message": message.format(len(rows)),
+            "errors": errors,
+            "data": rows
+        }
+
+    # the newest audit logs across every site, newest first
+    # cursor is the nextCursor from the last page, it holds where each site's logs got up to
+    def getAuditLogs(self, startDate=None, endDate=None, cursor=None, pageSize=50):
+        import base64
+        import json
+        pageSize = max(1, min(int(pageSize), 200))
+        try:
+            siteCursors = json.loads(base64.urlsafe_b64decode(cursor.encode())) if cursor else {}
+        except Exception as error:
+            return {"successful": False, "message": "Invalid page cursor.", "errors": [str(error)]}
+
+        def sitePage(name, path):
+            if siteCursors.get(name, '') is None: # this site has no more logs
+                return {"successful": True, "data": {'logs': [], 'nextCursor': None}}
+            return auditLogService(dbPath=path).getAuditLogs(startDate=startDate, endDate=endDate, cursor=siteCursors.get(name), pageSize=pageSize)
+
+        results = self._eachSite(sitePage)
+        errors = [f"{name}: {error}" for name, result in results.items() if not result['successful'] for error in result['errors']]
+        if errors:
+            return {"successful": False, "message": "Error while retrieving the audit logs.", "errors": errors}
+
+        # each site's page is already newest first, so they can be merged without sorting everything
+        # https://docs.python.org/3/library/heapq.html#heapq.merge
+        sitePages = [[dict(log, site=name) for log in result['data']['logs']] for name, result in results.items()]
+        merged = heapq.merge(*sitePages, key=lambda log: (log['dateCreated'], log['auditLogId']), reverse=True)
+        logs = [log for _, log in zip(range(pageSize), merged)]
+
+        # each site carries on after the last of its logs that made it onto this page
+        service = auditLogService()
+        nextCursors = dict(siteCursors)
+        more = False
+        for name, result in results.items():
+            taken = [log for log in logs if log['site'] == name]
+            pageLogs = result['data']['logs']
+            if taken:
+                nextCursors[name] = service._encodeCursor(taken[-1]['dateCreated'], taken[-1]['auditLogId'])
+            if len(taken) < len(pageLogs) or result['data']['nextCursor']:
+                more = True
+            elif siteCursors.get(name, '') is not None:
+                nextCursors[name] = None # everything from this site has been shown
+        nextCursor = base64.urlsafe_b64encode(json.dumps(nextCursors).encode()).decode() if more else None
+        return {
+            "successful": True,
+            "message": f"Retrieved {len(logs)} audit logs from {len(results)} sites.",
+            "errors": [],
+            "data": {'logs': logs, 'nextCursor': nextCursor}
+        }
+
+    def getEventCounts(self, eventType, groupBy='accessPointId', startDate=None, endDate=None):
+        return self._merge(
+            self._eachSite(lambda name, path: auditLogService(dbPath=path).getEventCounts(eventType, groupBy, startDate, endDate)),
+            "Counted events for {} groups."
+        )
+
+    def getRoamsPerAccessPoint(self, hours=24):
+        result = self._merge(
+            self._eachSite(lambda name, path: roamAnalytics(dbPath=path).getRoamsPerAccessPoint(hours)),
+            "Roams counted for {} access points."
+        )
+        result['data'].sort(key=lambda row: row['roamsIn'] + row['roamsOut'], reverse=True)
+        return result
+
+    def getPingPongClients(self, hours=24, minPingPongs=3):
+        result = self._merge(
+            self._eachSite(lambda name, path: roamAnalytics(dbPath=path).getPingPongClients(hours, minPingPongs)),
+            "{} clients are ping-pong roaming."
+        )
+        result['data'].sort(key=lambda row: row['pingPongs'], reverse=True)
+        return result
+
+    # one line per site for the overview page, each is the single row of the site's tbl_DashboardSummary
+    def getSiteSummaries(self):
+        def summary(name, path):
+            result = dashboardSummary(dbPath=path).getSummary()
+            if not result['successful']:
+                return result
+            row = result['data']
+            return {"successful": True, "errors": [], "data": [dict(
+                row, accessPointsOnline=row['apsOnline']
+            )]}
+
+        return self._merge(self._eachSite(summary), "Loaded {} sites.")
@@ -0,0 +1,216 @@
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from src.backend.config import PROFILE_FOLDER, PROFILE_SAMPLE_INTERVAL, PROFILE_TOP_N
+
+# collapses whitespace and long runs of ? placeholders, so the same query is always counted as one statement
+# (detectInactiveClients builds its IN (?, ?, ...) list with a different length every time)
+_placeholderPattern = re.compile(r'\?(\s*,\s*\?)+')
+
+def _normaliseSQL(sql):
+    return _placeholderPattern.sub('?, ...', ' '.join(sql.split()))
+
+# cursor that times every statement it runs, used in place of the normal cursor while a cycle is being profiled
+# https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.cursor (the factory argument)
+# the rows of a SELECT are read by the fetch methods, so their time is added to the statement that made them
+class _timedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        self._lastSQL = sql
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            _sharedProfiler.recordQuery(sql, time.perf_counter() - start)
+
+    def executemany(self, sql, parameters):
+        self._lastSQL = sql
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            _sharedProfiler.recordQuery(sql, time.perf_counter() - start)
+
+    def _timeFetch(self, fetch, *args):
+        start = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            _sharedProfiler.recordQuery(getattr(self, '_lastSQL', 'fetch'), time.perf_counter() - start, counted=False)
+
+    def fetchone(self):
+        return self._timeFetch(super().fetchone)
+
+    def fetchmany(self, size=1):
+        return self._timeFetch(super().fetchmany, size)
+
+    def fetchall(self):
+        return self._timeFetch(super().fetchall)
+
+# profiling mode for the collector, for finding out where the time went when a cycle is slow
+# while it is enabled, every databaseService.runCycle() is profiled:
+#   - a sampling profiler records the collector thread's call stack every PROFILE_SAMPLE_INTERVAL seconds
+#     (sampling rather than cProfile, so the cycle isn't slowed down by every python call being traced)
+#   - every sqlite statement is timed, and set_trace_callback counts every statement sqlite runs, including the ones
+#     run by triggers https://docs.python.org/3/library/sqlite3.html#sqlite3.Connection.set_trace_callback
+#   - every UniFi API request is timed by APIclient._makeRequest
+# each profiled cycle writes two files to PROFILE_FOLDER:
+#   cycle-<time>.folded      the sampled stacks in the "collapsed" format, which flamegraph.pl and speedscope.app can open
+#   cycle-<time>-report.txt  the slowest queries and endpoints
+# it can be turned on and off while the app is running with getProfiler().enable() / disable()
+class cycleProfiler:
+    def __init__(self, folder=PROFILE_FOLDER, sampleInterval=PROFILE_SAMPLE_INTERVAL, topN=PROFILE_TOP_N):
+        self.enabled = False
+        self.recording = False # True only while a cycle is being profiled
+        self._folder = folder
+        self._sampleInterval = sampleInterval
+        self._topN = topN
+        self._lock = threading.Lock()
+        self._lastReport = None
+        self._resetRecording()
+
+    def _resetRecording(self):
+        self._stacks = Counter() # collapsed stack -> number of samples
+        self._queries = {} # normalised sql -> [count, total seconds, slowest, errors (unused)]
+        self._requests = {} # endpoint -> [count, total seconds, slowest, errors]
+        self._traced = Counter() # every statement sqlite ran, as seen by the trace callback
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def getLastReport(self):
+        return self._lastReport
+
+    # called by the services instead of con.cursor(), gives a timed and traced cursor while a cycle is being recorded
+    def cursor(self, con):
+        if not self.recording:
+            return con.cursor()
+        con.set_trace_callback(self._traceStatement)
+        return con.cursor(_timedCursor)
+
+    def _traceStatement(self, sql):
+        with self._lock:
+            self._traced[_normaliseSQL(sql)[:200]] += 1
+
+    def _record(self, table, key, seconds, counted=True, failed=False):
+        with self._lock:
+            entry = table.get(key)
+            if entry is None:
+                entry = [0, 0.0, 0.0, 0]
+                table[key] = entry
+            if counted:
+                entry[0] += 1
+            entry[1] += seconds
+            entry[2] = max(entry[2], seconds)
+            if failed:
+                entry[3] += 1
+
+    def recordQuery(self, sql, seconds, counted=True):
+        if self.recording:
+            self._record(self._queries, _normaliseSQL(sql), seconds, counted)
+
+    def recordRequest(self, endpoint, seconds, status):
+        if self.recording:
+            self._record(self._requests, endpoint, seconds, failed=status != 200)
+
+    # samples the given thread's call stack until stop is set
+    # https://docs.python.org/3/library/sys.html#sys._current_frames
+    def _sample(self, threadId, stop):
+        while not stop.wait(self._sampleInterval):
+            frame = sys._current_frames().get(threadId)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                # the collapsed format lists the outermost call first, separated by ;
+                self._stacks[';'.join(reversed(stack))] += 1
+
+    # runs function (eg a databaseService cycle) with the profiler recording, then writes the output files
+    def profile(self, function, *args, **kwargs):
+        with self._lock:
+            if self.recording: # one cycle at a time, a second one just runs normally
+                busy = True
+            else:
+                busy = False
+                self._resetRecording()
+                self.recording = True
+        if busy:
+            return function(*args, **kwargs)
+
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), stop), name="cycleProfiler", daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            stop.set()
+            sampler.join()
+            self.recording = False
+            self._lastReport = self._writeReport(elapsed)
+
+    def _top(self, table):
+        rows = [{'name': key, 'count': entry[0], 'totalSec': entry[1], 'maxSec': entry[2], 'errors': entry[3]} for key, entry in table.items()]
+        rows.sort(key=lambda row: row['totalSec'], reverse=True)
+        return rows[:self._topN]
+
+    def _writeReport(self, elapsed):
+        report = {
+            'cycleSec': elapsed,
+            'samples': sum(self._stacks.values()),
+            'queries': self._top(self._queries),
+            'requests': self._top(self._requests),
+            'statementsTraced': sum(self._traced.values()),
+            'mostRunStatements': [{'name': sql, 'count': count} for sql, count in self._traced.most_common(self._topN)],
+            'sqlSec': sum(entry[1] for entry in self._queries.values()),
+            'httpSec': sum(entry[1] for entry in self._requests.values())
+        }
+        try:
+            self._folder.mkdir(parents=True, exist_ok=True)
+            name = f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+            foldedPath = self._folder / f'{name}.folded'
+            with open(foldedPath, 'w') as file:
+                for stack, count in self._stacks.most_common():
+                    file.write(f'{stack} {count}\n')
+            reportPath = self._folder / f'{name}-report.txt'
+            with open(reportPath, 'w') as file:
+                file.write(self.formatReport(report))
+            report['files'] = [str(foldedPath), str(reportPath)]
+        except OSError as error: # the report is still kept in memory if the files can't be written
+            report['files'] = []
+            report['error'] = str(error)
+        return report
+
+    def formatReport(self, report):
+        lines = [
+            f"cycle took {report['cycleSec'] * 1000:.1f} ms, {report['samples']} stack samples",
+            f"sqlite: {report['sqlSec'] * 1000:.1f} ms, http: {report['httpSec'] * 1000:.1f} ms, "
+            f"python and everything else: {(report['cycleSec'] - report['sqlSec'] - report['httpSec']) * 1000:.1f} ms",
+            '',
+            f"slowest queries (top {self._topN} by total time):"
+        ]
+        for row in report['queries']:
+            lines.append(f"  {row['totalSec'] * 1000:9.2f} ms  x{row['count']:<6} max {row['maxSec'] * 1000:.2f} ms  {row['name'][:160]}")
+        lines += ['', f"slowest endpoints (top {self._topN} by total time):"]
+        for row in report['requests']:
+            lines.append(f"  {row['totalSec'] * 1000:9.2f} ms  x{row['count']:<6} max {row['maxSec'] * 1000:.2f} ms  errors {row['errors']}  {row['name']}")
+        lines += ['', f"most run statements ({report['statementsTraced']} traced, including triggers):"]
+        for row in report['mostRunStatements']:
+            lines.append(f"  x{row['count']:<8} {row['name'][:160]}")
+        return '\n'.join(lines) + '\n'
+
+# one profiler for the whole app, like getMetrics()
+_sharedProfiler = cycleProfiler()
+
+def getProfiler():
+    return _sharedProfiler
@@ -0,0 +1,162 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from src.backend.config import databaseFile, PING_PONG_WINDOW
+
+# roam history and the roaming reports for the dashboard
+# recordRoams() is called by databaseService.pushConnectionData inside its transaction, it writes the roams to
+# tbl_RoamEvents and adds them to the hourly totals, so the reports below never have to go through every roam
+class roamAnalytics:
+    def __init__(self, pingPongWindow=PING_PONG_WINDOW, dbPath=databaseFile):
+        self._pingPongWindow = pingPongWindow
+        self._dbPath = dbPath
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    # same format and timezone (UTC) as sqlite's CURRENT_TIMESTAMP
+    def _formatDate(self, date):
+        return date.strftime("%Y-%m-%d %H:%M:%S")
+
+    # the last roam of each client in the list, used to spot ping-pong roaming
+    def _lastRoams(self, cur, clientIds):
+        lastRoams = {}
+        for i in range(0, len(clientIds), 500): # chunks keep the number of ? placeholders under sqlite's limit
+            chunk = clientIds[i:i + 500]
+            placeholders = ', '.join('?' for _ in chunk)
+            result = cur.execute(
+                '''SELECT clientId, fromAccessPointId, dateCreated FROM tbl_RoamEvents
+                WHERE roamId IN (SELECT MAX(roamId) FROM tbl_RoamEvents WHERE clientId IN (%s) GROUP BY clientId)''' % placeholders,
+                chunk
+            )
+            for clientId, fromAccessPointId, dateCreated in result.fetchall():
+                lastRoams[clientId] = (fromAccessPointId, datetime.strptime(dateCreated, "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc))
+        return lastRoams
+
+    # roams is a list of (clientId, fromAccessPointId, toAccessPointId), as returned by topologyGraph.diff()
+    # runs inside the caller's transaction, the caller commits
+    def recordRoams(self, cur, roams, timestamp=None):
+        self.recordRoamBatches(cur, [(timestamp or datetime.now(timezone.utc), roams)])
+
+    # the roams from several collections at once, as a list of (timestamp, roams) oldest first
+    # used by the snapshot importer, which writes hundreds of snapshots' roams in one go
+    def recordRoamBatches(self, cur, batches):
+        batches = [(timestamp, roams) for timestamp, roams in batches if roams]
+        if not batches:
+            return
+
+        # a ping-pong is going straight back to the AP the client's previous roam came from, within the window
+        # so the previous roams are looked up before any of these are written, then kept up to date as they are counted
+        lastRoams = self._lastRoams(cur, list({roam[0] for _, roams in batches for roam in roams}))
+        roamRows = []
+        clientCounts = {} # (clientId, hour) -> [roams, pingPongs]
+        apCounts = {} # (accessPointId, hour) -> [roamsIn, roamsOut]
+        for timestamp, roams in batches:
+            dateCreated = self._formatDate(timestamp)
+            hour = timestamp.strftime("%Y-%m-%d %H:00:00")
+            for clientId, fromAccessPointId, toAccessPointId in roams:
+                roamRows.append((clientId, fromAccessPointId, toAccessPointId, dateCreated))
+                counts = clientCounts.setdefault((clientId, hour), [0, 0])
+                counts[0] += 1
+                lastRoam = lastRoams.get(clientId)
+                if lastRoam and lastRoam[0] == toAccessPointId and (timestamp - lastRoam[1]).total_seconds() <= self._pingPongWindow:
+                    counts[1] += 1
+                lastRoams[clientId] = (fromAccessPointId, timestamp)
+                apCounts.setdefault((toAccessPointId, hour), [0, 0])[0] += 1
+                apCounts.setdefault((fromAccessPointId, hour), [0, 0])[1] += 1
+
+        cur.executemany(
+            '''INSERT INTO tbl_RoamEvents (clientId, fromAccessPointId, toAccessPointId, dateCreated) VALUES (?, ?, ?, ?)''',
+            roamRows
+        )
+        # upserts add these roams onto the totals for the hour, https://www.sqlite.org/lang_upsert.html
+        cur.executemany(
+            '''INSERT INTO tbl_ClientRoamsHourly (clientId, hour, roams, pingPongs) VALUES (?, ?, ?, ?)
+            ON CONFLICT(clientId, hour) DO UPDATE SET roams = roams + excluded.roams, pingPongs = pingPongs + excluded.pingPongs''',
+            [(clientId, hour, roams, pingPongs) for (clientId, hour), (roams, pingPongs) in clientCounts.items()]
+        )
+        cur.executemany(
+            '''INSERT INTO tbl_APRoamsHourly (accessPointId, hour, roamsIn, roamsOut) VALUES (?, ?, ?, ?)
+            ON CONFLICT(accessPointId, hour) DO UPDATE SET roamsIn = roamsIn + excluded.roamsIn, roamsOut = roamsOut + excluded.roamsOut''',
+            [(accessPointId, hour, roamsIn, roamsOut) for (accessPointId, hour), (roamsIn, roamsOut) in apCounts.items()]
+        )
+
+    def _cutoffHour(self, hours):
+        return (datetime.now(timezone.utc) - timedelta(hours=hours)).strftime("%Y-%m-%d %H:00:00")
+
+    # runs a report query and returns its rows as dictionaries with the given keys
+    def _report(self, query, params, keys, message):
+        cur, con = self._dbConnection()
+        try:
+            result = cur.execute(query, params)
+            rows = [dict(zip(keys, row)) for row in result.fetchall()]
+            return {
+                "successful": True,
+                "message": message.format(len(rows)),
+                "errors": [],
+                "data": rows
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error while building the roaming report.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+    # clients bouncing between two APs, which usually means the APs' coverage overlaps too much or the signal is poor
+    def getPingPongClients(self, hours=24, minPingPongs=3):
+        return self._report(
+            '''SELECT h.clientId, c.hostname, SUM(h.pingPongs) AS pingPongs, SUM(h.roams) AS roams
+            FROM tbl_ClientRoamsHourly h
+            LEFT JOIN tbl_Clients c ON c.clientId = h.clientId
+            WHERE h.hour >= ?
+            GROUP BY h.clientId
+            HAVING SUM(h.pingPongs) >= ?
+            ORDER BY pingPongs DESC''',
+            (self._cutoffHour(hours), minPingPongs),
+            ['clientId', 'hostname', 'pingPongs', 'roams'],
+            "{} clients are ping-pong roaming."
+        )
+
+    # sticky clients: connected clients that have stayed on the same AP without roaming for at least this many hours
+    def getStickyClients(self, hours=24):
+        return self._report(
+            '''SELECT c.clientId, c.hostname, con.accessPointId, lastRoam.hour AS lastRoamHour
+            FROM tbl_Clients c
+            JOIN tbl_Connections con ON con.clientId = c.clientId
+            LEFT JOIN (SELECT clientId, MAX(hour) AS hour FROM tbl_ClientRoamsHourly GROUP BY clientId) lastRoam ON lastRoam.clientId = c.clientId
+            WHERE c.active = 1 AND (lastRoam.hour IS NULL OR lastRoam.hour < ?)
+            ORDER BY lastRoamHour''',
+            (self._cutoffHour(hours),),
+            ['clientId', 'hostname', 'accessPointId', 'lastRoamHour'],
+            "{} clients have not roamed recently."
+        )
+
+    # roams into and out of each access point
+    def getRoamsPerAccessPoint(self, hours=24):
+        return self._report(
+            '''SELECT h.accessPointId, ap.hostname, SUM(h.roamsIn) AS roamsIn, SUM(h.roamsOut) AS roamsOut
+            FROM tbl_APRoamsHourly h
+            LEFT JOIN tbl_APdevices ap ON ap.accessPointId = h.accessPointId
+            WHERE h.hour >= ?
+            GROUP BY h.accessPointId
+            ORDER BY roamsIn + roamsOut DESC''',
+            (self._cutoffHour(hours),),
+            ['accessPointId', 'hostname', 'roamsIn', 'roamsOut'],
+            "Roams counted for {} access points."
+        )
+
+    # one client's most recent roams, newest first
+    def getClientRoamHistory(self, clientId, limit=50):
+        return self._report(
+            '''SELECT fromAccessPointId, toAccessPointId, dateCreated FROM tbl_RoamEvents
+            WHERE clientId = ?
+            ORDER BY roamId DESC
+            LIMIT ?''',
+            (clientId, limit),
+            ['fromAccessPointId', 'toAccessPointId', 'dateCreated'],
+            "Found {} roams for the client."
+        )
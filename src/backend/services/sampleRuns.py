@@ -0,0 +1,147 @@
+import calendar
+import time
+from itertools import groupby
+from src.backend.config import (
+    SAMPLE_MAX_INTERVAL, SAMPLE_IDLE_BPS, SAMPLE_RUN_RATE_TOLERANCE, SAMPLE_RUN_RETRY_TOLERANCE, SAMPLE_RUN_SLOT_TOLERANCE,
+    SAMPLE_RUN_INTERVAL_STEP
+)
+from ..models.models import trafficSample
+
+# storing unchanged traffic samples as runs, used by databaseService when it is created with sampleRuns=True (SAMPLE_RUNS
+# for the collector), and by the write spool and the snapshot importer when they are given it too
+# offline APs get an all zero sample every time and idle APs get nearly the same one, so most of tbl_TrafficSamples
+# would be the same row over and over again
+#
+# a run is one row of tbl_TrafficSamples standing in for sampleCount samples of one AP, evenly spaced from dateCreated to
+# endDate. a single sample is a row with sampleCount 1 and no endDate, which is how every row is written without runs
+# a new sample extends its AP's latest row instead of being inserted when:
+#   - its rates are within SAMPLE_RUN_RATE_TOLERANCE of the row's (at least the idle rate, like samplingScheduler) and its
+#     retry % within SAMPLE_RUN_RETRY_TOLERANCE, the row keeps the rates of its first sample so they can't drift
+#   - the AP hasn't rebooted, its uptime hasn't gone down
+#   - it lands on the run's next slot, within SAMPLE_RUN_SLOT_TOLERANCE of the run's interval. the second sample sets the
+#     interval (rounded to SAMPLE_RUN_INTERVAL_STEP, as the collection starts a little after each of its slots), and the
+#     run's endDate is always a whole number of intervals after dateCreated. so the times of the samples in a run never
+#     change as it grows, and a run never reaches over a gap in the collection
+# the row is then deleted and inserted again with the new endDate and count, so it gets a new sampleId and anything that
+# reads the samples after a sampleId (the dashboard) sees that it changed
+#
+# reads expand the runs back into samples with expandSamples(), so graphs get every sample. totals and averages can be
+# worked out straight from the rows by weighting each one by its sampleCount, eg SUM(txRateBps * sampleCount) / SUM(sampleCount)
+
+# dates are stored like sqlite's CURRENT_TIMESTAMP, UTC to the second
+def _toSeconds(text):
+    return calendar.timegm(time.strptime(text, "%Y-%m-%d %H:%M:%S"))
+
+def _toText(seconds):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(seconds))
+
+# returns the endDate (in seconds) of the run once the sample is added to it, or None if the sample starts a new row
+def _extendedEnd(row, sample, now):
+    _, _, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount = row
+    if (sample.uptimeSec or 0) < uptimeSec:
+        return None
+    if abs((sample.txRetriesPct or 0) - txRetriesPct) > SAMPLE_RUN_RETRY_TOLERANCE:
+        return None
+    for new, old in ((sample.txRateBps or 0, txRateBps), (sample.rxRateBps or 0, rxRateBps)):
+        if abs(new - old) > SAMPLE_RUN_RATE_TOLERANCE * max(old, SAMPLE_IDLE_BPS):
+            return None
+    start = _toSeconds(dateCreated)
+    if sampleCount <= 1:
+        # the second sample sets the run's interval, as long as it isn't longer than the sampler ever waits
+        interval = max(round((now - start) / SAMPLE_RUN_INTERVAL_STEP), 1) * SAMPLE_RUN_INTERVAL_STEP
+        if interval > SAMPLE_MAX_INTERVAL * (1 + SAMPLE_RUN_SLOT_TOLERANCE):
+            return None
+    else:
+        interval = (_toSeconds(endDate) - start) // (sampleCount - 1)
+    slot = start + sampleCount * interval
+    if abs(now - slot) > SAMPLE_RUN_SLOT_TOLERANCE * interval:
+        return None
+    return slot
+
+# writes a list of trafficSample records as runs, inside the caller's transaction
+# returns the number of rows inserted and the number of samples that extended a run
+# now is the unix time the samples were taken, the time they are written if it isn't given
+def writeSampleRuns(cur, trafficSamples, now=None):
+    if not trafficSamples:
+        return 0, 0
+    now = int(time.time()) if now is None else int(now)
+    nowText = _toText(now)
+    # the latest row of each AP, a MAX(sampleId) for one AP is a single lookup in idx_TrafficSamples_accessPointId
+    # looked up in chunks so the number of ? placeholders stays under sqlite's limit
+    accessPointIds = list(set(sample.accessPointId for sample in trafficSamples))
+    latest = {}
+    for i in range(0, len(accessPointIds), 500):
+        chunk = accessPointIds[i:i + 500]
+        placeholders = ', '.join('(?)' for _ in chunk)
+        rows = cur.execute(
+            '''WITH aps(accessPointId) AS (VALUES %s)
+            SELECT t.sampleId, t.accessPointId, t.uptimeSec, t.txRetriesPct, t.txRateBps, t.rxRateBps, t.dateCreated, t.endDate, t.sampleCount
+            FROM aps JOIN tbl_TrafficSamples t ON t.sampleId = (SELECT MAX(sampleId) FROM tbl_TrafficSamples WHERE accessPointId = aps.accessPointId)''' % placeholders,
+            chunk
+        ).fetchall()
+        latest.update((row[1], row) for row in rows)
+
+    deletes = []
+    inserts = []
+    pending = {} # accessPointId -> index of its row in inserts, so a second sample for an AP in the same list can extend it
+    extended = 0
+    for sample in trafficSamples:
+        row = latest.get(sample.accessPointId)
+        end = _extendedEnd(row, sample, now) if row is not None else None
+        if end is None:
+            row = (None, sample.accessPointId, sample.uptimeSec, sample.txRetriesPct, sample.txRateBps, sample.rxRateBps, nowText, None, 1)
+            pending[sample.accessPointId] = len(inserts)
+            inserts.append(row[1:])
+        else:
+            row = row[:2] + (sample.uptimeSec,) + row[3:7] + (_toText(end), row[8] + 1)
+            if row[0] is not None:
+                deletes.append((row[0],))
+                pending[sample.accessPointId] = len(inserts)
+                inserts.append(row[1:])
+            else:
+                inserts[pending[sample.accessPointId]] = row[1:]
+            extended += 1
+        latest[sample.accessPointId] = (None,) + row[1:] # it has no sampleId until it is inserted
+
+    cur.executemany('''DELETE FROM tbl_TrafficSamples WHERE sampleId = ?''', deletes)
+    cur.executemany(
+        '''INSERT INTO tbl_TrafficSamples (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+        inserts
+    )
+    return len(inserts), extended
+
+# the same for rows that carry the time they were collected, (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps,
+# dateCreated) oldest first, like the write spool and the snapshot importer keep them. the rows collected at the same
+# time are written together, with that time as now
+def writeSampleRunRows(cur, rows):
+    inserted = 0
+    extended = 0
+    for dateCreated, group in groupby(rows, key=lambda row: row[5]):
+        counts = writeSampleRuns(cur, [trafficSample(*row[:5]) for row in group], now=_toSeconds(dateCreated))
+        inserted += counts[0]
+        extended += counts[1]
+    return inserted, extended
+
+# turns rows of (sampleId, accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount)
+# into one (sampleId, accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated) per sample
+# the samples of a run share its sampleId, and their uptime counts up to the run's latest one
+# since is optional, a date like dateCreated, only the samples of runs from then on are given (single samples are given as they are)
+def expandSamples(rows, since=None):
+    samples = []
+    for sampleId, accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount in rows:
+        if sampleCount <= 1 or endDate is None:
+            samples.append((sampleId, accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated))
+            continue
+        start = _toSeconds(dateCreated)
+        end = _toSeconds(endDate)
+        interval = (end - start) // (sampleCount - 1)
+        first = 0
+        if since is not None and since > dateCreated:
+            first = -(-(_toSeconds(since) - start) // interval) # rounded up
+        for i in range(first, sampleCount):
+            at = start + i * interval
+            # an offline AP's uptime stays 0
+            uptime = max(0, uptimeSec - (end - at)) if uptimeSec else uptimeSec
+            samples.append((sampleId, accessPointId, uptime, txRetriesPct, txRateBps, rxRateBps, _toText(at)))
+    return samples
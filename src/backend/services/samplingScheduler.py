@@ -0,0 +1,98 @@
+import time
+from src.backend.config import (
+    FETCH_INTERVAL, SAMPLE_MIN_INTERVAL, SAMPLE_MAX_INTERVAL, SAMPLE_REQUEST_BUDGET,
+    SAMPLE_BUSY_BPS, SAMPLE_IDLE_BPS, SAMPLE_RETRY_THRESHOLD, SAMPLE_CHANGE_RATIO
+)
+from .metrics import getMetrics
+
+# decides which access points get a traffic sample on each collection, so the APs that matter are sampled often
+# and the console is never asked for more than budget statistics per collection
+#
+# each AP has its own interval, starting at FETCH_INTERVAL, that changes after every sample:
+#   - it drops straight to the minimum when the sample looks anomalous: a high retry rate, the throughput jumping
+#     or falling by more than SAMPLE_CHANGE_RATIO, or the AP having rebooted (its uptime went down)
+#   - it halves while the AP is busy, and doubles while the AP is idle
+#   - otherwise it moves back towards FETCH_INTERVAL
+# offline APs never cost a request, they are given an all zero sample every maximum interval
+# the collection has to run more often than FETCH_INTERVAL for the shorter intervals to make any difference
+class samplingScheduler:
+    # clock is only passed in by tests and benchmarks that need to move time along themselves
+    def __init__(self, budget=SAMPLE_REQUEST_BUDGET, minInterval=SAMPLE_MIN_INTERVAL, maxInterval=SAMPLE_MAX_INTERVAL, baseInterval=FETCH_INTERVAL, clock=time.monotonic):
+        self._budget = budget
+        self._minInterval = minInterval
+        self._maxInterval = maxInterval
+        self._baseInterval = min(max(baseInterval, minInterval), maxInterval)
+        self._clock = clock
+        self._aps = {} # accessPointId -> {'state', 'interval', 'nextDue', 'throughput', 'uptime'}
+
+    # devices is the list from APIclient.fetchAccessPoints()
+    # returns the ids of the online APs to fetch a sample for, and the ids of the offline APs due a zero sample
+    def plan(self, devices):
+        now = self._clock()
+        due = []
+        offline = []
+        notDue = 0
+        seen = set()
+        for device in devices:
+            accessPointId = device['id']
+            seen.add(accessPointId)
+            entry = self._aps.get(accessPointId)
+            if entry is None or entry['state'] != device['state']:
+                # new APs, and APs that have just come online or gone offline, are sampled straight away
+                entry = {'state': device['state'], 'interval': self._baseInterval, 'nextDue': now, 'throughput': None, 'uptime': None}
+                self._aps[accessPointId] = entry
+            if entry['nextDue'] > now:
+                notDue += 1
+            elif device['state'] != "ONLINE":
+                offline.append(accessPointId)
+                entry['interval'] = self._maxInterval
+                entry['nextDue'] = now + self._maxInterval
+            else:
+                due.append(accessPointId)
+        # APs that were removed from the console are forgotten
+        for accessPointId in set(self._aps) - seen:
+            del self._aps[accessPointId]
+
+        # the most overdue go first, measured in their own intervals so a fast AP one interval late ranks with a slow AP
+        # one interval late. the ones over the budget stay due, and being later still puts them first next time
+        due.sort(key=lambda accessPointId: (now - self._aps[accessPointId]['nextDue']) / self._aps[accessPointId]['interval'], reverse=True)
+        fetch = due[:self._budget]
+
+        metrics = getMetrics()
+        metrics.incrementCounter('openhaven_sample_requests_total', len(fetch))
+        metrics.incrementCounter('openhaven_samples_skipped_total', notDue, reason='notDue')
+        metrics.incrementCounter('openhaven_samples_skipped_total', len(due) - len(fetch), reason='budget')
+        metrics.incrementCounter('openhaven_samples_skipped_total', len(offline), reason='offline')
+        return fetch, offline
+
+    # called with each sample fetched for an AP from plan(), sets when the AP is next sampled
+    # sample is a trafficSample record
+    def recordSample(self, accessPointId, sample):
+        entry = self._aps.get(accessPointId)
+        if entry is None:
+            return
+        throughput = (sample.txRateBps or 0) + (sample.rxRateBps or 0)
+        lastThroughput = entry['throughput']
+        # a change is measured against at least the idle rate, so an idle AP going from 1 to 3 bps isn't anomalous
+        changed = lastThroughput is not None and abs(throughput - lastThroughput) > SAMPLE_CHANGE_RATIO * max(lastThroughput, SAMPLE_IDLE_BPS)
+        rebooted = entry['uptime'] is not None and (sample.uptimeSec or 0) < entry['uptime']
+
+        if (sample.txRetriesPct or 0) >= SAMPLE_RETRY_THRESHOLD or changed or rebooted:
+            interval = self._minInterval
+        elif throughput >= SAMPLE_BUSY_BPS:
+            interval = entry['interval'] / 2
+        elif throughput <= SAMPLE_IDLE_BPS:
+            interval = entry['interval'] * 2
+        elif entry['interval'] < self._baseInterval:
+            interval = min(entry['interval'] * 2, self._baseInterval)
+        else:
+            interval = max(entry['interval'] / 2, self._baseInterval)
+
+        entry['interval'] = min(max(interval, self._minInterval), self._maxInterval)
+        entry['nextDue'] = self._clock() + entry['interval']
+        entry['throughput'] = throughput
+        entry['uptime'] = sample.uptimeSec or 0
+
+    # each AP's current interval in seconds, for the dashboard and for checking how the scheduler is behaving
+    def getIntervals(self):
+        return {accessPointId: entry['interval'] for accessPointId, entry in self._aps.items()}
@@ -0,0 +1,254 @@
+import sqlite3
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from src.backend.config import databaseFile, SESSION_TTL, SESSION_CACHE_SIZE, SESSION_TOUCH_INTERVAL
+
+# login sessions for the dashboard
+# the password is only checked once with argon2 when the user logs in (in UserService.login)
+# after that every action just passes the session token, which is checked here without any argon2 work
+class SessionService():
+    # there is one cache per database file, shared between every SessionService object using that database, so revoking
+    # a session in one place applies straight away everywhere else in the app, but a token from one database (eg another
+    # site's shard, or a scratch database) is never found in the cache of another
+    # OrderedDict lets me use it as an LRU cache, https://docs.python.org/3/library/collections.html#ordereddict-objects
+    _caches = {} # database path -> OrderedDict of tokenHash -> session
+    _lock = threading.Lock()
+
+    def __init__(self, ttl=SESSION_TTL, cacheSize=SESSION_CACHE_SIZE, dbPath=databaseFile):
+        self._ttl = ttl
+        self._cacheSize = cacheSize
+        self._dbPath = dbPath
+        with self._lock:
+            self._cache = self._caches.setdefault(os.path.abspath(dbPath), OrderedDict())
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    # tokens are 256 bits of randomness, so a plain sha256 is enough to store them safely
+    # (a slow hash like argon2 is only needed for passwords people choose themselves)
+    def _hashToken(self, token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    # adds a session to the front of the cache, dropping the least recently used one if it is full
+    def _cacheSession(self, tokenHash, session):
+        with self._lock:
+            self._cache[tokenHash] = session
+            self._cache.move_to_end(tokenHash)
+            while len(self._cache) > self._cacheSize:
+                self._cache.popitem(last=False)
+
+    # only used on a cache miss, eg after the app restarts or the session fell out of the cache
+    def _loadSession(self, tokenHash):
+        cur, con = self._dbConnection()
+        try:
+            result = cur.execute(
+                '''SELECT userId, username, accessLevel, expiresAt FROM tbl_Sessions WHERE tokenHash = ? AND revoked = 0''',
+                (tokenHash,)
+            )
+            result = result.fetchone()
+            if not result:
+                return None
+            return {
+                'userId': result[0],
+                'username': result[1],
+                'accessLevel': result[2],
+                'expiresAt': result[3],
+                'savedExpiresAt': result[3] # the expiry time currently stored in the database
+            }
+        finally:
+            con.close()
+
+    # writes the moved expiry time back to the database
+    def _saveExpiry(self, tokenHash, expiresAt):
+        cur, con = self._dbConnection()
+        try:
+            cur.execute(
+                '''UPDATE tbl_Sessions SET expiresAt = ? WHERE tokenHash = ? AND revoked = 0''',
+                (expiresAt, tokenHash)
+            )
+            con.commit()
+        finally:
+            con.close()
+
+    def createSession(self, userId, username, accessLevel):
+        token = secrets.token_urlsafe(32) # https://docs.python.org/3/library/secrets.html
+        tokenHash = self._hashToken(token)
+        expiresAt = time.time() + self._ttl
+
+        cur, con = self._dbConnection()
+        try:
+            cur.execute(
+                '''INSERT INTO tbl_Sessions (tokenHash, userId, username, accessLevel, expiresAt) VALUES (?, ?, ?, ?, ?)''',
+                (tokenHash, userId, username, accessLevel, expiresAt)
+            )
+            con.commit()
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error creating session.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+        self._cacheSession(tokenHash, {
+            'userId': userId,
+            'username': username,
+            'accessLevel': accessLevel,
+            'expiresAt': expiresAt,
+            'savedExpiresAt': expiresAt
+        })
+        return {
+            "successful": True,
+            "message": "Session created.",
+            "errors": [],
+            "data": {
+                'token': token, # the only time the plain token is ever returned
+                'expiresAt': expiresAt
+            }
+        }
+
+    # checks a token and returns the user it belongs to
+    # requiredAccessLevel can be set to 'ADMIN' for admin only actions
+    def validateSession(self, token, requiredAccessLevel=None):
+        invalid = {
+            "successful": False,
+            "message": "Session is invalid or has expired.",
+            "errors": ["Session is invalid or has expired."]
+        }
+        if not token:
+            return invalid
+
+        tokenHash = self._hashToken(token)
+        now = time.time()
+
+        with self._lock:
+            session = self._cache.get(tokenHash)
+            if session is not None:
+                self._cache.move_to_end(tokenHash)
+        if session is None:
+            session = self._loadSession(tokenHash)
+            if session is None:
+                return invalid
+            self._cacheSession(tokenHash, session)
+
+        if session['expiresAt'] <= now:
+            with self._lock:
+                self._cache.pop(tokenHash, None)
+            return invalid
+
+        if requiredAccessLevel and session['accessLevel'] != requiredAccessLevel:
+            return {
+                "successful": False,
+                "message": "You do not have permission to do this.",
+                "errors": [f"{requiredAccessLevel} access is required."]
+            }
+
+        # sliding expiry, every time the session is used it gets another full ttl
+        # the database copy is only updated every SESSION_TOUCH_INTERVAL seconds, so most checks never write to the db
+        session['expiresAt'] = now + self._ttl
+        if session['expiresAt'] - session['savedExpiresAt'] >= SESSION_TOUCH_INTERVAL:
+            try:
+                self._saveExpiry(tokenHash, session['expiresAt'])
+                session['savedExpiresAt'] = session['expiresAt']
+            except sqlite3.Error:
+                pass # the in memory expiry is still correct, the db copy will be updated on the next check
+
+        return {
+            "successful": True,
+            "message": "Session is valid.",
+            "errors": [],
+            "data": {
+                'userId': session['userId'],
+                'username': session['username'],
+                'accessLevel': session['accessLevel']
+            }
+        }
+
+    # logging out, the session is removed from the cache first so it stops working immediately
+    def revokeSession(self, token):
+        tokenHash = self._hashToken(token)
+        with self._lock:
+            self._cache.pop(tokenHash, None)
+
+        cur, con = self._dbConnection()
+        try:
+            cur.execute(
+                '''UPDATE tbl_Sessions SET revoked = 1 WHERE tokenHash = ?''',
+                (tokenHash,)
+            )
+            con.commit()
+            return {
+                "successful": True,
+                "message": "Logged out.",
+                "errors": []
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error while logging out.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+    # revokes every session for a user, used when a user is deleted or their password changes
+    def revokeUserSessions(self, userId):
+        with self._lock:
+            for tokenHash in [key for key, session in self._cache.items() if session['userId'] == userId]:
+                del self._cache[tokenHash]
+
+        cur, con = self._dbConnection()
+        try:
+            cur.execute(
+                '''UPDATE tbl_Sessions SET revoked = 1 WHERE userId = ?''',
+                (userId,)
+            )
+            con.commit()
+            return {
+                "successful": True,
+                "message": "All sessions for the user were revoked.",
+                "errors": []
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error while revoking sessions.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
+
+    # removes expired and revoked sessions from the table so it does not keep growing
+    def deleteExpiredSessions(self):
+        now = time.time()
+        with self._lock:
+            for tokenHash in [key for key, session in self._cache.items() if session['expiresAt'] <= now]:
+                del self._cache[tokenHash]
+
+        cur, con = self._dbConnection()
+        try:
+            cur.execute(
+                '''DELETE FROM tbl_Sessions WHERE revoked = 1 OR expiresAt <= ?''',
+                (now,)
+            )
+            con.commit()
+            return {
+                "successful": True,
+                "message": f"Deleted {cur.rowcount} old sessions.",
+                "errors": []
+            }
+        except Exception as error:
+            return {
+                "successful": False,
+                "message": "Error while deleting old sessions.",
+                "errors": [str(error)]
+            }
+        finally:
+            con.close()
@@ -0,0 +1,282 @@
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timezone
+from src.backend.config import databaseFile
+from .unifi_api import APIclient
+from .collectData import collectData
+from .auditQueue import insertAuditEvents
+from .topologyGraph import topologyGraph
+from .roamAnalytics import roamAnalytics
+from .sampleRuns import writeSampleRunRows
+from ..models.models import auditEvent, auditEventType
+
+# loading archived UniFi API responses (snapshots) into the database, eg to backfill history on a new dashboard host
+#
+# a snapshot is every response from one collection, keyed by the endpoint it came from ('devices', 'clients/<id>'...)
+# two ways of storing them on disk are supported:
+#   - a folder per snapshot, named after its UTC time (2026-05-01T12-00-00), with each response saved as <endpoint>.json,
+#     eg 2026-05-01T12-00-00/devices.json and 2026-05-01T12-00-00/clients/<id>.json
+#   - a JSON Lines archive (optionally gzipped) with one response per line: {"time": ..., "endpoint": ..., "response": ...}
+#     lines from the same snapshot share the same time, and the snapshots are in time order
+#
+# each snapshot goes through the real collectData (so the same models), using recordedAPIclient in place of the console
+
+# stands in for APIclient, answering each request with the recorded response for that endpoint
+class recordedAPIclient(APIclient):
+    def __init__(self, responses):
+        super().__init__(consoleIp=None, apiKey=None, siteId=None)
+        self._responses = responses
+
+    def _makeRequest(self, endpoint):
+        if endpoint not in self._responses:
+            raise Exception(f"The snapshot has no recorded response for {endpoint}.")
+        return self._responses[endpoint]
+
+# the time in a snapshot folder's name or an archive line, always treated as UTC
+def _parseTime(value):
+    value = value.rstrip('Z')
+    if 'T' in value:
+        day, clock = value.split('T', 1)
+        value = f"{day}T{clock.replace('-', ':')}"
+    date = datetime.fromisoformat(value)
+    return date.replace(tzinfo=timezone.utc) if date.tzinfo is None else date.astimezone(timezone.utc)
+
+# yields (time, responses) for each snapshot folder inside folder, oldest first
+def readSnapshotFolder(folder):
+    for name in sorted(os.listdir(folder)):
+        snapshotFolder = os.path.join(folder, name)
+        if not os.path.isdir(snapshotFolder):
+            continue
+        responses = {}
+        for root, _, files in os.walk(snapshotFolder):
+            for file in files:
+                if file.endswith('.json'):
+                    path = os.path.join(root, file)
+                    endpoint = os.path.relpath(path, snapshotFolder)[:-len('.json')].replace(os.sep, '/')
+                    with open(path, 'r') as handle:
+                        responses[endpoint] = json.load(handle)
+        yield _parseTime(name), responses
+
+# yields (time, responses) for each snapshot in a JSON Lines archive, reading it one line at a time
+# so an archive of months of snapshots never has to fit in memory
+def readSnapshotArchive(path):
+    opener = gzip.open if str(path).endswith('.gz') else open
+    currentTime = None
+    responses = {}
+    with opener(path, 'rt') as file:
+        for line in file:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if record['time'] != currentTime:
+                if responses:
+                    yield _parseTime(currentTime), responses
+                currentTime = record['time']
+                responses = {}
+            responses[record['endpoint']] = record['response']
+    if responses:
+        yield _parseTime(currentTime), responses
+
+# replays snapshots into the database in time order, as if each one had been collected at the time it was recorded
+# the push methods in databaseService write every row on its own with the current time, which is far too slow for
+# months of history, so this keeps the current state of every AP, client, broadcast and connection in memory,
+# works out what each snapshot changed (the same checks as the push methods), and writes the changes for
+# batchSnapshots snapshots at a time, in one transaction with executemany, with the snapshot's time on every row
+#
+# unlike pushAPData/pushWifiBroadcastData, an AP or broadcast is only logged as updated when something about it changed
+# sampleRuns stores unchanged traffic samples as runs, like databaseService(sampleRuns=True) (see services/sampleRuns.py)
+class snapshotImporter:
+    def __init__(self, dbPath=databaseFile, batchSnapshots=200, sampleRuns=False):
+        self._dbPath = dbPath
+        self._batchSnapshots = batchSnapshots
+        self._sampleRuns = sampleRuns
+        self._roamAnalytics = roamAnalytics(dbPath=dbPath)
+        self._graph = topologyGraph(dbPath)
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    def _formatDate(self, date):
+        return date.strftime("%Y-%m-%d %H:%M:%S")
+
+    # the current state of the database, so the first snapshot is compared with what is already there
+    def _loadState(self, cur):
+        self._aps = {row[0]: row[1:] for row in cur.execute('''SELECT accessPointId, hostname, ipAddress, macAddress, apState FROM tbl_APdevices''')}
+        self._clients = {row[0]: row[1:] for row in cur.execute('''SELECT clientId, hostname, ipAddress, macAddress, active FROM tbl_Clients''')}
+        self._broadcasts = {row[0]: row[1:] for row in cur.execute('''SELECT broadcastId, ssid, active, hideName FROM tbl_WifiBroadcasts''')}
+        self._graph.load(cur)
+
+    def _resetBatch(self):
+        self._apRows = {} # accessPointId -> row, only the latest state in the batch needs writing
+        self._clientRows = {}
+        self._broadcastRows = {}
+        self._connectionRows = {} # clientId -> accessPointId
+        self._sampleRows = []
+        self._roamBatches = [] # (time, roams) for each snapshot, recorded in order so ping-pongs are spotted
+        self._events = []
+        self._batchSize = 0
+
+    def _event(self, eventType, subject, date, target=None, accessPointId=None, clientId=None, broadcastId=None):
+        self._events.append(auditEvent(eventType, subject, target, accessPointId, clientId, broadcastId, date).toDictionary())
+
+    # compares one snapshot with the current state and adds what changed to the batch
+    def _addSnapshot(self, snapshotTime, responses):
+        date = self._formatDate(snapshotTime)
+        collector = collectData(recordedAPIclient(responses))
+        apData, trafficSamples = collector.collectAPData()
+        clientData, topologyData = collector.collectClientData()
+        wifiBroadcasts = collector.collectWifiBroadcasts() if 'wifi/broadcasts' in responses else []
+
+        for ap in apData:
+            row = ap[1:] # everything but the id, as a plain tuple
+            previous = self._aps.get(ap.accessPointId)
+            if previous != row:
+                self._aps[ap.accessPointId] = row
+                self._apRows[ap.accessPointId] = ap
+                self._event(auditEventType.AP_ADDED if previous is None else auditEventType.AP_UPDATED, ap.hostname, date, accessPointId=ap.accessPointId)
+        for sample in trafficSamples:
+            self._sampleRows.append(sample + (date,))
+
+        for broadcast in wifiBroadcasts:
+            row = broadcast[1:]
+            previous = self._broadcasts.get(broadcast.broadcastId)
+            if previous != row:
+                self._broadcasts[broadcast.broadcastId] = row
+                self._broadcastRows[broadcast.broadcastId] = broadcast
+                self._event(auditEventType.BROADCAST_ADDED if previous is None else auditEventType.BROADCAST_UPDATED, broadcast.ssid, date, broadcastId=broadcast.broadcastId)
+
+        # same checks as pushClientData and detectInactiveClients
+        seen = set()
+        for clientRecord in clientData:
+            clientId = clientRecord.clientId
+            seen.add(clientId)
+            row = clientRecord[1:] # hostname, ipAddress, macAddress, active (always True for a fetched client)
+            previous = self._clients.get(clientId)
+            if previous is None:
+                self._event(auditEventType.CLIENT_NEW, clientRecord.hostname, date, clientId=clientId)
+            elif not previous[3]:
+                self._event(auditEventType.CLIENT_RECONNECTED, clientRecord.hostname, date, clientId=clientId)
+            if previous != row:
+                self._clients[clientId] = row
+                self._clientRows[clientId] = (clientId,) + row + (date,)
+        for clientId, row in self._clients.items():
+            if row[3] and clientId not in seen:
+                row = row[:3] + (False,)
+                self._clients[clientId] = row
+                self._clientRows[clientId] = (clientId,) + row + (date,)
+                self._event(auditEventType.CLIENT_DISCONNECTED, row[0], date, clientId=clientId)
+
+        # same as pushConnectionData, the graph is updated straight away as the batch is written in one transaction
+        changes = self._graph.diff(topologyData)
+        moves = changes['newConnections'] + [(clientId, newAccessPointId) for clientId, _, newAccessPointId in changes['roams']]
+        for clientId, accessPointId in moves:
+            self._connectionRows[clientId] = accessPointId
+            apRow = self._aps.get(accessPointId)
+            self._event(auditEventType.CLIENT_ROAMED, self._clients[clientId][0] if clientId in self._clients else None, date,
+                        target=apRow[0] if apRow else None, accessPointId=accessPointId, clientId=clientId)
+        if changes['roams']:
+            self._roamBatches.append((snapshotTime, changes['roams']))
+        self._graph.apply(changes)
+        self._batchSize += 1
+
+    # the search index trigger indexes audit logs one row at a time, which took most of an import's time
+    # so for a batch it is dropped, the logs are inserted, then indexed with one INSERT ... SELECT and the trigger is put back
+    # it all happens inside the batch's transaction, so nothing else ever sees the table without its trigger
+    def _insertEvents(self, cur):
+        if not cur.connection.in_transaction:
+            cur.execute('''BEGIN''')
+        triggerSQL = cur.execute('''SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_AuditLogs_insert' ''').fetchone()
+        lastId = cur.execute('''SELECT coalesce(MAX(auditLogId), 0) FROM tbl_AuditLogs''').fetchone()[0]
+        if triggerSQL:
+            cur.execute('''DROP TRIGGER trg_AuditLogs_insert''')
+        insertAuditEvents(cur, self._events)
+        if triggerSQL:
+            cur.execute(
+                '''INSERT INTO tbl_AuditLogsSearch (rowid, logMessage) SELECT auditLogId, logMessage FROM vw_AuditLogs WHERE auditLogId > ?''',
+                (lastId,)
+            )
+            cur.execute(triggerSQL[0])
+
+    # writes the batch in one transaction, returns the number of rows written
+    def _writeBatch(self, cur, con):
+        cur.executemany(
+            '''INSERT INTO tbl_APdevices (accessPointId, hostname, ipAddress, macAddress, apState) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(accessPointId) DO UPDATE SET hostname=excluded.hostname, ipAddress=excluded.ipAddress, macAddress=excluded.macAddress, apState=excluded.apState''',
+            list(self._apRows.values())
+        )
+        cur.executemany(
+            '''INSERT INTO tbl_WifiBroadcasts (broadcastId, ssid, active, hideName) VALUES (?, ?, ?, ?)
+            ON CONFLICT(broadcastId) DO UPDATE SET ssid=excluded.ssid, active=excluded.active, hideName=excluded.hideName''',
+            list(self._broadcastRows.values())
+        )
+        # connectedAt is the time the client was first seen, so it is only set when the client is inserted
+        cur.executemany(
+            '''INSERT INTO tbl_Clients (clientId, hostname, ipAddress, macAddress, active, connectedAt) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(clientId) DO UPDATE SET hostname=excluded.hostname, ipAddress=excluded.ipAddress, macAddress=excluded.macAddress, active=excluded.active''',
+            list(self._clientRows.values())
+        )
+        # a client has one connection row, so its old one is removed before the new one is added
+        cur.executemany('''DELETE FROM tbl_Connections WHERE clientId = ?''', [(clientId,) for clientId in self._connectionRows])
+        cur.executemany('''INSERT INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''', list(self._connectionRows.items()))
+        if self._sampleRuns:
+            # a sample that extended a run didn't add a row, so it isn't counted
+            sampleRows = len(self._sampleRows) - writeSampleRunRows(cur, self._sampleRows)[1]
+        else:
+            cur.executemany(
+                '''INSERT INTO tbl_TrafficSamples (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated) VALUES (?, ?, ?, ?, ?, ?)''',
+                self._sampleRows
+            )
+            sampleRows = len(self._sampleRows)
+        self._roamAnalytics.recordRoamBatches(cur, self._roamBatches)
+        roams = sum(len(snapshotRoams) for _, snapshotRoams in self._roamBatches)
+        if self._events:
+            self._insertEvents(cur)
+        con.commit()
+        return (len(self._apRows) + len(self._broadcastRows) + len(self._clientRows) + len(self._connectionRows)
+                + sampleRows + roams + len(self._events))
+
+    # snapshots is an iterable of (time, responses), eg from readSnapshotFolder or readSnapshotArchive, oldest first
+    # if a batch fails, everything written by earlier batches stays and the import stops at that batch
+    def importSnapshots(self, snapshots):
+        cur, con = self._dbConnection()
+        start = time.perf_counter()
+        imported = 0
+        rows = 0
+        lastTime = None
+        try:
+            self._loadState(cur)
+            self._resetBatch()
+            for snapshotTime, responses in snapshots:
+                if lastTime is not None and snapshotTime < lastTime:
+                    raise Exception(f"Snapshots must be in time order, {snapshotTime} came after {lastTime}.")
+                lastTime = snapshotTime
+                self._addSnapshot(snapshotTime, responses)
+                if self._batchSize >= self._batchSnapshots:
+                    rows += self._writeBatch(cur, con)
+                    imported += self._batchSize
+                    self._resetBatch()
+            if self._batchSize:
+                rows += self._writeBatch(cur, con)
+                imported += self._batchSize
+            seconds = time.perf_counter() - start
+            return {
+                "successful": True,
+                "message": f"Imported {imported} snapshots ({rows} rows) in {seconds:.1f}s.",
+                "errors": [],
+                "data": {'snapshots': imported, 'rows': rows, 'seconds': seconds, 'rowsPerSecond': rows / seconds if seconds else 0}
+            }
+        except Exception as error:
+            con.rollback()
+            return {
+                "successful": False,
+                "message": f"Error importing snapshots, {imported} snapshots were imported before the error.",
+                "errors": [str(error)],
+                "data": {'snapshots': imported, 'rows': rows}
+            }
+        finally:
+            con.close()
@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+from src.backend.config import databaseFile
+
+# in-memory copy of tbl_Connections, which client is connected to which access point
+# it is stored both ways round (AP -> set of clients, client -> AP), so counting or listing an AP's clients
+# and finding a client's AP are all dictionary lookups instead of table scans
+# it is loaded from the database once, then databaseService.pushConnectionData keeps it up to date with each fetch's changes
+class topologyGraph:
+    def __init__(self, dbPath=databaseFile):
+        self._dbPath = dbPath
+        self._apClients = {} # accessPointId -> set of clientIds
+        self._clientAP = {} # clientId -> accessPointId
+        self._version = 0 # goes up by one every time the graph changes
+        self._snapshot = None # cached result of snapshot() for the current version
+        self._loaded = False
+        self._lock = threading.Lock() # the collector updates the graph while the UI reads it
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    # loads every connection from the database, a cursor can be passed in to read inside an open transaction
+    def load(self, cur=None):
+        con = None
+        if cur is None:
+            cur, con = self._dbConnection()
+        try:
+            rows = cur.execute('''SELECT clientId, accessPointId FROM tbl_Connections''').fetchall()
+        finally:
+            if con is not None:
+                con.close()
+
+        with self._lock:
+            self._apClients = {}
+            self._clientAP = {}
+            for clientId, accessPointId in rows:
+                self._clientAP[clientId] = accessPointId
+                self._apClients.setdefault(accessPointId, set()).add(clientId)
+            self._loaded = True
+            self._version += 1
+            self._snapshot = None
+
+    def isLoaded(self):
+        return self._loaded
+
+    # compares a fetch's topology data (collectData.collectClientData) with the graph, without changing the graph
+    # returns the new connections as (clientId, accessPointId) and the roams as (clientId, oldAccessPointId, newAccessPointId)
+    def diff(self, topologyData):
+        newConnections = []
+        roams = []
+        seen = set() # a client listed twice in one fetch only counts once
+        with self._lock:
+            for topology in topologyData:
+                if topology.clientId in seen:
+                    continue
+                seen.add(topology.clientId)
+                currentAPid = self._clientAP.get(topology.clientId)
+                if currentAPid is None:
+                    newConnections.append((topology.clientId, topology.accessPointId))
+                elif currentAPid != topology.accessPointId:
+                    roams.append((topology.clientId, currentAPid, topology.accessPointId))
+        return {'newConnections': newConnections, 'roams': roams}
+
+    # applies the changes from diff() once they have been committed to the database
+    def apply(self, changes):
+        if not changes['newConnections'] and not changes['roams']:
+            return
+        with self._lock:
+            for clientId, accessPointId in changes['newConnections']:
+                self._clientAP[clientId] = accessPointId
+                self._apClients.setdefault(accessPointId, set()).add(clientId)
+            for clientId, oldAccessPointId, newAccessPointId in changes['roams']:
+                self._clientAP[clientId] = newAccessPointId
+                oldClients = self._apClients.get(oldAccessPointId)
+                if oldClients is not None:
+                    oldClients.discard(clientId)
+                    if not oldClients:
+                        del self._apClients[oldAccessPointId]
+                self._apClients.setdefault(newAccessPointId, set()).add(clientId)
+            self._version += 1
+            self._snapshot = None
+
+    def getVersion(self):
+        return self._version
+
+    def getClientCount(self, accessPointId):
+        with self._lock:
+            return len(self._apClients.get(accessPointId, ()))
+
+    def getClients(self, accessPointId):
+        with self._lock:
+            return tuple(self._apClients.get(accessPointId, ()))
+
+    def getAccessPoint(self, clientId):
+        with self._lock:
+            return self._clientAP.get(clientId)
+
+    def getClientCounts(self):
+        with self._lock:
+            return {accessPointId: len(clients) for accessPointId, clients in self._apClients.items()}
+
+    # the whole graph for the UI, built at most once per version and then handed out as is
+    # so refreshing the topology page when nothing changed costs nothing
+    # the returned dictionary is shared, so it must not be modified
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is None:
+                connections = {accessPointId: tuple(sorted(clients)) for accessPointId, clients in self._apClients.items()}
+                self._snapshot = {
+                    'version': self._version,
+                    'clientCounts': {accessPointId: len(clients) for accessPointId, clients in connections.items()},
+                    'connections': connections
+                }
+            return self._snapshot
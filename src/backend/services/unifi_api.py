@@ -1,5 +1,16 @@
-#http client that allows me to communicate with the network API using HTTP GET requests
-import httpx
+import json
+import re
+import socket
+import threading
+import time
+import weakref
+from src.backend.config import API_REQUEST_TIMEOUT
+from .deadline import deadlineExceeded
+from .metrics import getMetrics
+from .profiler import getProfiler
+
+# ids in an endpoint are swapped for {id} in the metrics, so every client's topology request is counted as one endpoint
+_idPattern = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}')
 
 # this class will allow me to easily make api calls for different endpoints across the app
 class APIclient:
@@ -10,10 +21,22 @@ class APIclient:
         self._siteId = siteId
         self._baseURL = f"https://{self._consoleIp}/proxy/network/integration/v1/sites/{self._siteId}"
 
-        # creating a http client for efficiency, can then close this client when I am done with a request
-        # that way I do not build up a bunch of open HTTP clients that are making requests
-        # https://www.python-httpx.org/advanced/clients/
-        self._client = httpx.Client(verify=False)
+        # the http client is only made when the first request is sent (see _getClient), so creating an APIclient
+        # at startup doesn't have to import httpx or set up ssl
+        self._client = None
+        self._deadline = None # the cycleDeadline of the run being collected, see setDeadline
+        self._sockets = weakref.WeakSet() # the sockets the client's connections were opened on, see _trace
+        self._socketsLock = threading.Lock()
+
+    # creating a http client for efficiency, can then close this client when I am done with a request
+    # that way I do not build up a bunch of open HTTP clients that are making requests
+    # https://www.python-httpx.org/advanced/clients/
+    def _getClient(self):
+        if self._client is None:
+            #http client that allows me to communicate with the network API using HTTP GET requests
+            import httpx
+            self._client = httpx.Client(verify=False)
+        return self._client
 
     # from the UniFi network API documentation, I need to have these custom headers that include the API key and say i want a json response
     # protected mehtod - i will only need this from within the class
@@ -23,6 +46,76 @@ class APIclient:
             'X-API-Key': self._apiKey
         }
     
+    # httpcore's trace extension, called as each request goes along. it is only used to keep hold of the socket of
+    # every connection the client opens, so _interrupt can cut off a request that is stuck waiting on one
+    # https://www.encode.io/httpcore/extensions/#trace
+    def _trace(self, event, info):
+        if event in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+            sock = info['return_value'].get_extra_info('socket')
+            if sock is not None:
+                with self._socketsLock:
+                    self._sockets.add(sock)
+                # the run may have been cancelled while this connection was being opened, after _interrupt had run
+                deadline = self._deadline
+                if deadline is not None and deadline.cancelled():
+                    self._interrupt()
+
+    # called by the run's cycleDeadline when it is cancelled while a request is going
+    # closing the client isn't enough, a thread blocked reading from a socket that is closed under it keeps waiting until
+    # its timeout, so every socket is shut down instead, which ends the read straight away
+    # the connections are no use after that, the client is dropped by _get once its request has ended
+    def _interrupt(self):
+        with self._socketsLock:
+            sockets = list(self._sockets)
+        for sock in sockets:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError: # already closed
+                pass
+
+    def _closeClient(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    # the run's cycleDeadline (services/deadline.py), each request is then given whatever time the run has left
+    # None goes back to every request getting API_REQUEST_TIMEOUT
+    def setDeadline(self, deadline):
+        self._deadline = deadline
+
+    # sends the GET request, returns (status code, body)
+    # with a deadline the timeout is what the run has left, and the body is read in chunks checking the deadline between
+    # them, as httpx's timeout is for each read rather than the whole response, so a console sending a response very
+    # slowly could otherwise keep going well past it. cancelling the run cuts the request off wherever it is (_interrupt)
+    # https://www.python-httpx.org/advanced/timeouts/
+    def _get(self, url, headers, endpoint):
+        deadline = self._deadline
+        extensions = {'trace': self._trace}
+        if deadline is None:
+            response = self._getClient().get(url, headers=headers, timeout=API_REQUEST_TIMEOUT, extensions=extensions)
+            return response.status_code, response.content
+        timeout = deadline.requestTimeout() # raises deadlineExceeded if there isn't time to send it
+        client = self._getClient()
+        removeCallback = deadline.onCancel(self._interrupt)
+        try:
+            with client.stream('GET', url, headers=headers, timeout=timeout, extensions=extensions) as response:
+                body = bytearray()
+                for chunk in response.iter_bytes():
+                    body += chunk
+                    deadline.check()
+                return response.status_code, bytes(body)
+        except deadlineExceeded:
+            raise
+        except Exception as error:
+            # a timeout because the run's time is up is the deadline's doing, not the console failing
+            if deadline.expired():
+                raise deadlineExceeded(f"Request to {endpoint} ran out of time: {error}") from error
+            raise
+        finally:
+            removeCallback()
+            if deadline.cancelled():
+                self._closeClient() # its connections were shut down by _interrupt, the next request starts afresh
+
     # i will use this method to make get requests for multiple endpoints
     # eg I will need to make requests for clients, access points, traffic samples, which can all reuse this core make request method
     # again, protected method, I will only need this from within the class
@@ -31,13 +124,32 @@ class APIclient:
         headers = self._getHeaders()
         # forms base url using endpoint passed in
         url = f"{self._baseURL}/{endpoint}"
-        response = self._client.get(url, headers=headers)
+        metrics = getMetrics()
+        profiler = getProfiler()
+        if metrics.enabled or profiler.recording:
+            # timing every request shows whether a slow fetch is down to the console or to the app
+            endpointName = _idPattern.sub('{id}', endpoint)
+            start = time.perf_counter()
+            status = 'error' # stays as error if the request itself fails, eg the console can't be reached
+            try:
+                statusCode, body = self._get(url, headers, endpoint)
+                status = statusCode
+            except deadlineExceeded:
+                status = 'deadline'
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                metrics.observe('openhaven_api_request_seconds', elapsed, endpoint=endpointName)
+                metrics.incrementCounter('openhaven_api_requests_total', endpoint=endpointName, status=status)
+                profiler.recordRequest(endpointName, elapsed, status)
+        else:
+            statusCode, body = self._get(url, headers, endpoint)
 
         # code 200 would mean it is successful, i can correctly return the response json
-        if response.status_code != 200:
+        if statusCode != 200:
             # when it is not 200, i raise an exception error to the parent method that calls this protected method.
-            raise Exception(f"Request to network api failed: {response.status_code}, {response.text}")
-        return response.json()
+            raise Exception(f"Request to network api failed: {statusCode}, {body.decode('utf-8', 'replace')}")
+        return json.loads(body)
 
     # fetching all of the required data as set out in the hierarchy chart in 2.5, and the flowcharts in 2.2.2
     # these are all public methods
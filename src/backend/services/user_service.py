@@ -1,19 +1,25 @@
 import sqlite3
 from src.backend.config import databaseFile
 
-from argon2 import PasswordHasher
+from .session_service import SessionService
 
 class UserService():
-    def __init__(self):
-        pass
+    def __init__(self, dbPath=databaseFile):
+        self._dbPath = dbPath
+        self._sessions = SessionService(dbPath=dbPath)
 
     def _dbConnection(self):
-        con = sqlite3.connect(databaseFile)
+        con = sqlite3.connect(self._dbPath)
         cur = con.cursor()
         return cur, con
     
+    # argon2 is only imported when a password is actually hashed or checked, it isn't needed to open the app
+    def _passwordHasher(self):
+        from argon2 import PasswordHasher
+        return PasswordHasher()
+
     def _hashPassword(self, password):
-        ph = PasswordHasher()
+        ph = self._passwordHasher()
         hashedPassword = ph.hash(password)
         return hashedPassword
     
@@ -81,7 +87,7 @@ class UserService():
         cur, con = self._dbConnection()
         try:
             cur.execute(
-                '''INSERT INTO tbl_Users (username, passwordHash, accessLevel) VALUES (?, ?, ?)''',
+                '''INSERT INTO tbl_Users (username, passwordHash, accountType) VALUES (?, ?, ?)''',
                 (username.lower(), hashedPassword, accessLevel)
             )
             con.commit()
@@ -103,7 +109,7 @@ class UserService():
         cur, con = self._dbConnection()
         try:
             result = cur.execute(
-                '''SELECT userId, username, passwordHash, accessLevel FROM tbl_Users WHERE LOWER(username) = LOWER(?)''',
+                '''SELECT userId, username, passwordHash, accountType FROM tbl_Users WHERE LOWER(username) = LOWER(?)''',
                 (username,)
             )
 
@@ -116,13 +122,14 @@ class UserService():
                 }
             
             db_userId, db_username, passwordHash, accessLevel = result
-            ph = PasswordHasher()
+            ph = self._passwordHasher()
             ph.verify(passwordHash, password)
             return {
                 "successful": True,
                 "message": f"Login successful, welcome {db_username}!",
                 "errors": [],
                 "data": {
+                    'userId': db_userId,
                     'username': db_username,
                     'accessLevel': accessLevel
                 }
@@ -136,11 +143,37 @@ class UserService():
         finally:
             con.close()
 
+    # checks the password once with argon2, then gives back a session token
+    # the frontend passes this token with every request instead of the password
+    def login(self, username, password):
+        result = self.authenticate(username, password)
+        if not result['successful']:
+            return result
+
+        user = result['data']
+        session = self._sessions.createSession(user['userId'], user['username'], user['accessLevel'])
+        if not session['successful']:
+            return session
+        return {
+            "successful": True,
+            "message": result['message'],
+            "errors": [],
+            "data": {
+                'username': user['username'],
+                'accessLevel': user['accessLevel'],
+                'token': session['data']['token'],
+                'expiresAt': session['data']['expiresAt']
+            }
+        }
+
+    def logout(self, token):
+        return self._sessions.revokeSession(token)
+
     def getUserByUsername(self, username):
         cur, con = self._dbConnection()
         try:
             result = cur.execute(
-                '''SELECT userId, username, accessLevel FROM tbl_Users WHERE LOWER(username) = LOWER(?)''',
+                '''SELECT userId, username, accountType FROM tbl_Users WHERE LOWER(username) = LOWER(?)''',
                 (username,)
             )
             result = result.fetchone()
@@ -174,7 +207,7 @@ class UserService():
         cur, con = self._dbConnection()
         try:
             result = cur.execute(
-                '''SELECT userId, username, accessLevel FROM tbl_Users ORDER BY dateCreated DESC'''
+                '''SELECT userId, username, accountType FROM tbl_Users ORDER BY userId DESC'''
             )
             result = result.fetchall()
             users = []
@@ -196,11 +229,18 @@ class UserService():
     def deleteUser(self, username):
         cur, con = self._dbConnection()
         try:
+            userId = cur.execute(
+                '''SELECT userId FROM tbl_Users WHERE username = ?''',
+                (username,)
+            )
+            userId = userId.fetchone()
             cur.execute(
                 '''DELETE FROM tbl_Users WHERE username = ?''',
                 (username,)
             )
             con.commit()
+            if userId:
+                self._sessions.revokeUserSessions(userId[0]) # a deleted user must not be able to keep using an old session
             return({
                 "successful": True,
                 "message": f"{username} was deleted successfully.",
@@ -239,6 +279,11 @@ class UserService():
             
         cur, con = self._dbConnection()
         try:
+            userId = cur.execute(
+                '''SELECT userId FROM tbl_Users WHERE LOWER(username) = LOWER(?)''',
+                (username,)
+            )
+            userId = userId.fetchone()[0]
             if newPassword:
                 hashedPassword = self._hashPassword(newPassword)
                 cur.execute(
@@ -251,6 +296,9 @@ class UserService():
                     (newUsername.lower(), username,)
                 )
             con.commit()
+            # sessions store the username and are tied to the old password, so they have to log in again
+            if newPassword or newUsername:
+                self._sessions.revokeUserSessions(userId)
             return {
                 "successful": True,
                 "message": "Successfully updated user.",
@@ -0,0 +1,270 @@
+import json
+import os
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from src.backend.config import databaseFile, SPOOL_SEGMENT_BYTES, SPOOL_SYNC_BYTES, SPOOL_RETRY_DELAY, SPOOL_RETRY_MAX_DELAY
+from .metrics import getMetrics
+from .sampleRuns import writeSampleRunRows
+
+# the tables rows can be spooled for, and the insert they are written back with
+# traffic samples are the only rows that can't be fetched again later, everything else is refreshed by the next collection
+spoolTables = {
+    'trafficSamples': '''INSERT INTO tbl_TrafficSamples (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated) VALUES (?, ?, ?, ?, ?, ?)'''
+}
+
+# an on-disk spool for rows that couldn't be written to the database, eg while it is locked by another program,
+# so they are kept until it can be written to again instead of being lost
+#
+# rows are appended to segment files in a folder next to the database (data/database.spool for data/database.db),
+# so a spool is only ever replayed into the database it was for. a segment is finished and a new one started once it
+# reaches SPOOL_SEGMENT_BYTES, and the segment names sort in the order they were started
+# each record in a segment is one line: the crc32 of the json, a space, then {"table": ..., "rows": [...]}
+# a line that was only partly written when the app stopped fails its crc and is left out, along with anything after it
+#
+# durability: every append is flushed to the OS straight away so a crash of the app loses nothing, but appends are only
+# fsynced (so they survive the computer losing power) when sync() is called at the end of each push, or once
+# SPOOL_SYNC_BYTES are waiting to be. one fsync per push instead of one per record
+#
+# replay() writes every segment back, oldest first, each one in a single transaction with executemany. the segment's name
+# goes into tbl_SpoolReplays in the same transaction, so a segment that was written but not yet deleted when the app
+# stopped is never written twice. after a write or replay fails the database isn't tried again for SPOOL_RETRY_DELAY,
+# doubling up to SPOOL_RETRY_MAX_DELAY, so a locked database isn't hit by a retry every collection
+#
+# it isn't thread safe, it is used from the thread running the collection like databaseService
+class writeSpool:
+    # clock is only passed in by tests that need to move time along themselves
+    def __init__(self, dbPath=databaseFile, segmentBytes=SPOOL_SEGMENT_BYTES, syncBytes=SPOOL_SYNC_BYTES, retryDelay=SPOOL_RETRY_DELAY, maxRetryDelay=SPOOL_RETRY_MAX_DELAY, clock=time.monotonic):
+        self._dbPath = dbPath
+        self._folder = Path(dbPath).with_suffix('.spool')
+        self._segmentBytes = segmentBytes
+        self._syncBytes = syncBytes
+        self._retryDelay = retryDelay
+        self._maxRetryDelay = maxRetryDelay
+        self._clock = clock
+        self._file = None # the segment being appended to
+        self._segmentSize = 0
+        self._unsynced = 0 # bytes appended since the last fsync
+        self._folderChanged = False # a segment was started or deleted since the last fsync of the folder
+        self._delay = retryDelay
+        self._nextAttempt = 0.0
+        segments = self._segments()
+        # segments left from before the app was last closed are replayed with the first push
+        self._pending = bool(segments)
+        self._lastNumber = int(segments[-1].stem) if segments else 0
+
+    def _dbConnection(self):
+        con = sqlite3.connect(self._dbPath)
+        cur = con.cursor()
+        return cur, con
+
+    def _segments(self):
+        if not self._folder.exists():
+            return []
+        return sorted(self._folder.glob('*.seg'))
+
+    # True while there are rows waiting to be written, anything pushed in the meantime has to go behind them
+    def hasPending(self):
+        return self._pending
+
+    # False while waiting after a failed replay
+    def replayDue(self):
+        return self._clock() >= self._nextAttempt
+
+    # adds a list of rows for one of the spoolTables, each row a tuple in the order of the table's insert
+    # returns the number of rows spooled
+    def append(self, table, rows):
+        if table not in spoolTables:
+            raise ValueError(f"Rows for {table} can't be spooled.")
+        rows = [list(row) for row in rows]
+        if not rows:
+            return 0
+        payload = json.dumps({'table': table, 'rows': rows}, separators=(',', ':')).encode()
+        line = b'%08x %s\n' % (zlib.crc32(payload), payload)
+        if self._file is None or self._segmentSize >= self._segmentBytes:
+            self._startSegment()
+        self._file.write(line)
+        self._file.flush()
+        self._segmentSize += len(line)
+        self._unsynced += len(line)
+        self._pending = True
+        if self._unsynced >= self._syncBytes:
+            self.sync()
+        getMetrics().incrementCounter('openhaven_spool_rows_total', len(rows), action='spooled')
+        return len(rows)
+
+    def _startSegment(self):
+        self._finishSegment()
+        self._folder.mkdir(parents=True, exist_ok=True)
+        # named after the time it was started, always after the last one even if the clock has gone backwards
+        self._lastNumber = max(time.time_ns(), self._lastNumber + 1)
+        self._file = open(self._folder / f"{self._lastNumber:020d}.seg", 'ab')
+        self._segmentSize = 0
+        self._folderChanged = True
+
+    # syncs and closes the segment being appended to, so no more rows go into it
+    def _finishSegment(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    # fsyncs everything appended so far
+    def sync(self):
+        if self._file is not None and self._unsynced:
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+        if self._folderChanged:
+            self._syncFolder()
+            self._folderChanged = False
+
+    # a new or deleted segment file is only durable once the folder itself is fsynced
+    # windows can't open a folder to fsync it, and doesn't need it
+    def _syncFolder(self):
+        try:
+            fd = os.open(self._folder, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def close(self):
+        self._finishSegment()
+
+    # reads the records of a segment, stopping at the first one that wasn't completely written
+    # returns the records and whether any of the segment had to be left out
+    def _readSegment(self, path):
+        records = []
+        with open(path, 'rb') as file:
+            for line in file:
+                checksum, _, payload = line.rstrip(b'\n').partition(b' ')
+                try:
+                    valid = line.endswith(b'\n') and int(checksum, 16) == zlib.crc32(payload)
+                except ValueError:
+                    valid = False
+                if not valid:
+                    return records, True
+                records.append(json.loads(payload))
+        return records, False
+
+    # writes the rows of one segment's records, inside the caller's transaction
+    # traffic samples are written as runs when sampleRuns is True, like databaseService writes them
+    # returns the number of rows written and the number left out
+    def _writeRecords(self, cur, records, sampleRuns=False):
+        written = 0
+        dropped = 0
+        for record in records:
+            sql = spoolTables.get(record['table'])
+            if sql is None:
+                dropped += len(record['rows'])
+                continue
+            if sampleRuns and record['table'] == 'trafficSamples':
+                write = lambda rows: writeSampleRunRows(cur, rows)
+            else:
+                write = lambda rows: cur.executemany(sql, rows)
+            # the savepoint is so the rows of a record that fails part way can be undone without the rest of the transaction
+            cur.execute('''SAVEPOINT spoolRecord''')
+            try:
+                write(record['rows'])
+                written += len(record['rows'])
+            except sqlite3.IntegrityError:
+                # a row the table won't accept would stop the spool from ever emptying, so the record is written again
+                # one row at a time and only the rows that fail are left out
+                # each row has its own savepoint, as writing a sample into a run deletes the run's old row before inserting it again
+                cur.execute('''ROLLBACK TO spoolRecord''')
+                for row in record['rows']:
+                    cur.execute('''SAVEPOINT spoolRow''')
+                    try:
+                        write([row])
+                        written += 1
+                    except sqlite3.IntegrityError:
+                        cur.execute('''ROLLBACK TO spoolRow''')
+                        dropped += 1
+                    cur.execute('''RELEASE spoolRow''')
+            cur.execute('''RELEASE spoolRecord''')
+        return written, dropped
+
+    # writes every spooled row to the database, oldest segment first, and deletes each segment once it is committed
+    # stops at the first segment that can't be written, and waits out the retry delay before the next attempt
+    # sampleRuns is passed on from databaseService, so spooled traffic samples are written the same way as the rest
+    def replay(self, sampleRuns=False):
+        self._finishSegment()
+        segments = self._segments()
+        metrics = getMetrics()
+        written = 0
+        dropped = 0
+        torn = 0 # records that were only partly written, their rows can't be counted
+        replayed = 0
+        try:
+            cur, con = self._dbConnection()
+        except sqlite3.Error as error:
+            return self._replayFailed(error, replayed, written)
+        try:
+            # the names of segments that have been deleted are no longer needed
+            placeholders = ', '.join('?' for _ in segments)
+            cur.execute('''DELETE FROM tbl_SpoolReplays WHERE segment NOT IN (%s)''' % placeholders, [path.name for path in segments])
+            con.commit()
+            for path in segments:
+                records, segmentTorn = self._readSegment(path)
+                try:
+                    cur.execute('''INSERT INTO tbl_SpoolReplays (segment) VALUES (?)''', (path.name,))
+                except sqlite3.IntegrityError:
+                    # it was written before the app stopped, only deleting it was left to do
+                    con.rollback()
+                else:
+                    segmentWritten, segmentDropped = self._writeRecords(cur, records, sampleRuns)
+                    con.commit()
+                    written += segmentWritten
+                    dropped += segmentDropped
+                    torn += int(segmentTorn)
+                path.unlink()
+                self._folderChanged = True
+                replayed += 1
+        except (sqlite3.Error, OSError) as error:
+            con.rollback()
+            return self._replayFailed(error, replayed, written)
+        finally:
+            con.close()
+            self.sync()
+            metrics.incrementCounter('openhaven_spool_rows_total', written, action='replayed')
+            metrics.incrementCounter('openhaven_spool_rows_total', dropped, action='dropped')
+
+        self._pending = False
+        self._delay = self._retryDelay
+        self._nextAttempt = 0.0
+        return {
+            "successful": True,
+            "message": f"{written} spooled rows written to the db." if replayed else "Nothing spooled to write to the db.",
+            "errors": [],
+            "data": {'segments': replayed, 'rows': written, 'dropped': dropped, 'tornRecords': torn}
+        }
+
+    # waits out the retry delay before the next replay, called when the database has just failed to be written to
+    def deferReplay(self):
+        self._nextAttempt = self._clock() + self._delay
+        self._delay = min(self._delay * 2, self._maxRetryDelay)
+
+    def _replayFailed(self, error, replayed, written):
+        getMetrics().incrementCounter('openhaven_spool_replay_failures_total')
+        self.deferReplay()
+        return {
+            "successful": False,
+            "message": "Error writing spooled rows to the db, they are kept in the spool to try again later.",
+            "errors": [str(error)],
+            "data": {'segments': replayed, 'rows': written}
+        }
+
+    # how much is waiting in the spool, for the dashboard
+    def getStatus(self):
+        segments = self._segments()
+        return {
+            'pending': self._pending,
+            'segments': len(segments),
+            'bytes': sum(path.stat().st_size for path in segments),
+            'retryIn': max(0.0, self._nextAttempt - self._clock())
+        }
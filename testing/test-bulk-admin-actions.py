@@ -0,0 +1,214 @@
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'scripts'))
+
+# tests the bulk admin actions (adminActions.bulkRestartAccessPoints and bulkToggleBroadcasting)
+# like test-dashboard-summary.py it doesn't need the console, a fake one is swapped in for adminActions' http client
+# it takes latency seconds to answer each request and restarts an AP like a real one does: still ONLINE for a moment,
+# then OFFLINE, then back ONLINE a few tenths of a second later (the real thing takes minutes, the poll interval and
+# grace are scaled down to match)
+#   waves      restarting in waves, no more than a wave's APs are ever down at once, every wave waits for the one before
+#              it, failed requests and unknown ids are reported, and there is one audit log per restarted AP
+#   timeout    one AP that never comes back, the waves after its one have to be called off
+#   broadcasts toggling then hiding every broadcast, with one broadcast whose request fails
+
+from init_db import init_db
+from src.backend.services.adminActions import adminActions
+
+aps = 40
+broadcasts = 12
+latency = 0.02
+waveFraction = 0.1
+concurrency = 8
+waveSize = max(1, math.ceil(aps * waveFraction))
+folder = tempfile.mkdtemp()
+
+class fakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data
+        self.text = json.dumps(data) if data is not None else "error"
+
+    def json(self):
+        return self._data
+
+# stands in for httpx.Client, keeps each AP's restart times so its state can be worked out whenever it's asked for
+class fakeConsole:
+    def __init__(self, deviceIds, broadcastIds, latency, seed=1, failing=(), neverBack=()):
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._latency = latency
+        self._restarts = {id: None for id in deviceIds} # deviceId -> (goesDownAt, backAt)
+        self._broadcasts = {id: False for id in broadcastIds}
+        self._failing = set(failing)
+        self._neverBack = set(neverBack)
+        self.inFlight = 0
+        self.maxInFlight = 0
+        self.maxDown = 0
+        self.restartOrder = []
+
+    def _state(self, id, now):
+        restart = self._restarts[id]
+        if restart is None or now < restart[0] or now >= restart[1]:
+            return "ONLINE"
+        return "OFFLINE"
+
+    def _down(self, now):
+        return sum(1 for id in self._restarts if self._state(id, now) != "ONLINE")
+
+    def request(self, method, url, headers=None, content=None):
+        with self._lock:
+            self.inFlight += 1
+            self.maxInFlight = max(self.maxInFlight, self.inFlight)
+        time.sleep(self._latency)
+        try:
+            parts = url.split('/')
+            if method == 'POST':
+                id = parts[-2]
+                if id in self._failing:
+                    return fakeResponse(500)
+                with self._lock:
+                    now = time.monotonic()
+                    goesDown = now + self._rng.uniform(0, 0.05)
+                    backAt = float('inf') if id in self._neverBack else goesDown + self._rng.uniform(0.1, 0.3)
+                    self._restarts[id] = (goesDown, backAt)
+                    self.restartOrder.append((id, now))
+                return fakeResponse(200, {})
+            id = parts[-1]
+            if id in self._failing:
+                return fakeResponse(500)
+            self._broadcasts[id] = json.loads(content)['hideName']
+            return fakeResponse(200, {})
+        finally:
+            with self._lock:
+                self.inFlight -= 1
+
+    # restartAccessPoint and toggleBroadcasting call these rather than request
+    def post(self, url, headers=None, content=None):
+        return self.request('POST', url, headers, content)
+
+    def put(self, url, headers=None, content=None):
+        return self.request('PUT', url, headers, content)
+
+    def get(self, url, headers=None):
+        time.sleep(self._latency)
+        now = time.monotonic()
+        with self._lock:
+            self.maxDown = max(self.maxDown, self._down(now))
+            return fakeResponse(200, {'data': [{'id': id, 'state': self._state(id, now)} for id in self._restarts]})
+
+    # tracks the most APs down at once between the test's checks too, not just when adminActions polls
+    def watch(self, stop):
+        while not stop.is_set():
+            with self._lock:
+                self.maxDown = max(self.maxDown, self._down(time.monotonic()))
+            time.sleep(0.005)
+
+def makeDatabase(folder, name, aps, broadcasts):
+    dbPath = os.path.join(folder, name)
+    init_db(dbPath)
+    con = sqlite3.connect(dbPath)
+    deviceIds = [f'test-ap-{i:03d}' for i in range(aps)]
+    broadcastIds = [f'test-broadcast-{i}' for i in range(broadcasts)]
+    con.executemany(
+        '''INSERT INTO tbl_APdevices (accessPointId, hostname, apState, ipAddress, macAddress) VALUES (?, ?, 'ONLINE', ?, ?)''',
+        [(id, f'AP-{i:03d}', f'10.0.0.{i % 250}', f'aa:bb:cc:00:{i // 256:02x}:{i % 256:02x}') for i, id in enumerate(deviceIds)]
+    )
+    con.executemany(
+        '''INSERT INTO tbl_WifiBroadcasts (broadcastId, ssid, hideName) VALUES (?, ?, 0)''',
+        [(id, f'Test {i}') for i, id in enumerate(broadcastIds)]
+    )
+    con.commit()
+    con.close()
+    return dbPath, deviceIds, broadcastIds
+
+def auditCount(dbPath, eventType):
+    con = sqlite3.connect(dbPath)
+    try:
+        return con.execute('''SELECT COUNT(*) FROM tbl_AuditLogs WHERE eventType = ?''', (eventType,)).fetchone()[0]
+    finally:
+        con.close()
+
+def makeActions(dbPath, console):
+    actions = adminActions('console.invalid', 'test-key', 'test-site', dbPath=dbPath)
+    actions._client = console
+    return actions
+
+# bulk: every AP in one wave with no waiting, the requests sent concurrency at a time
+dbPath, deviceIds, broadcastIds = makeDatabase(folder, 'bulk.db', aps, broadcasts)
+console = fakeConsole(deviceIds, broadcastIds, latency)
+actions = makeActions(dbPath, console)
+result = actions.bulkRestartAccessPoints(deviceIds, waveFraction=1, concurrency=concurrency, waitOnline=False)
+assert result['successful'], result['errors']
+assert console.maxInFlight <= concurrency
+assert auditCount(dbPath, 9) == aps
+print(f"ok: {aps} APs restarted in one wave, at most {console.maxInFlight} requests at a time")
+
+# waves: waiting for each wave to be back ONLINE, with two APs whose restart request fails and an unknown id
+dbPath, deviceIds, broadcastIds = makeDatabase(folder, 'waves.db', aps, broadcasts)
+failing = deviceIds[3:5]
+console = fakeConsole(deviceIds, broadcastIds, latency, failing=failing)
+actions = makeActions(dbPath, console)
+stop = threading.Event()
+watcher = threading.Thread(target=console.watch, args=(stop,), daemon=True)
+watcher.start()
+result = actions.bulkRestartAccessPoints(
+    deviceIds + ['test-ap-missing', deviceIds[0]], waveFraction=waveFraction, concurrency=concurrency,
+    onlineTimeout=10, pollInterval=0.05, restartGrace=1
+)
+stop.set()
+watcher.join()
+items = {item['id']: item for item in result['data']['items']}
+assert len(items) == aps + 1 # the repeated id is only restarted once
+assert items['test-ap-missing']['status'] == 'notFound'
+assert all(items[id]['status'] == 'failed' for id in failing)
+assert all(items[id]['status'] == 'restarted' for id in deviceIds if id not in failing), result['data']['counts']
+assert console.maxDown <= waveSize, f"{console.maxDown} APs were down at once with waves of {waveSize}"
+assert auditCount(dbPath, 9) == aps - len(failing)
+# every AP in a wave is restarted after every AP in the wave before it is back
+waveOf = {id: items[id]['wave'] for id in deviceIds}
+restartedAt = {id: at for id, at in console.restartOrder}
+backAt = {id: console._restarts[id][1] for id in restartedAt}
+for id, at in restartedAt.items():
+    earlier = [backAt[other] for other in restartedAt if waveOf[other] == waveOf[id] - 1]
+    assert all(at >= back for back in earlier), f"{id} was restarted before wave {waveOf[id] - 1} was back"
+print(f"ok: {aps} APs restarted in {max(waveOf.values())} waves, at most {console.maxDown} down at once, "
+      f"{len(failing)} failed requests and an unknown id reported")
+
+# timeout: an AP in the third wave never comes back, so the rest are called off
+dbPath, deviceIds, broadcastIds = makeDatabase(folder, 'timeout.db', aps, broadcasts)
+console = fakeConsole(deviceIds, broadcastIds, latency, neverBack=[deviceIds[waveSize * 2]])
+actions = makeActions(dbPath, console)
+result = actions.bulkRestartAccessPoints(deviceIds, waveFraction=waveFraction, concurrency=concurrency, onlineTimeout=1, pollInterval=0.05, restartGrace=1)
+counts = result['data']['counts']
+assert not result['successful']
+assert counts.get('timedOut') == 1 and counts.get('restarted') == waveSize * 3 - 1, counts
+assert counts.get('skipped') == aps - waveSize * 3, counts
+assert len(console.restartOrder) == waveSize * 3
+print(f"ok: {result['message']}")
+
+# broadcasts: toggle them all (one failing), then hide them all
+dbPath, deviceIds, broadcastIds = makeDatabase(folder, 'broadcasts.db', aps, broadcasts)
+console = fakeConsole(deviceIds, broadcastIds, latency, failing=broadcastIds[:1])
+actions = makeActions(dbPath, console)
+result = actions.bulkToggleBroadcasting(broadcastIds, concurrency=concurrency)
+assert result['data']['counts'] == {'failed': 1, 'updated': broadcasts - 1}, result['data']['counts']
+result = actions.bulkToggleBroadcasting(broadcastIds, hideName=True, concurrency=concurrency)
+assert result['data']['counts'] == {'failed': 1, 'unchanged': broadcasts - 1}, result['data']['counts']
+con = sqlite3.connect(dbPath)
+hidden = con.execute('''SELECT COUNT(*) FROM tbl_WifiBroadcasts WHERE hideName = 1''').fetchone()[0]
+con.close()
+assert hidden == broadcasts - 1 and auditCount(dbPath, 10) == broadcasts - 1
+print(f"ok: {broadcasts - 1} broadcasts hidden with one audit log each, the failed one left as it was")
+
+print("The bulk admin actions restarted in waves, called off the rest on a timeout and reported every failure.")
@@ -0,0 +1,108 @@
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'scripts'))
+
+# tests that the triggers keeping tbl_DashboardSummary up to date match the tables after every kind of change to them
+# unlike the other tests in this folder it doesn't need the console, it makes its own database in a temporary folder
+# after each change dashboardSummary.verify() works every count out from scratch (vw_DashboardSummary) and compares
+# them with the row the triggers keep, so a trigger that misses a change fails the step it was missed in
+
+from init_db import init_db
+from src.backend.services.dashboardSummary import dashboardSummary
+
+dbPath = os.path.join(tempfile.mkdtemp(), 'summary.db')
+init_db(dbPath)
+summary = dashboardSummary(dbPath=dbPath)
+
+# the same upserts the database service uses for access points and broadcasts, both the insert and the update side of them
+upsertAP = '''INSERT INTO tbl_APdevices (accessPointId, hostname, apState, ipAddress, macAddress) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(accessPointId) DO UPDATE SET hostname=excluded.hostname, ipAddress=excluded.ipAddress, macAddress=excluded.macAddress, apState=excluded.apState'''
+upsertClient = '''INSERT INTO tbl_Clients (clientId, hostname, ipAddress, macAddress, active) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(clientId) DO UPDATE SET hostname=excluded.hostname, ipAddress=excluded.ipAddress, macAddress=excluded.macAddress, active=excluded.active'''
+upsertBroadcast = '''INSERT INTO tbl_WifiBroadcasts (broadcastId, ssid, active, hideName) VALUES (?, ?, ?, ?)
+    ON CONFLICT(broadcastId) DO UPDATE SET ssid=excluded.ssid, active=excluded.active, hideName=excluded.hideName'''
+addSample = '''INSERT INTO tbl_TrafficSamples (accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount)
+    VALUES (?, 100, 1.5, 1000, 2000, ?, ?, ?)'''
+
+# each step is (what it does, [(sql, parameters), ...]), run in its own transaction
+steps = [
+    ('add access points', [
+        (upsertAP, ('ap-1', 'AP-1', 'ONLINE', '10.0.0.1', 'aa:00:00:00:00:01')),
+        (upsertAP, ('ap-2', 'AP-2', 'OFFLINE', '10.0.0.2', 'aa:00:00:00:00:02')),
+        (upsertAP, ('ap-3', 'AP-3', 'UPDATING', '10.0.0.3', 'aa:00:00:00:00:03')),
+    ]),
+    ('upsert an access point that changed state', [(upsertAP, ('ap-2', 'AP-2', 'GETTING_READY', '10.0.0.2', 'aa:00:00:00:00:02'))]),
+    ('upsert an access point that did not change', [(upsertAP, ('ap-1', 'AP-1 renamed', 'ONLINE', '10.0.0.1', 'aa:00:00:00:00:01'))]),
+    ('set an access point state to NULL', [('''UPDATE tbl_APdevices SET apState = NULL WHERE accessPointId = 'ap-3' ''', ())]),
+    ('set it back', [('''UPDATE tbl_APdevices SET apState = 'CONNECTION_INTERRUPTED' WHERE accessPointId = 'ap-3' ''', ())]),
+    ('add clients', [
+        (upsertClient, ('client-1', 'laptop', '10.0.1.1', 'bb:00:00:00:00:01', 1)),
+        (upsertClient, ('client-2', 'phone', '10.0.1.2', 'bb:00:00:00:00:02', 1)),
+        (upsertClient, ('client-3', 'printer', '10.0.1.3', 'bb:00:00:00:00:03', 0)),
+    ]),
+    ('upsert a client that went inactive', [(upsertClient, ('client-2', 'phone', '10.0.1.2', 'bb:00:00:00:00:02', 0))]),
+    ('mark every client active', [('''UPDATE tbl_Clients SET active = 1''', ())]),
+    ('add connections', [
+        ('''INSERT OR IGNORE INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''', ('client-1', 'ap-1')),
+        ('''INSERT OR IGNORE INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''', ('client-2', 'ap-1')),
+        ('''INSERT OR IGNORE INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''', ('client-3', 'ap-2')),
+        ('''INSERT OR IGNORE INTO tbl_Connections (clientId, accessPointId) VALUES (?, ?)''', ('client-1', 'ap-1')), # already there
+    ]),
+    ('move a connection to another access point', [('''UPDATE tbl_Connections SET accessPointId = 'ap-3' WHERE clientId = 'client-2' ''', ())]),
+    ('delete a connection', [('''DELETE FROM tbl_Connections WHERE clientId = 'client-3' ''', ())]),
+    ('add broadcasts', [
+        (upsertBroadcast, ('broadcast-1', 'Staff', 1, 0)),
+        (upsertBroadcast, ('broadcast-2', 'Guests', 1, 1)),
+        (upsertBroadcast, ('broadcast-3', 'Old', 0, 0)),
+    ]),
+    ('upsert a broadcast that was hidden and disabled', [(upsertBroadcast, ('broadcast-1', 'Staff', 0, 1))]),
+    ('toggle every broadcast', [('''UPDATE tbl_WifiBroadcasts SET hideName = NOT hideName, active = NOT active''', ())]),
+    ('delete a broadcast', [('''DELETE FROM tbl_WifiBroadcasts WHERE broadcastId = 'broadcast-2' ''', ())]),
+    ('add traffic samples', [
+        (addSample, ('ap-1', '2026-01-01 10:00:00', None, 1)),
+        (addSample, ('ap-2', '2026-01-01 10:00:00', '2026-01-01 10:05:00', 6)),
+        (addSample, ('ap-1', '2026-01-01 10:01:00', None, 1)),
+    ]),
+    ('add a sample older than the latest one', [(addSample, ('ap-3', '2025-12-31 09:00:00', None, 1))]),
+    ('grow a sample run', [('''UPDATE tbl_TrafficSamples SET endDate = '2026-01-01 10:30:00', sampleCount = 31 WHERE accessPointId = 'ap-2' ''', ())]),
+    ('shrink it again (a run written again)', [('''UPDATE tbl_TrafficSamples SET endDate = '2026-01-01 10:00:30', sampleCount = 2 WHERE accessPointId = 'ap-2' ''', ())]),
+    ('delete the latest sample', [('''DELETE FROM tbl_TrafficSamples WHERE sampleId = (SELECT sampleId FROM tbl_TrafficSamples ORDER BY coalesce(endDate, dateCreated) DESC LIMIT 1)''', ())]),
+    ('delete a sample that is not the latest', [('''DELETE FROM tbl_TrafficSamples WHERE dateCreated < '2026-01-01' ''', ())]),
+    ('delete a client, with its connection going with it', [
+        ('''PRAGMA foreign_keys = ON''', ()),
+        ('''DELETE FROM tbl_Clients WHERE clientId = 'client-1' ''', ()),
+    ]),
+    ('delete an access point, with its connections and samples going with it', [
+        ('''PRAGMA foreign_keys = ON''', ()),
+        ('''DELETE FROM tbl_APdevices WHERE accessPointId = 'ap-1' ''', ()),
+    ]),
+    ('delete every sample', [('''DELETE FROM tbl_TrafficSamples''', ())]),
+    ('delete everything else', [
+        ('''DELETE FROM tbl_Connections''', ()),
+        ('''DELETE FROM tbl_Clients''', ()),
+        ('''DELETE FROM tbl_APdevices''', ()),
+        ('''DELETE FROM tbl_WifiBroadcasts''', ()),
+    ]),
+]
+
+result = summary.verify()
+assert result['successful'], f"the new database: {result['errors']}"
+for name, statements in steps:
+    # a new connection for each step, as PRAGMA foreign_keys only lasts as long as the connection it was set on
+    con = sqlite3.connect(dbPath)
+    try:
+        for sql, parameters in statements:
+            con.execute(sql, parameters)
+        con.commit()
+    finally:
+        con.close()
+    result = summary.verify()
+    assert result['successful'], f"{name}: {result['errors']}"
+    print(f"ok: {name}")
+
+print(f"The dashboard summary matched the tables after all {len(steps)} changes.")
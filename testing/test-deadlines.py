@@ -0,0 +1,292 @@
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'scripts'))
+
+# tests the collection deadlines (src/backend/services/deadline.py) against a local http server standing in for the
+# console, serving the benchmarks' synthetic network through the real APIclient, httpx and databaseService
+# like test-dashboard-summary.py it doesn't need the console, and it makes its own databases in a temporary folder
+# the server can make one endpoint misbehave:
+#   hang   the request gets no answer for stall seconds (httpx's read timeout is what ends it)
+#   drip   the answer comes a byte at a time for stall seconds, each byte in time for httpx's read timeout
+# for each misbehaving endpoint a cycle with a budget second deadline has to:
+#   end within its budget (plus a request's last read), instead of the stall holding it up
+#   write everything fetched before the stall, with the rest marked incomplete in the result and tbl_CollectionRuns
+#   be followed by a complete cycle once the console is behaving again
+# then it checks cancelling a cycle, the pipelined collection, the watchdog catching a run stuck past its deadline,
+# and collectionScheduler.stop() cutting a stuck run short
+# it takes about half a minute, most of it waiting out the stalls
+
+from init_db import init_db
+from benchmarks.generators import syntheticAPI
+from src.backend.config import API_REQUEST_TIMEOUT
+from src.backend.services.unifi_api import APIclient
+from src.backend.services.collectData import collectData
+from src.backend.services.database import databaseService
+from src.backend.services.deadline import cycleDeadline, cycleWatchdog
+from src.backend.services.collectionScheduler import collectionScheduler
+
+aps = 20
+clients = 200
+budget = 3
+stall = 20
+
+# serves the synthetic api's data at the same endpoints as the console, misbehaving on the `stalled` path if there is one
+class consoleServer:
+    def __init__(self, api):
+        self.api = api
+        self.stalled = None # (path, 'hang' or 'drip', seconds)
+        self.release = threading.Event() # set to end any stalls still going
+        server = self
+
+        class handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                path = self.path.split('/sites/test/', 1)[1]
+                body = json.dumps(server.respond(path)).encode()
+                stall = server.stalled
+                if stall and stall[0] == path and stall[1] == 'hang':
+                    server.release.wait(stall[2])
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    if stall and stall[0] == path and stall[1] == 'drip':
+                        # a byte every 0.2s, until the stall time is up
+                        stallEnd = time.monotonic() + stall[2]
+                        for i in range(len(body)):
+                            if time.monotonic() >= stallEnd or server.release.is_set():
+                                self.wfile.write(body[i:])
+                                break
+                            self.wfile.write(body[i:i + 1])
+                            self.wfile.flush()
+                            time.sleep(0.2)
+                    else:
+                        self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError): # the client gave up on it
+                    pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def respond(self, path):
+        parts = path.split('/')
+        if path == 'devices':
+            return {'data': self.api.fetchAccessPoints()}
+        if parts[0] == 'devices':
+            return self.api.fetchTrafficSample(parts[1])
+        if path == 'clients':
+            return {'data': self.api.fetchClients()}
+        if parts[0] == 'clients':
+            return self.api.fetchTopology(parts[1])
+        if path == 'wifi/broadcasts':
+            return {'data': self.api.fetchWifiBroadcasts()}
+        return self.api.fetchBroadcastDetails(parts[2])
+
+    def close(self):
+        self.release.set()
+        self._server.shutdown()
+
+def makeService(server, dbPath, pipelineBatchSize=None):
+    api = APIclient(consoleIp='127.0.0.1', apiKey='test-key', siteId='test')
+    api._baseURL = f"http://127.0.0.1:{server.port}/sites/test"
+    return databaseService(collectData(api), dbPath=dbPath, pipelineBatchSize=pipelineBatchSize)
+
+def counts(dbPath):
+    con = sqlite3.connect(dbPath)
+    try:
+        return {
+            'aps': con.execute('''SELECT COUNT(*) FROM tbl_APdevices''').fetchone()[0],
+            'samples': con.execute('''SELECT COUNT(*) FROM tbl_TrafficSamples''').fetchone()[0],
+            'clients': con.execute('''SELECT COUNT(*) FROM tbl_Clients''').fetchone()[0],
+            'connections': con.execute('''SELECT COUNT(*) FROM tbl_Connections''').fetchone()[0],
+            'broadcasts': con.execute('''SELECT COUNT(*) FROM tbl_WifiBroadcasts''').fetchone()[0]
+        }
+    finally:
+        con.close()
+
+def lastRun(dbPath):
+    con = sqlite3.connect(dbPath)
+    try:
+        return con.execute('''SELECT job, complete, incomplete FROM tbl_CollectionRuns ORDER BY runId DESC LIMIT 1''').fetchone()
+    finally:
+        con.close()
+
+# one cycle on a fresh database, with the server stalling on `stall`, returns (seconds, result, counts)
+def runScenario(server, folder, name, stall, budget, pipelineBatchSize=None):
+    dbPath = os.path.join(folder, f'{name}.db')
+    init_db(dbPath)
+    service = makeService(server, dbPath, pipelineBatchSize)
+    server.stalled = stall
+    server.release.clear()
+    start = time.perf_counter()
+    result = service.runCycle(deadline=cycleDeadline(budget, name='cycle') if budget else None)
+    seconds = time.perf_counter() - start
+    server.release.set() # lets any stalled response go before the next scenario
+    server.stalled = None
+    written = counts(dbPath)
+    run = lastRun(dbPath) if budget else None
+    # the console behaving again, the next cycle gets everything
+    if budget:
+        again = service.runCycle(deadline=cycleDeadline(budget * 10, name='cycle'))
+        assert again['successful'] and again['data']['deadline']['complete'], again['errors']
+    return seconds, result, written, run
+
+def checkWatchdog():
+    reports = []
+    watchdog = cycleWatchdog(grace=0.2, interval=0.05, onOverrun=reports.append)
+    watchdog.start()
+
+    def stuckRequest(deadline):
+        watchdog.watch(deadline)
+        time.sleep(1.0) # ignores the deadline, like a call that never checks it
+        watchdog.finished(deadline)
+
+    stuck = cycleDeadline(0.1, name='stuck')
+    stuckRequest(stuck)
+    late = cycleDeadline(0.1, name='late')
+    watchdog.watch(late)
+    time.sleep(0.2) # past its deadline, but finished within the grace
+    watchdog.finished(late)
+    watchdog.stop()
+    assert [report['job'] for report in reports] == ['stuck', 'late'], reports
+    assert reports[0]['stillRunning'] and any('stuckRequest' in call for call in reports[0]['where']), reports[0]
+    assert stuck.cancelled() and not reports[1]['stillRunning']
+    print(f"ok: the watchdog reported a stuck run in {reports[0]['where'][0]} and one that finished late")
+
+api = syntheticAPI(aps, clients)
+server = consoleServer(api)
+folder = tempfile.mkdtemp()
+try:
+    hungClient = api.fetchClients()[len(api.fetchClients()) // 2]['id']
+    drippingAP = api.aps[len(api.aps) // 2]['id']
+    scenarios = [
+        ('behaving', None),
+        ('topology hangs', (f'clients/{hungClient}', 'hang', stall)),
+        ('sample drips', (f'devices/{drippingAP}/statistics/latest', 'drip', stall)),
+        ('client list hangs', ('clients', 'hang', stall)),
+    ]
+    for name, stalled in scenarios:
+        seconds, result, written, run = runScenario(server, folder, name.replace(' ', '-'), stalled, budget)
+        summary = result['data']['deadline']
+        # a request's timeout never goes past the deadline, but its last read can finish just after it
+        assert seconds < budget + 0.5, f"{name}: the cycle took {seconds:.2f}s with a {budget}s budget"
+        job, complete, incomplete = run
+        if stalled is None:
+            assert result['successful'] and summary['complete'] and complete == 1, result['errors']
+            print(f"ok: {name}, the cycle was complete in {seconds:.2f}s")
+            continue
+        assert not result['successful'] and not summary['complete'] and complete == 0 and incomplete, result
+        assert written['aps'] == aps # the AP list comes before any of the stalls
+        if name == 'topology hangs':
+            assert summary['incomplete'] == ['connections'], summary
+            assert written['clients'] == len(api.fetchClients()) and 0 < written['connections'] < written['clients']
+        elif name == 'sample drips':
+            assert 'trafficSamples' in summary['incomplete'] and 0 < written['samples'] < aps, (summary, written)
+        else:
+            assert summary['incomplete'] == ['clients', 'connections', 'inactiveClients'], summary
+            assert written['samples'] == aps and written['clients'] == 0
+        print(f"ok: {name}, the cycle stopped at {seconds:.2f}s with {', '.join(summary['incomplete'])} incomplete")
+
+    # collectTopology on its own, before any samples run has left the AP data behind, so it fetches the AP list itself
+    dbPath = os.path.join(folder, 'topology.db')
+    init_db(dbPath)
+    service = makeService(server, dbPath)
+    server.stalled = ('devices', 'hang', stall)
+    server.release.clear()
+    start = time.perf_counter()
+    result = service.collectTopology(deadline=cycleDeadline(budget, name='topology'))
+    seconds = time.perf_counter() - start
+    server.release.set()
+    server.stalled = None
+    assert seconds < budget + 0.5 and 'accessPoints' in result['data']['deadline']['incomplete'], (seconds, result['data']['deadline'])
+    assert counts(dbPath)['samples'] == 0 # the topology job never writes samples
+    print(f"ok: topology, the hung AP list cut the run short at {seconds:.2f}s with {', '.join(result['data']['deadline']['incomplete'])} incomplete")
+
+    # the pipelined collection with the hanging topology request, batches fetched in time are written
+    # (the broadcasts come after the clients in a pipelined cycle, so there's no time left for them either)
+    seconds, result, written, run = runScenario(server, folder, 'pipelined', (f'clients/{hungClient}', 'hang', stall), budget, pipelineBatchSize=50)
+    assert seconds < budget + 0.5 and result['data']['deadline']['incomplete'] == ['connections', 'wifiBroadcasts'], (seconds, result['data']['deadline'])
+    assert written['clients'] > 0 and 0 < written['connections'] < written['clients'], written
+    print(f"ok: pipelined, the hung topology request cut the cycle short at {seconds:.2f}s, {written['connections']} connections written")
+
+    # cancelling a cycle with no time limit while a request hangs, from another thread
+    dbPath = os.path.join(folder, 'cancelled.db')
+    init_db(dbPath)
+    service = makeService(server, dbPath)
+    server.stalled = ('clients', 'hang', stall)
+    server.release.clear()
+    deadline = cycleDeadline(None, name='cycle')
+    threading.Timer(0.5, deadline.cancel).start()
+    start = time.perf_counter()
+    result = service.runCycle(deadline=deadline)
+    seconds = time.perf_counter() - start
+    server.release.set()
+    server.stalled = None
+    assert result['data']['deadline']['cancelled'] and 'clients' in result['data']['deadline']['incomplete'], result['data']['deadline']
+    # the cancel cuts off the request that is waiting, rather than it running to its timeout
+    assert seconds < 1.5, seconds
+    print(f"ok: a cancelled cycle stopped after {seconds:.2f}s: {result['message']}")
+
+    checkWatchdog()
+
+    # the scheduler gives each run a deadline, and stop() cancels the one that is going
+    dbPath = os.path.join(folder, 'scheduler.db')
+    init_db(dbPath)
+    service = makeService(server, dbPath)
+    reports = []
+    scheduler = collectionScheduler(service, cadences={'samples': 1.0}, jitter=0, budgetFraction=0.8, onOverrun=reports.append)
+    server.stalled = (f'devices/{drippingAP}/statistics/latest', 'drip', stall)
+    server.release.clear()
+    scheduler.start()
+    time.sleep(2.5)
+    start = time.perf_counter()
+    assert scheduler.stop(timeout=API_REQUEST_TIMEOUT + 1)
+    stopSec = time.perf_counter() - start
+    server.release.set()
+    server.stalled = None
+    status = scheduler.getStatus()['samples']
+    assert status['budget'] == 0.8 and 'trafficSamples' in status['lastIncomplete'], status
+    con = sqlite3.connect(dbPath)
+    runs = con.execute('''SELECT COUNT(*), SUM(complete) FROM tbl_CollectionRuns WHERE job = 'samples' ''').fetchone()
+    con.close()
+    assert runs[0] == status['runs'] and runs[1] == 0, runs
+    print(f"ok: the scheduler's {status['runs']} samples runs were cut short at their 0.8s deadline, "
+          f"stop() took {stopSec:.2f}s, {len(reports)} watchdog reports")
+
+    # stop() while a run with plenty of its budget left is waiting on a request that gets no answer
+    dbPath = os.path.join(folder, 'stopping.db')
+    init_db(dbPath)
+    service = makeService(server, dbPath)
+    scheduler = collectionScheduler(service, cadences={'topology': 60.0}, jitter=0, budgetFraction=0.8)
+    server.stalled = ('clients', 'hang', stall)
+    server.release.clear()
+    scheduler.start()
+    time.sleep(1)
+    start = time.perf_counter()
+    assert scheduler.stop(timeout=API_REQUEST_TIMEOUT + 1)
+    stopSec = time.perf_counter() - start
+    server.release.set()
+    server.stalled = None
+    assert stopSec < 1, stopSec
+    assert 'clients' in scheduler.getStatus()['topology']['lastIncomplete'], scheduler.getStatus()['topology']
+    print(f"ok: stop() cut off the hung request of a run with {60 * 0.8 - 1:.0f}s of its budget left in {stopSec:.2f}s")
+finally:
+    server.close()
+    shutil.rmtree(folder, ignore_errors=True)
+
+print("Collection runs kept to their deadlines, and were cut short when cancelled or stopped.")
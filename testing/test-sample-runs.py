@@ -0,0 +1,97 @@
+import os
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+sys.path.insert(0, str(project_root / 'scripts'))
+
+# tests storing unchanged traffic samples as runs (src/backend/services/sampleRuns.py)
+# like test-dashboard-summary.py it doesn't need the console, it makes its own databases in a temporary folder
+# an offline AP and an idle AP should each end up as one run, a busy AP as a row per sample, and reading the rows back
+# with expandSamples() should give every sample at the time it was taken. then the same samples go through the write
+# spool, which should write them as runs too when replay() is given sampleRuns=True
+
+from init_db import init_db
+from src.backend.models.models import trafficSample
+from src.backend.services.sampleRuns import writeSampleRuns, expandSamples, _toText
+from src.backend.services.writeSpool import writeSpool
+
+folder = tempfile.mkdtemp()
+cycles = 20
+interval = 30
+start = 1767261600 # 2026-01-01 10:00:00 UTC
+
+# the samples of one collection, the busy AP's rates change a lot every time
+def makeSamples(cycle):
+    return [
+        trafficSample('ap-offline', 0, 0.0, 0, 0),
+        trafficSample('ap-idle', 1000 + cycle * interval, 0.5, 2000 + (cycle % 3) * 100, 3000),
+        trafficSample('ap-busy', 1000 + cycle * interval, 2.0, 10**6 * (cycle + 1), 10**6),
+    ]
+
+# each collection starts a couple of seconds after its slot, like the collection scheduler's jitter
+def collectedAt(cycle):
+    return start + cycle * interval + cycle % 3
+
+def readRows(dbPath):
+    con = sqlite3.connect(dbPath)
+    try:
+        return con.execute(
+            '''SELECT sampleId, accessPointId, uptimeSec, txRetriesPct, txRateBps, rxRateBps, dateCreated, endDate, sampleCount
+            FROM tbl_TrafficSamples ORDER BY sampleId'''
+        ).fetchall()
+    finally:
+        con.close()
+
+def checkRuns(dbPath):
+    rows = readRows(dbPath)
+    rowsPerAP = {}
+    for row in rows:
+        rowsPerAP.setdefault(row[1], []).append(row)
+    assert len(rowsPerAP['ap-offline']) == 1 and rowsPerAP['ap-offline'][0][8] == cycles, rowsPerAP['ap-offline']
+    assert len(rowsPerAP['ap-idle']) == 1 and rowsPerAP['ap-idle'][0][8] == cycles, rowsPerAP['ap-idle']
+    assert len(rowsPerAP['ap-busy']) == cycles, f"{len(rowsPerAP['ap-busy'])} rows for the busy AP"
+    print(f"ok: {cycles * 3} samples stored as {len(rows)} rows")
+
+    # every sample comes back, on its slot, and the idle AP's uptime still counts up to its latest one
+    samples = expandSamples(rows)
+    assert len(samples) == cycles * 3, f"{len(samples)} samples read back"
+    for accessPointId in ('ap-offline', 'ap-idle'):
+        dates = [sample[6] for sample in samples if sample[1] == accessPointId]
+        assert dates == [_toText(start + cycle * interval) for cycle in range(cycles)], dates
+    uptimes = [sample[2] for sample in samples if sample[1] == 'ap-idle']
+    assert uptimes == [1000 + cycle * interval for cycle in range(cycles)], uptimes
+    assert all(sample[2] == 0 for sample in samples if sample[1] == 'ap-offline')
+    print("ok: expandSamples gave back every sample")
+
+# written straight away by writeSampleRuns, one commit per collection like the collector
+dbPath = os.path.join(folder, 'runs.db')
+init_db(dbPath)
+con = sqlite3.connect(dbPath)
+for cycle in range(cycles):
+    writeSampleRuns(con.cursor(), makeSamples(cycle), now=collectedAt(cycle))
+    con.commit()
+con.close()
+checkRuns(dbPath)
+
+# the same samples spooled with the time they were collected, then replayed as runs
+# one of the spooled rows has no uptime, which the table won't accept, so only that row should be left out
+dbPath = os.path.join(folder, 'spool.db')
+init_db(dbPath)
+spool = writeSpool(dbPath=dbPath)
+for cycle in range(cycles):
+    rows = [sample + (_toText(collectedAt(cycle)),) for sample in makeSamples(cycle)]
+    if cycle == cycles // 2:
+        rows.append(('ap-broken', None, 0.0, 0, 0, _toText(collectedAt(cycle))))
+    spool.append('trafficSamples', rows)
+result = spool.replay(sampleRuns=True)
+assert result['successful'], result['errors']
+assert result['data']['rows'] == cycles * 3 and result['data']['dropped'] == 1, result['data']
+assert not spool.hasPending()
+spool.close()
+print(f"ok: the spool replayed {result['data']['rows']} samples and left out the broken one")
+checkRuns(dbPath)
+
+print("Unchanged traffic samples were stored as runs and read back as every sample.")